@@ -0,0 +1,70 @@
+import os
+import asyncio
+import logging
+import threading
+from typing import Any, Coroutine, Optional
+import httpx
+from dotenv import load_dotenv
+from mistralai import Mistral
+from utils import configure_logging
+
+# Set up logging configuration
+configure_logging()
+
+# read .env once per process instead of on every request
+load_dotenv()
+
+# Client settings (overridable through the environment)
+MISTRAL_SERVER_URL = os.getenv("MISTRAL_SERVER_URL") or None  # point at a local stand-in server for testing
+AI_HTTP_TIMEOUT = float(os.getenv("AI_HTTP_TIMEOUT", 60))  # seconds per LLM HTTP request
+AI_MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS", 20))  # open connections to the provider
+AI_KEEPALIVE_CONNECTIONS = int(os.getenv("AI_KEEPALIVE_CONNECTIONS", 10))  # idle connections kept warm
+
+_client: Optional[Mistral] = None
+_client_lock = threading.Lock()
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_client() -> Mistral:
+    """
+    Return the process-wide Mistral client. Its sync and async HTTP clients keep connections
+    alive between calls, so requests after the first skip the TCP/TLS handshake.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            api_key = os.getenv("API_KEY")
+            if not api_key:
+                logging.error("API_KEY is missing or invalid.")
+                raise ValueError("API_KEY is missing or invalid.")
+
+            limits = httpx.Limits(max_connections=AI_MAX_CONNECTIONS,
+                                  max_keepalive_connections=AI_KEEPALIVE_CONNECTIONS)
+            _client = Mistral(
+                api_key=api_key,
+                server_url=MISTRAL_SERVER_URL,
+                client=httpx.Client(limits=limits, timeout=AI_HTTP_TIMEOUT),
+                async_client=httpx.AsyncClient(limits=limits, timeout=AI_HTTP_TIMEOUT)
+            )
+            logging.info(f"Created shared Mistral client (server_url={MISTRAL_SERVER_URL or 'default'})")
+        return _client
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the event loop that runs every async LLM call in this process. It lives on one
+    background thread, so any number of in-flight calls (and their retry back-offs) share it
+    and the async HTTP client's connection pool instead of each holding an OS thread.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="ai-event-loop", daemon=True).start()
+        return _loop
+
+def run_coroutine(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the shared AI event loop and wait for its result from a sync caller"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    return future.result(timeout)
@@ -0,0 +1,269 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+from metrics import Counter, Gauge
+from utils import configure_logging
+
+# Set up logging configuration
+configure_logging()
+
+# Scheduler settings (overridable through the environment)
+AI_MAX_IN_FLIGHT = int(os.getenv("AI_MAX_IN_FLIGHT", 8))  # LLM calls running at once, per process
+AI_QUEUE_DEPTH = int(os.getenv("AI_QUEUE_DEPTH", 32))  # calls allowed to wait for a slot before new ones are refused
+AI_REQUEST_DEADLINE = float(os.getenv("AI_REQUEST_DEADLINE", 60))  # seconds for a request, queueing and retries included
+AI_MAX_ATTEMPTS = int(os.getenv("AI_MAX_ATTEMPTS", 3))  # tries per call, the first one included
+AI_BACKOFF_BASE = float(os.getenv("AI_BACKOFF_BASE", 0.5))  # seconds, doubled per attempt before jitter
+AI_BACKOFF_MAX = float(os.getenv("AI_BACKOFF_MAX", 8))
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", 5))  # consecutive failures that open the breaker
+AI_BREAKER_COOLDOWN = float(os.getenv("AI_BREAKER_COOLDOWN", 30))  # seconds open before a probe call is let through
+
+# Metrics
+AI_SCHEDULER_REJECTED = Counter("ecm_ai_scheduler_rejected_total", "LLM calls refused or abandoned by the scheduler",
+                                ("reason",))
+AI_SCHEDULER_RETRIES = Counter("ecm_ai_scheduler_retries_total", "LLM calls retried after a provider error")
+AI_SCHEDULER_CALLS = Gauge("ecm_ai_scheduler_calls", "LLM calls running and waiting for a slot", ("state",))
+AI_BREAKER_STATE = Gauge("ecm_ai_breaker_state", "1 for the circuit breaker's current state", ("state",))
+
+
+class AISchedulerError(Exception):
+    """Base exception for LLM calls the scheduler could not complete."""
+    pass
+
+class AIQueueFullError(AISchedulerError):
+    """Raised when every slot is taken and the wait queue is already full."""
+    pass
+
+class AIDeadlineExceededError(AISchedulerError):
+    """Raised when the request deadline passes while queued, calling or backing off."""
+    pass
+
+class CircuitOpenError(AISchedulerError):
+    """Raised without calling the provider while the circuit breaker is open."""
+    pass
+
+class AIProviderError(AISchedulerError):
+    """Raised when the provider keeps failing after every allowed attempt."""
+    pass
+
+
+def backoff_delay(attempt: int, base: float = AI_BACKOFF_BASE, cap: float = AI_BACKOFF_MAX) -> float:
+    """Full jitter exponential backoff: a random delay up to base * 2^(attempt - 1), capped"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+def is_retryable(error: BaseException) -> bool:
+    """Timeouts, transport errors, 429s and 5xxs are worth another try; other 4xxs would fail the same way"""
+    status = getattr(error, 'status_code', None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return True
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive provider failures so calls fail fast instead of
+    queueing behind a provider that is down. After `cooldown` seconds one probe call is let
+    through (half open): its success closes the breaker, its failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = AI_BREAKER_FAILURES, cooldown: float = AI_BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go to the provider now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            retry_in = max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+        raise CircuitOpenError(f"AI provider is unavailable, retry in {retry_in:.0f}s")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info("AI circuit breaker closed after a successful probe")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED
+                                                and self.consecutive_failures >= self.failure_threshold):
+                logging.warning(f"AI circuit breaker opened after {self.consecutive_failures} consecutive failures")
+                self.state = self.OPEN
+                self.times_opened += 1
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        """The probe ended without telling us anything about the provider (e.g. a rejected request)"""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = self.cooldown - (time.monotonic() - self._opened_at) if self.state == self.OPEN else 0
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+                "retry_in": round(max(0.0, retry_in), 1)
+            }
+
+
+class AIScheduler:
+    """
+    Shared front door for LLM calls, running on the AI event loop. At most `max_in_flight`
+    calls reach the provider at once; up to `queue_depth` more wait for a slot and anything
+    beyond that is refused straight away. Provider errors are retried with jittered backoff
+    within the caller's deadline, and a circuit breaker stops calls while the provider is down.
+    """
+
+    def __init__(self, max_in_flight: int = AI_MAX_IN_FLIGHT, queue_depth: int = AI_QUEUE_DEPTH,
+                 max_attempts: int = AI_MAX_ATTEMPTS, breaker: Optional[CircuitBreaker] = None):
+        self.max_in_flight = max_in_flight
+        self.queue_depth = queue_depth
+        self.max_attempts = max_attempts
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self.retries = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @staticmethod
+    def deadline(seconds: float = AI_REQUEST_DEADLINE) -> float:
+        """Absolute deadline (time.monotonic) for a request starting now"""
+        return time.monotonic() + seconds
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], deadline: Optional[float] = None) -> Any:
+        """Await `fn()` in a provider slot, retrying provider errors until `deadline`"""
+        deadline = deadline or self.deadline()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self.breaker.allow()
+            except CircuitOpenError:
+                self._reject("circuit_open")
+                raise
+
+            try:
+                result = await self._call_in_slot(fn, deadline)
+            except AISchedulerError:
+                self.breaker.release_probe()
+                raise
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.release_probe()
+                    raise
+                self.breaker.record_failure()
+                reason = str(e) or type(e).__name__  # timeouts have no message
+                if attempt >= self.max_attempts:
+                    raise AIProviderError(f"AI provider failed after {attempt} attempts: {reason}") from e
+                delay = backoff_delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    self._reject("deadline")
+                    raise AIDeadlineExceededError(f"No time left to retry the AI provider: {reason}") from e
+                with self._lock:
+                    self.retries += 1
+                AI_SCHEDULER_RETRIES.inc()
+                logging.warning(f"AI call failed ({reason}), retry {attempt}/{self.max_attempts - 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    async def _call_in_slot(self, fn: Callable[[], Awaitable[Any]], deadline: float) -> Any:
+        with self._lock:
+            # counted at admission, not from the semaphore: calls admitted together haven't acquired yet
+            full = self._queued + self._in_flight >= self.max_in_flight + self.queue_depth
+            if not full:
+                self._queued += 1
+        if full:
+            self._reject("queue_full")
+            raise AIQueueFullError("Too many AI requests waiting, try again shortly")
+
+        try:
+            await asyncio.wait_for(self._slots.acquire(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._reject("deadline")
+            raise AIDeadlineExceededError("Timed out waiting for a free AI slot") from None
+        finally:
+            with self._lock:
+                self._queued -= 1
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            # a call cut off by the deadline counts as a provider failure (retried only if time remains)
+            return await asyncio.wait_for(fn(), max(0.0, deadline - time.monotonic()))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def _reject(self, reason: str):
+        with self._lock:
+            if reason == "deadline":
+                self.timed_out += 1
+            else:
+                self.rejected += 1
+        AI_SCHEDULER_REJECTED.inc(reason=reason)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "max_in_flight": self.max_in_flight,
+                "queue_depth": self.queue_depth,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "breaker": self.breaker.stats()
+            }
+
+    def collect_metrics(self):
+        """Refresh the queue and breaker gauges, called when metrics are scraped"""
+        stats = self.stats()
+        AI_SCHEDULER_CALLS.set(stats["in_flight"], state="in_flight")
+        AI_SCHEDULER_CALLS.set(stats["queued"], state="queued")
+        for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN):
+            AI_BREAKER_STATE.set(int(stats["breaker"]["state"] == state), state=state)
+
+
+_scheduler: Optional[AIScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_ai_scheduler() -> AIScheduler:
+    """Return the process-wide AI scheduler"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = AIScheduler()
+        return _scheduler
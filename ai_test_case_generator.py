@@ -1,17 +1,34 @@
-import os
 import re
 import json
-import logging
 import time
-from dotenv import load_dotenv
-from mistralai import Mistral
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from ai_client import get_client, run_coroutine
+from ai_scheduler import (get_ai_scheduler, AIScheduler, AISchedulerError, AIDeadlineExceededError, AIProviderError,
+                          backoff_delay)
+from cache import get_ai_cache, ai_cache_key, SingleFlight
+from code_cache import compile_user_code
+from utils import configure_logging, Truncated
+from metrics import Counter, stage
 
 # Set up basic logging configuration
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging()
 
-# Retry settings
+# Attempts at getting a parseable test case list (provider errors are retried by the AI scheduler)
 MAX_RETRIES = 3
-RETRY_DELAY = 2  # in seconds (initial delay between retries)
+
+MODEL = "mistral-large-latest"
+
+# identical generations that are already in flight are shared instead of sent again
+_generation_flights = SingleFlight()
+
+# Metrics
+AI_REQUESTS = Counter("ecm_ai_requests_total", "LLM calls by outcome", ("outcome",))
+AI_RETRIES = Counter("ecm_ai_retries_total", "Test case generations retried after a bad LLM response")
+AI_PARSE_FAILURES = Counter("ecm_ai_parse_failures_total", "LLM responses test cases couldn't be extracted from",
+                            ("reason",))
+AI_STREAMED_CASES = Counter("ecm_ai_streamed_cases_total", "Test cases parsed out of streamed LLM replies")
 
 # Custom exception for invalid code
 class InvalidCodeError(Exception):
@@ -25,6 +42,7 @@ def validate_user_code(user_code):
     Validate the user's code by checking for syntax errors.
     This function tries to compile the code and checks if it is syntactically correct.
     It handles various types of errors during validation.
+    Returns the compiled code (cached by source, shared with the test runs).
     """
     error_map = {
         SyntaxError: "Syntax error",
@@ -38,9 +56,9 @@ def validate_user_code(user_code):
 
     try:
         # Attempt to compile the code to check for syntax errors
-        compile(user_code, '<string>', 'exec')
+        compiled = compile_user_code(user_code)
         logging.info("User code validated successfully.")
-        return True
+        return compiled
 
     except tuple(error_map.keys()) as e:
         error_type = type(e).__name__
@@ -52,32 +70,59 @@ def validate_user_code(user_code):
         logging.error(f"Unexpected error during code validation: {e}")
         raise InvalidCodeError(f"Unexpected validation error: {e}")
 
-def query_ai(prompt):
-    load_dotenv()
-
-    api_key = os.getenv("API_KEY")
-
-    model = "mistral-large-latest"
-    client = Mistral(api_key=api_key)
-
-    try:
-        chat_response = client.chat.complete(
+async def _stream(client, model, prompt, on_text: Callable[[str], None]):
+    """Stream a chat completion, passing each piece of text to `on_text` as it arrives"""
+    with stage("llm"):
+        events = await client.chat.stream_async(
             model=model,
             messages=[{
                 "role": "user",
                 "content": prompt,
             }]
         )
+        async for event in events:
+            choices = event.data.choices
+            if choices and isinstance(choices[0].delta.content, str):
+                on_text(choices[0].delta.content)
+
+async def _complete(client, model, prompt):
+    with stage("llm"):
+        return await client.chat.complete_async(
+            model=model,
+            messages=[{
+                "role": "user",
+                "content": prompt,
+            }]
+        )
+
+def query_ai(prompt):
+    """Sync version of query_ai_async, for callers outside the AI event loop"""
+    return run_coroutine(query_ai_async(prompt))
+
+async def query_ai_async(prompt, deadline=None):
+    """
+    Send a prompt through the shared AI scheduler. Raises AISchedulerError when the call
+    was refused or ran out of time, returns None for any other provider error.
+    """
+    client = get_client()
+
+    try:
+        chat_response = await get_ai_scheduler().call(lambda: _complete(client, MODEL, prompt), deadline)
         response = chat_response.choices[0].message.content
+        AI_REQUESTS.inc(outcome="ok")
         logging.info("Sucessfully got response from ai")
         return response
+    except AISchedulerError as e:
+        AI_REQUESTS.inc(outcome="error")
+        logging.error(f"AI call not completed: {e}")
+        raise
     except Exception as e:
+        AI_REQUESTS.inc(outcome="error")
         logging.error(f"Error getting response from ai: {e}")
         return None
 
-def get_test_cases(user_code, client, model):
-    logging.info("Generating test cases with the provided user code.")
-    prompt = f"""
+def build_test_case_prompt(user_code):
+    return f"""
     Given the following Python function, generate 10-15 important test cases. Each test case should contain simple inputs (e.g., lists with at most 15 elements), and focus on edge cases, error handling, and boundary conditions.Don't Include Error Outputs.
 
     Python code:
@@ -90,20 +135,129 @@ def get_test_cases(user_code, client, model):
         ...
     ]
     """
+
+async def stream_test_cases_async(user_code, client, model, on_case: Callable[[Dict[str, Any]], None],
+                                  deadline=None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Ask for test cases with a streamed completion, passing each case to `on_case` (on the AI
+    event loop) as soon as it is complete. Returns (cases, error): a reply that breaks off after
+    some cases keeps them and reports why it stopped, instead of being retried from the start.
+    Raises AISchedulerError when the call was refused or ran out of time before any case arrived.
+    """
+    logging.info("Streaming test cases for the provided user code.")
+    prompt = build_test_case_prompt(user_code)
+    cases: List[Dict[str, Any]] = []
+    cut_short: List[str] = []
+
+    async def attempt():
+        parser = TestCaseStreamParser()
+
+        def on_text(text):
+            for case in parser.feed(text):
+                cases.append(case)
+                AI_STREAMED_CASES.inc()
+                on_case(case)
+
+        try:
+            await _stream(client, model, prompt, on_text)
+        except Exception as e:
+            if not cases:
+                raise  # nothing delivered yet: the scheduler may retry the whole call
+            cut_short.append(str(e) or type(e).__name__)
+            return
+        if cases and not parser.done:
+            cut_short.append("the reply ended before the test case list was closed")
+        if parser.invalid:
+            AI_PARSE_FAILURES.inc(parser.invalid, reason="invalid_case")
+
     try:
-        chat_response = client.chat.complete(
-            model=model,
-            messages=[{
-                "role": "user",
-                "content": prompt,
-            }]
-        )
-        response = chat_response.choices[0].message.content
-        logging.info("Test cases generated successfully.")
-        return response
+        await get_ai_scheduler().call(attempt, deadline)
+    except AISchedulerError as e:
+        AI_REQUESTS.inc(outcome="partial" if cases else "error")
+        logging.error(f"AI call not completed: {e}")
+        if not cases:
+            raise
+        return cases, str(e)
     except Exception as e:
-        logging.error(f"Error generating test cases: {e}")
-        return None
+        AI_REQUESTS.inc(outcome="partial" if cases else "error")
+        logging.error(f"Error streaming test cases: {e}")
+        return cases, str(e)
+
+    if cut_short:
+        AI_REQUESTS.inc(outcome="partial")
+        logging.warning(f"Kept {len(cases)} test cases from a reply that was cut short: {cut_short[0]}")
+        return cases, cut_short[0]
+    AI_REQUESTS.inc(outcome="ok")
+    logging.info(f"Streamed {len(cases)} test cases.")
+    return cases, None
+
+class TestCaseStreamParser:
+    """
+    Incremental parser for the test case list in a streamed LLM reply. Feed it the text as it
+    arrives and it returns every object of the list completed so far; prose and code fences
+    around the list are skipped, and each object goes through clean_json before it is parsed.
+    """
+
+    def __init__(self):
+        self.done = False  # the list's closing bracket was seen
+        self.invalid = 0  # objects that didn't parse, skipped
+        self._in_list = False
+        self._list_started = False  # something other than whitespace followed the opening bracket
+        self._depth = 0  # nesting inside the current object
+        self._in_string = False
+        self._escaped = False
+        self._object: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        cases = []
+        for char in text:
+            if self.done:
+                break
+            if self._depth:
+                self._object.append(char)
+                if self._in_string:
+                    if self._escaped:
+                        self._escaped = False
+                    elif char == '\\':
+                        self._escaped = True
+                    elif char == '"':
+                        self._in_string = False
+                elif char == '"':
+                    self._in_string = True
+                elif char in '{[':
+                    self._depth += 1
+                elif char in '}]':
+                    self._depth -= 1
+                    if not self._depth:
+                        case = self._parse(''.join(self._object))
+                        if case is not None:
+                            cases.append(case)
+                continue
+
+            if not self._in_list:
+                if char == '[':
+                    self._in_list, self._list_started = True, False
+            elif char == '{':
+                self._list_started = True
+                self._depth = 1
+                self._object = [char]
+            elif char == ']':
+                self.done = True
+            elif not self._list_started and not char.isspace():
+                # a bracket in the prose (like "[10 cases]"), keep looking for the list
+                self._in_list = False
+        return cases
+
+    def _parse(self, text: str) -> Optional[Dict[str, Any]]:
+        try:
+            case = json.loads(clean_json(text))
+        except json.JSONDecodeError:
+            case = None
+        if not isinstance(case, dict):
+            logging.error("Skipping a test case that isn't a valid JSON object: %s", Truncated(text))
+            self.invalid += 1
+            return None
+        return case
 
 def clean_json(json_string):
     """
@@ -114,35 +268,6 @@ def clean_json(json_string):
     json_string = json_string.replace('\n', '').replace('\r', '')
     return json_string
 
-def extract_inputs_outputs(response):
-    """
-    Extract inputs and outputs from the AI response.
-    Returns a list of dictionaries with "input" and "expected_output".
-    """
-    logging.info("Extracting inputs and outputs from AI response.")
-
-    if not response:
-        logging.error("Empty response from AI model.")
-        return None
-
-    # Extract test case data
-    match = re.search(r'\[.*\]', response, re.DOTALL)
-    if not match:
-        logging.error("Could not find valid test cases in the AI response.")
-        return None
-
-    json_string = match.group(0)
-    json_string = clean_json(json_string)
-
-    # Parse the cleaned JSON string into a Python object
-    try:
-        test_cases = json.loads(json_string)
-        logging.info(f"Extracted {len(test_cases)} test cases.")
-        return test_cases
-    except json.JSONDecodeError as e:
-        logging.error(f"Error decoding JSON: {e}")
-        return None
-
 def send_to_client(test_cases):
     """
     Send the extracted test cases (inputs and outputs) to the client.
@@ -166,47 +291,87 @@ def send_to_client(test_cases):
         return None
 
 def ask_ai(user_code):
-    load_dotenv()
-
-    api_key = os.getenv("API_KEY")
-    if not api_key:
-        logging.error("API_KEY is missing or invalid.")
-        raise ValueError("API_KEY is missing or invalid.")  # This should be abstracted in the Flask route as a user-friendly message
+    """
+    Generate test cases for the user's code. Results are cached by the code's AST, and
+    concurrent requests for the same code share a single AI call.
+    """
+    test_cases, _ = generate_ai_test_cases(user_code)
+    return send_to_client(test_cases)
 
-    model = "mistral-large-latest"
-    client = Mistral(api_key=api_key)
+def generate_ai_test_cases(user_code, on_case: Optional[Callable[[Dict[str, Any]], None]] = None):
+    """
+    ask_ai, returning (test cases, error) where error says why the reply was cut short after
+    some cases (those are kept, but not cached). With `on_case` every case is also passed to it
+    as soon as it is parsed, from the AI event loop; such callers don't share other requests'
+    calls, since those may have delivered cases already.
+    """
+    with stage("ai_validate"):
+        compiled = validate_user_code(user_code)
+    cache_key = ai_cache_key(compiled.fingerprint, MODEL)
+
+    with stage("cache_lookup"):
+        test_cases = get_ai_cache().get(cache_key)
+    if test_cases is not None:
+        logging.info(f"AI cache hit for {cache_key[:12]}")
+        for case in test_cases if on_case is not None else ():
+            on_case(case)
+        return test_cases, None
+
+    def generate():
+        # the call and its retry back-off run on the shared event loop, not with time.sleep here
+        test_cases, error = run_coroutine(generate_test_cases_async(user_code, on_case))
+        if error is None:
+            get_ai_cache().set(cache_key, test_cases)
+        return test_cases, error
+
+    with stage("ai_generate"):
+        if on_case is not None:
+            return generate()
+        return _generation_flights.do(cache_key, generate)
+
+def generation_stats():
+    return {"cache": get_ai_cache().stats(), "coalesced": _generation_flights.stats(),
+            "scheduler": get_ai_scheduler().stats()}
+
+async def generate_test_cases_async(user_code, on_case=None):
+    """
+    Stream test cases from the AI, retrying replies without any usable case. Returns
+    (test cases, error), see stream_test_cases_async.
+    """
+    client = get_client()  # raises ValueError without an API key, abstracted in the Flask route as a user-friendly message
+    model = MODEL
 
     logging.info("Starting the AI test case generation process.")
+    deadline = AIScheduler.deadline()  # shared by every attempt, queueing and backoff included
     retries = 0
 
     while retries < MAX_RETRIES:
         try:
 
-            if not validate_user_code(user_code):
-                raise InvalidCodeError("User code validation failed.")
-
-            ai_response = get_test_cases(user_code, client, model)
-            logging.info(f'ai response : {ai_response}')
-
-            if not ai_response:
-                raise ValueError("Received empty or invalid response from AI.")
-
-            test_cases = extract_inputs_outputs(ai_response)
-            if test_cases is None:
-                raise ValueError("Failed to generate valid test cases.")
+            test_cases, error = await stream_test_cases_async(user_code, client, model,
+                                                              on_case or (lambda case: None), deadline)
+            logging.info('ai test cases : %s', Truncated(test_cases))
 
-            return send_to_client(test_cases)
+            if not test_cases:
+                AI_PARSE_FAILURES.inc(reason="no_list")
+                raise ValueError(f"Failed to generate valid test cases: {error or 'no test case list in the reply'}")
 
-        except InvalidCodeError as ice:
-                raise ice
+            return test_cases, error
 
         except (json.JSONDecodeError, ValueError) as e:
             retries += 1
-            logging.error(f"Error during AI response processing: {str(e)}. Retrying {retries}/{MAX_RETRIES}...")
-            if retries < MAX_RETRIES:
-                time.sleep(RETRY_DELAY * retries)  # Exponential backoff
-            else:
+            AI_RETRIES.inc()
+            logging.error("Error during AI response processing: %s. Retrying %d/%d...", Truncated(str(e)), retries,
+                          MAX_RETRIES)
+            if retries >= MAX_RETRIES:
                 raise ValueError("Failed to process the AI response after multiple attempts.")  # Specific error message
+            delay = backoff_delay(retries)  # jittered, so retries from many requests don't line up
+            if time.monotonic() + delay >= deadline:
+                raise AIDeadlineExceededError("No time left to ask the AI provider again.")
+            await asyncio.sleep(delay)
+
+        except AISchedulerError:
+            raise  # busy, unavailable or out of time: tell the client rather than hide it as unexpected
 
         except Exception as e:
             logging.error(f"Unexpected error during AI test case generation: {str(e)}")
@@ -232,10 +397,8 @@ def add_debug_logs_with_ai(user_code):
     {user_code}
     Expected output: Provide the modified code with debug logs integrated, ensuring clarity and effectiveness."
     """
-    try:
-       ai_response = query_ai(prompt)
-       ai_generated_code = extract_python_code_from_text(ai_response)
-    except Exception as e:
-        raise e
-
-    return ai_generated_code
\ No newline at end of file
+    ai_response = run_coroutine(query_ai_async(prompt))
+    if ai_response is None:
+        # the provider failed in a way the scheduler doesn't retry; same answer as a refused call
+        raise AIProviderError("AI provider returned no response")
+    return extract_python_code_from_text(ai_response)
\ No newline at end of file
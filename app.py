@@ -1,80 +1,876 @@
 import logging
-from flask import Flask, request, jsonify
+import gzip
+import math
+import time
+import queue
+import threading
+import contextvars
+from flask import Flask, Response, request, jsonify, g, url_for
 from flask_cors import CORS
-import subprocess
-import tempfile
 import json
-import os
-from validator import validate_and_process_input_output, ValidationException
-from userInputs_edge_case_handler import handleEdgecases, extract_function_name, FunctionNameNotFoundError
-from ai_test_case_generator import ask_ai, InvalidCodeError, add_debug_logs_with_ai
+from validator import check_input_output, ValidationException
+from userInputs_edge_case_handler import extract_function_name, FunctionNameNotFoundError
+from ai_test_case_generator import generate_ai_test_cases, InvalidCodeError, add_debug_logs_with_ai, generation_stats
+from ai_scheduler import get_ai_scheduler, AISchedulerError, AI_REQUEST_DEADLINE
+from runner_pool import (get_runner_pool, RunnerPoolError, RunnerPoolFullError, RunnerTimeoutError,
+                         RUNNER_JOB_TIMEOUT, RUNNER_KILL_GRACE)
+from jobs import get_job_queue, JobQueueFullError, JOB_MAX_WAIT
+from code_cache import compile_user_code, code_cache_stats
+from edge_cases import LocalGenerationError
+from debug_logs import add_debug_logs as add_debug_logs_locally, VERBOSITY_LEVELS
+from complexity import COMPLEXITY_SIZES, COMPLEXITY_DISTRIBUTIONS
+from testing import Testing
+from cache import get_result_cache, result_cache_key, collect_cache_metrics
+from utils import configure_logging, Truncated
+import metrics
+from metrics import stage
+
+try:
+    import brotli
+except ImportError:  # optional, responses fall back to gzip without it
+    brotli = None
 
 # Set up logging configuration
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging()
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+# Streamed runs with more results than this are not kept for the result cache, so server memory stays flat
+STREAM_CACHE_MAX_RESULTS = 1000
 
-def handle_test_execution(user_code, input_list, output_list):
-    """Handle the logic of running tests on the user code"""
-    try:
-        # Validate and process inputs and outputs
-        input_array, output_array = handleEdgecases(input_list, output_list)
+# Most submissions a /runtests/batch request may grade against its test suite
+BATCH_MAX_SUBMISSIONS = 1000
+
+# Ways /ask_ai can come up with test cases
+ASK_AI_STRATEGIES = ("ai", "local", "prepass", "fallback")
+
+# Seconds a synchronous route waits on top of its job's own time limit (queueing for a job worker and
+# a runner included) before it answers 504 with the id of the still running job
+SYNC_WAIT_SLACK = 30
+
+# Response compression settings
+COMPRESS_MIN_BYTES = 1024  # smaller bodies are sent as they are, compressing them saves next to nothing
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+# Request metrics
+HTTP_REQUESTS = metrics.Counter("ecm_http_requests_total", "HTTP requests by endpoint and status",
+                                ("endpoint", "status"))
+HTTP_LATENCY = metrics.Histogram("ecm_http_request_duration_seconds",
+                                 "Time until the response is ready (for streams: until the first byte)", ("endpoint",))
 
-        # Extract function name
+
+def error_status(e):
+    """HTTP status for an error that stopped a run: bad input, a full pool, a runner out of time, or ours"""
+    if isinstance(e, (ValidationException, FunctionNameNotFoundError, ValueError)):
+        return 400
+    if isinstance(e, RunnerPoolFullError):
+        return 503
+    if isinstance(e, RunnerTimeoutError):
+        return 504
+    return 500
+
+
+def error_result(e, message=None):
+    """The result_json of a run that failed before the runner could answer, with the status to send"""
+    return {"error": message or str(e), "status": error_status(e)}
+
+
+def prepare_test_execution(user_code, input_str, output_str, options=None):
+    """
+    Work out the function name and result cache key. The test data stays the raw JSON strings;
+    the runner parses them and applies handleEdgecases, so the app never holds decoded copies.
+    """
+    # Extract function name
+    with stage("function_name"):
         function_name = extract_function_name(user_code)
 
-        # Create temporary files for user code and test data
-        temp_code_filename, temp_data_filename = create_temp_files(user_code, input_array, output_array)
+    with stage("cache_key"):
+        cache_key = result_cache_key(user_code, function_name, input_str, output_str, options)
+    return function_name, cache_key
+
+
+def handle_test_execution(user_code, input_str, output_str, options=None):
+    """Handle the logic of running tests on the user code"""
+    try:
+        function_name, cache_key = prepare_test_execution(user_code, input_str, output_str, options)
+
+        # Serve resubmissions of the same code and test data from the cache
+        with stage("cache_lookup"):
+            cached = get_result_cache().get(cache_key)
+        if cached is not None:
+            logging.info(f"Result cache hit for {cache_key[:12]}")
+            return cached['result_json'], cached['stderr_output']
 
         # Run the test
-        result = run_tests(temp_code_filename, temp_data_filename, function_name)
+        result_json, stderr_output = run_tests(user_code, input_str, output_str, function_name, options)
 
-        # Clean up temporary files
-        os.remove(temp_code_filename)
-        os.remove(temp_data_filename)
+        if is_cacheable(result_json):
+            get_result_cache().set(cache_key, {"result_json": result_json, "stderr_output": stderr_output})
 
-        return result
+        return result_json, stderr_output
 
-    except (ValidationException, ValueError, FunctionNameNotFoundError, Exception) as e:
+    except Exception as e:
         logging.error(f"Error occurred: {str(e)}")
-        return {"error": str(e)}
+        return error_result(e), ""
 
 
-def create_temp_files(user_code, input_array, output_array):
-    """Create temporary files for code and test data"""
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.py') as temp_code_file:
-        temp_code_file.write(user_code.encode())
-        temp_code_filename = temp_code_file.name
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.json') as temp_data_file:
-        temp_data_file.write(json.dumps({'inputs': input_array, 'outputs': output_array}).encode())
-        temp_data_filename = temp_data_file.name
+def stream_test_execution(user_code, input_str, output_str, options=None):
+    """Yield a {"type": "result"} frame as each test case finishes, then one {"type": "summary"} frame"""
+    try:
+        function_name, cache_key = prepare_test_execution(user_code, input_str, output_str, options)
+    except Exception as e:
+        logging.error(f"Error occurred: {str(e)}")
+        yield {"type": "error", "err": str(e)}
+        return
 
-    return temp_code_filename, temp_data_filename
+    with stage("cache_lookup"):
+        cached = get_result_cache().get(cache_key)
+    if cached is not None:
+        logging.info(f"Result cache hit for {cache_key[:12]}")
+        for result in cached['result_json'].get('results') or []:
+            yield {"type": "result", "result": result}
+        yield summary_frame(cached['result_json'], cached['stderr_output'])
+        return
 
-def run_tests(temp_code_filename, temp_data_filename, function_name):
-    """Run tests using subprocess and return the result"""
+    collected = []
     try:
-        result = subprocess.run(
-            ['python', 'run_tests.py', temp_code_filename, temp_data_filename, function_name or ''],
-            capture_output=True, text=True
-        )
+        for frame in get_runner_pool().stream(user_code, function_name or '', input_str, output_str, options):
+            if frame.get('frame') == 'result':
+                if collected is not None:
+                    collected.append(frame['result'])
+                    if len(collected) > STREAM_CACHE_MAX_RESULTS:
+                        collected = None
+                yield {"type": "result", "result": frame['result']}
+                continue
+
+            stderr_output = frame.pop('stderr', '')
+            if "err" in frame:
+                yield {"type": "error", "err": frame['err']}
+                return
+
+            yield summary_frame(frame, stderr_output)
+            result_json = dict(frame, results=collected)
+            if collected is not None and is_cacheable(result_json):
+                get_result_cache().set(cache_key, {"result_json": result_json, "stderr_output": stderr_output})
+    except RunnerPoolError as e:
+        yield {"type": "error", "err": f"Test runner failed: {e}"}
 
-        stdout_output = result.stdout.strip()
-        stderr_output = result.stderr.strip()
-        logging.info(f'Results Got from the subprocess : \n{stderr_output} \n{stderr_output}')
-        # Decode JSON result
+
+def batch_test_execution(submissions, input_str, output_str, options=None):
+    """
+    Grade every submission against one test suite. Yields a {"type": "submission"} frame per
+    submission as it finishes (completion order, with its index), then one {"type": "batch"} frame
+    with throughput stats. Cache misses are split over the runners, and each runner parses the
+    suite once for its whole share.
+    """
+    started = time.perf_counter()
+    counts = {"cached": 0, "passed_all": 0, "errors": 0}
+
+    def submission_frame(index, result_json, stderr_output):
+        body, status = runtests_response(result_json, stderr_output)
+        summary = body.get('tests_summary') or {}
+        if status == 200 and summary.get('passed') and not (summary.get('failed') or summary.get('timed_out')
+                                                           or summary.get('memory_exceeded')):
+            counts["passed_all"] += 1
+        elif status != 200:
+            counts["errors"] += 1
+        return dict(body, type="submission", index=index, id=submissions[index]['id'], status=status)
+
+    pending = []
+    for index, submission in enumerate(submissions):
+        try:
+            function_name, cache_key = prepare_test_execution(submission['code'], input_str, output_str, options)
+        except Exception as e:
+            logging.error(f"Error occurred: {str(e)}")
+            yield submission_frame(index, error_result(e), "")
+            continue
+
+        with stage("cache_lookup"):
+            cached = get_result_cache().get(cache_key)
+        if cached is not None:
+            counts["cached"] += 1
+            yield submission_frame(index, cached['result_json'], cached['stderr_output'])
+            continue
+        pending.append({"index": index, "code": submission['code'], "function_name": function_name or '',
+                        "cache_key": cache_key})
+
+    pool = get_runner_pool()
+    chunks = [pending[i::pool.size] for i in range(min(pool.size, len(pending)))]
+    finished = queue.Queue()
+
+    def run_chunk(chunk):
+        reported = set()
         try:
-            result_json = json.loads(stdout_output) if stdout_output else {
-                "error": "No output received from subprocess"}
-        except json.JSONDecodeError as e:
-            result_json = {"error": f"JSON decoding error: {e}"}
+            for index, result_json, stderr_output in pool.batch(chunk, input_str, output_str, options):
+                reported.add(index)
+                finished.put((index, result_json, stderr_output))
+        except RunnerPoolError as e:
+            for entry in chunk:
+                if entry['index'] not in reported:
+                    finished.put((entry['index'], error_result(e, f"Test runner failed: {e}"), str(e)))
+        finally:
+            finished.put(None)
+
+    for chunk in chunks:
+        threading.Thread(target=run_chunk, args=(chunk,), name="batch-chunk", daemon=True).start()
+
+    cache_keys = {entry['index']: entry['cache_key'] for entry in pending}
+    running = len(chunks)
+    while running:
+        item = finished.get()
+        if item is None:
+            running -= 1
+            continue
+        index, result_json, stderr_output = item
+        if is_cacheable(result_json):
+            get_result_cache().set(cache_keys[index], {"result_json": result_json, "stderr_output": stderr_output})
+        yield submission_frame(index, result_json, stderr_output)
+
+    elapsed = time.perf_counter() - started
+    yield {
+        "type": "batch",
+        "submissions": len(submissions),
+        "cached": counts["cached"],
+        "passed_all": counts["passed_all"],
+        "errors": counts["errors"],
+        "runners": len(chunks),
+        "elapsed_s": round(elapsed, 3),
+        "submissions_per_s": round(len(submissions) / elapsed, 1) if elapsed > 0 else None
+    }
+
+
+def summary_frame(result_json, stderr_output):
+    frame = {"type": "summary", "tests_summary": result_json.get('tests_summary'), "err": stderr_output}
+    if "profile" in result_json:
+        frame["profile"] = result_json["profile"]
+    return frame
+
 
+def stream_response(frames, mode):
+    """Send frames as Server-Sent Events when mode is 'sse', NDJSON otherwise"""
+    if mode == 'sse':
+        body = (f"event: {frame['type']}\ndata: {json.dumps(frame)}\n\n" for frame in frames)
+        mimetype = 'text/event-stream'
+    else:
+        body = (json.dumps(frame) + '\n' for frame in frames)
+        mimetype = 'application/x-ndjson'
+    # stop proxies from buffering the stream
+    return Response(body, mimetype=mimetype, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def run_options(data):
+    """Pick the runner settings out of a /runtests request body; only enabled ones are kept"""
+    options = {}
+    if data.get('benchmark'):
+        # repeated, warmed-up timing with min/median/p95/stddev per case
+        options['benchmark'] = True
+    if data.get('memory'):
+        # peak memory per case, from one more call under tracemalloc: at least twice the run time,
+        # and the function's side effects happen twice
+        options['memory'] = True
+    if data.get('profile'):
+        # cProfile function stats plus sampled hot lines of the submission
+        options['profile'] = True
+    response_format = data.get('format') or request.args.get('format')
+    if response_format not in (None, 'full', 'compact'):
+        raise ValidationException("format should be 'full' or 'compact'.")
+    if response_format == 'compact':
+        # results reference the request's test cases instead of echoing them, with short previews
+        options['format'] = 'compact'
+    if data.get('reference_code'):
+        # time every case against this implementation too and report speed ratios
+        if data.get('profile'):
+            raise ValidationException("profile and reference_code can't be combined.")
+        options['reference_code'] = data['reference_code']
+        options['reference_function'] = reference_function(data['reference_code'])
+    if data.get('isolated'):
+        # keep every case on one process so parallel shards don't distort execution_time
+        options['isolated'] = True
+    elif data.get('workers') is not None:
+        # processes a large suite is sharded over, capped by RUNNER_SHARD_WORKERS
+        if not isinstance(data['workers'], int) or data['workers'] < 1:
+            raise ValidationException("workers should be a positive integer.")
+        options['workers'] = data['workers']
+    return options
+
+
+def reference_function(reference_code):
+    """The function of the reference implementation to compare against; raises ValidationException"""
+    if not isinstance(reference_code, str):
+        raise ValidationException("reference_code should be a string.")
+    try:
+        function_name = compile_user_code(reference_code).entry_point
+    except (SyntaxError, ValueError) as e:
+        raise ValidationException(f"reference_code doesn't compile: {e}")
+    if function_name is None:
+        raise ValidationException("Function name not found in reference_code.")
+    return function_name
+
+
+def is_cacheable(result_json):
+    """Only complete runs are worth replaying; errors and limit hits may not happen next time"""
+    if "err" in result_json or "error" in result_json:
+        return False
+    tests_summary = result_json.get("tests_summary") or {}
+    return not tests_summary.get("timed_out") and not tests_summary.get("memory_exceeded")
+
+
+def run_tests(user_code, input_str, output_str, function_name, options=None):
+    """Run tests on a warm runner from the pool and return the result"""
+    try:
+        result_json, stderr_output = get_runner_pool().run(user_code, function_name or '', input_str, output_str,
+                                                           options)
+        logging.info('Results Got from the runner : \n%s', Truncated(stderr_output))
         return result_json, stderr_output
+    except RunnerPoolError as e:
+        return error_result(e, f"Test runner failed: {e}"), str(e)
+
+
+def runtests_params(data):
+    """Validate a /runtests body and pick out what the job needs; raises ValidationException"""
+    input_str = data.get('inputString', '')
+    output_str = data.get('outputString', '')
+    options = run_options(data)
+    # Validate and process inputs and outputs
+    with stage("validate"):
+        check_input_output(input_str, output_str)
+    return {"code": data.get('code', ''), "inputString": input_str, "outputString": output_str, "options": options}
+
+def batch_params(data):
+    """Validate a /runtests/batch body; raises ValidationException"""
+    params = runtests_params(data)
+    del params['code']
+    if (data.get('format') or request.args.get('format')) != 'full':
+        # a batch echoing the test cases back once per submission would mostly be copies of the suite
+        params['options']['format'] = 'compact'
+
+    submissions = data.get('submissions')
+    if not isinstance(submissions, list) or not submissions:
+        raise ValidationException("submissions should be a non-empty list.")
+    if len(submissions) > BATCH_MAX_SUBMISSIONS:
+        raise ValidationException(f"A batch can hold at most {BATCH_MAX_SUBMISSIONS} submissions.")
+    params['submissions'] = []
+    for index, submission in enumerate(submissions):
+        # a plain string is the code; objects may carry an id to match results up with
+        if isinstance(submission, str):
+            submission = {"code": submission}
+        if not isinstance(submission, dict) or not isinstance(submission.get('code'), str):
+            raise ValidationException(f"submissions[{index}] should be a code string or an object with 'code'.")
+        params['submissions'].append({"id": submission.get('id', index), "code": submission['code']})
+    return params
+
+def debug_logs_params(data):
+    """Pick out an /add_debug_logs job; raises ValidationException"""
+    params = ai_params(data)
+    # "ast" instruments the code locally, "ai" asks the LLM to rewrite it
+    mode = data.get('mode') or 'ast'
+    if mode not in ('ast', 'ai'):
+        raise ValidationException("mode should be 'ast' or 'ai'.")
+    params['mode'] = mode
+    options = {}
+    if data.get('verbosity') is not None:
+        if data['verbosity'] not in VERBOSITY_LEVELS:
+            raise ValidationException(f"verbosity should be one of {list(VERBOSITY_LEVELS)}.")
+        options['verbosity'] = data['verbosity']
+    for key, minimum in (('loop_budget', 0), ('max_lines', 1)):
+        if data.get(key) is not None:
+            if not isinstance(data[key], int) or data[key] < minimum:
+                raise ValidationException(f"{key} should be an integer of at least {minimum}.")
+            options[key] = data[key]
+    params['options'] = options
+    return params
+
+def verify_params(data):
+    """Pick out a /generate_and_verify job; raises ValidationException or FunctionNameNotFoundError"""
+    params = ask_ai_params(data)
+    params['function_name'] = extract_function_name(params['code'])
+    return params
+
+def complexity_params(data):
+    """Pick out a /complexity job; raises ValidationException or FunctionNameNotFoundError"""
+    user_code = data.get('code', '')
+    function_name = extract_function_name(user_code)
+    # sweep settings the caller may override: time_budget_ms, max_size, distributions, seed
+    options = {}
+    if data.get('time_budget_ms') is not None:
+        budget = data['time_budget_ms']
+        if isinstance(budget, bool) or not isinstance(budget, (int, float)) or not 0 < budget < float('inf'):
+            raise ValidationException("time_budget_ms should be a positive number.")
+        options['time_budget_ms'] = budget
+    if data.get('max_size') is not None:
+        # the fit needs at least three sizes
+        if not isinstance(data['max_size'], int) or data['max_size'] < COMPLEXITY_SIZES[2]:
+            raise ValidationException(f"max_size should be an integer of at least {COMPLEXITY_SIZES[2]}.")
+        options['max_size'] = data['max_size']
+    if data.get('distributions') is not None:
+        distributions = data['distributions']
+        if (not isinstance(distributions, list) or not distributions
+                or any(distribution not in COMPLEXITY_DISTRIBUTIONS for distribution in distributions)):
+            raise ValidationException(f"distributions should be a non-empty list drawn from "
+                                      f"{list(COMPLEXITY_DISTRIBUTIONS)}.")
+        options['distributions'] = distributions
+    if data.get('seed') is not None:
+        if not isinstance(data['seed'], int) or data['seed'] < 0:
+            raise ValidationException("seed should be a non-negative integer.")
+        options['seed'] = data['seed']
+    return {"code": user_code, "function_name": function_name, "options": options}
+
+def ai_params(data):
+    return {"code": data.get('code', '')}
+
+def ask_ai_params(data):
+    """Pick out an /ask_ai job; raises ValidationException"""
+    params = ai_params(data)
+    # "ai" asks the LLM, "local" only runs the local edge-case generator, "prepass" merges both
+    # and "fallback" uses the local generator when the LLM can't deliver
+    strategy = data.get('strategy') or request.args.get('strategy') or 'ai'
+    if strategy not in ASK_AI_STRATEGIES:
+        raise ValidationException(f"strategy should be one of {list(ASK_AI_STRATEGIES)}.")
+    params['strategy'] = strategy
+    if data.get('seed') is not None:
+        if not isinstance(data['seed'], int):
+            raise ValidationException("seed should be an integer.")
+        params['seed'] = data['seed']
+    if data.get('reference_code'):
+        # the local generator takes its expected outputs from this implementation
+        params['reference_code'] = data['reference_code']
+        params['reference_function'] = reference_function(data['reference_code'])
+    return params
+
+
+def runtests_job(params):
+    """Run a validated /runtests request, returning (response body, HTTP status)"""
+    result_json, stderr_output = handle_test_execution(params['code'], params['inputString'], params['outputString'],
+                                                       params['options'])
+    return runtests_response(result_json, stderr_output)
+
+def runtests_response(result_json, stderr_output):
+    """The /runtests response body and HTTP status for a run's result"""
+    if "error" in result_json:
+        # the run never reached the runner or the runner gave up on it
+        return {"error": result_json['error']}, result_json.get('status', 500)
+    if "err" in result_json:
+        return result_json, 400
+
+    logging.info('result_json %s', Truncated(result_json))
+    response = {
+        "results": result_json.get("results", []),
+        "tests_summary": result_json.get("tests_summary", {}),
+        "err": stderr_output
+    }
+    if "profile" in result_json:
+        response["profile"] = result_json["profile"]
+    return response, 200
+
+def batch_job(params):
+    """Grade a validated /runtests/batch request, returning (response body, HTTP status)"""
+    results = [None] * len(params['submissions'])
+    batch = None
+    for frame in batch_test_execution(params['submissions'], params['inputString'], params['outputString'],
+                                      params['options']):
+        frame_type = frame.pop('type')
+        if frame_type == "submission":
+            results[frame.pop('index')] = frame
+        else:
+            batch = frame
+    return {"results": results, "batch": batch}, 200
+
+def complexity_job(params):
+    try:
+        result_json, stderr_output = get_runner_pool().execute({
+            "kind": "complexity",
+            "code": params['code'],
+            "function_name": params['function_name'],
+            "options": params['options']
+        })
+    except RunnerPoolError as e:
+        return {"error": f"Test runner failed: {e}"}, error_status(e)
+
+    if "err" in result_json:
+        return result_json, 400
+
+    return {
+        "complexity": result_json.get("complexity"),
+        "err": stderr_output
+    }, 200
+
+def ask_ai_job(params):
+    """Generate test cases for a validated /ask_ai request, returning (response body, HTTP status)"""
+    test_cases = []
+    for frame in ask_ai_frames(params, incremental=False):
+        if frame['type'] == "test_case":
+            test_cases.append(frame['test_case'])
+        elif frame['type'] == "error":
+            return {"err": frame['err']}, frame['status']
+        else:
+            done = frame
+
+    # Return the response with the generated test cases
+    logging.info("Successfully generated test cases.")
+    response = {key: value for key, value in done.items() if key not in ("type", "count")}
+    return dict(response, test_cases=test_cases), 200
+
+def ask_ai_frames(params, incremental=True):
+    """
+    Yield a {"type": "test_case"} frame per generated case, then one {"type": "done"} frame
+    saying where they came from, or a {"type": "error"} frame with the HTTP status to answer
+    with. With `incremental` the LLM's cases are sent as soon as the streamed reply completes them.
+    """
+    code = params['code']
+    strategy = params.get('strategy', 'ai')
+
+    # Log the received code (log only the first 30 characters of the code to prevent over-exposure of sensitive code)
+    logging.info(f"Received request to generate test cases ({strategy}) with code: {code[:30]}...")
+
+    local = None
+    seen = set()  # inputs already sent, so merged cases don't repeat them
+    if strategy in ('local', 'prepass'):
+        try:
+            local = generate_locally(params)
+        except (FunctionNameNotFoundError, LocalGenerationError, RunnerPoolError) as e:
+            logging.error(f"Local test case generation failed: {str(e)}")
+            if strategy == 'local':
+                yield {"type": "error", "err": str(e), "status": 400}
+                return
+        # the local cases take milliseconds, send them before waiting on the LLM
+        for case in local['test_cases'] if local is not None else ():
+            seen.add(json.dumps(case['input'], sort_keys=True))
+            yield {"type": "test_case", "test_case": case}
+    if strategy == 'local':
+        yield dict(local_summary(local), type="done", count=len(local['test_cases']))
+        return
+
+    sent = 0
+    cases = ai_case_stream(code, incremental)
+    try:
+        # Log before calling the AI to generate test cases
+        logging.info("Calling the AI to generate test cases.")
+        while True:
+            case = next(cases)
+            key = json.dumps(case.get('input') if isinstance(case, dict) else case, sort_keys=True)
+            if key in seen:
+                continue
+            seen.add(key)
+            sent += 1
+            yield {"type": "test_case", "test_case": case}
+    except StopIteration as stop:
+        partial_error = stop.value
+    except Exception as e:
+        logging.error(f"Error occurred while generating test cases: {str(e)}")
+
+        if strategy == 'fallback' and not sent:
+            try:
+                local = generate_locally(params)
+            except (FunctionNameNotFoundError, LocalGenerationError, RunnerPoolError) as local_error:
+                logging.error(f"Local test case generation failed: {str(local_error)}")
+            for case in local['test_cases'] if local is not None else ():
+                yield {"type": "test_case", "test_case": case}
+        if local is not None:
+            # the local cases stand in for the AI's, so the request still gets an answer
+            yield dict(local_summary(local), type="done", count=len(local['test_cases']), ai_error=str(e))
+            return
+
+        yield dict(ai_error_response(e), type="error")
+        return
+
+    done = {"type": "done", "generator": "ai", "count": len(seen)}
+    if local is not None:
+        done.update(local_summary(local), generator="ai+local")
+    if partial_error is not None:
+        # the reply broke off: the cases sent so far are kept rather than asked for again
+        done.update(partial=True, ai_error=partial_error)
+    yield done
+
+def ai_case_stream(code, incremental=True):
+    """
+    Yield the LLM's test cases for the code and return why the reply was cut short, if it was.
+    Incremental streams run the generation on a thread and pass cases over as they are parsed.
+    """
+    if not incremental:
+        test_cases, partial_error = generate_ai_test_cases(code)
+        logging.info("Generated test cases: %s", Truncated(test_cases[:5]))
+        yield from test_cases
+        return partial_error
+
+    parsed = queue.Queue()
+    outcome = {}
+
+    def generate():
+        try:
+            outcome['result'] = generate_ai_test_cases(code, on_case=parsed.put)
+        except Exception as e:
+            outcome['error'] = e
+        finally:
+            parsed.put(None)
+
+    threading.Thread(target=contextvars.copy_context().run, args=(generate,), name="ai-stream", daemon=True).start()
+    yield from iter(parsed.get, None)
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result'][1]
+
+def ai_error_response(e):
+    """The client-facing message and HTTP status for a failed test case generation"""
+    if isinstance(e, AISchedulerError):
+        # busy, unavailable or out of time: the request was fine, the client should retry later
+        return {"err": "The AI service is busy or unavailable. Please try again later.", "status": 503}
+
+    # Abstracted error message for the user
+    user_friendly_msg = "An error occurred while generating test cases. Please try again later."
+
+    # If it's a known issue (like bad input format or missing AI response), give a more specific message
+    if isinstance(e, ValueError) or isinstance(e, InvalidCodeError):
+        user_friendly_msg = "The input code seems to be invalid. Please check your code and try again."
+    elif isinstance(e, json.JSONDecodeError):
+        user_friendly_msg = "There was an issue processing the test cases response. Please try again."
+
+    # Return the abstracted error message to the user
+    return {"err": user_friendly_msg, "status": 500}
+
+def generate_and_verify_frames(params):
+    """
+    Run generated test cases on the submission while the rest are still being generated: cases
+    that arrive while the runner is busy go into its next run together. Yields a {"type": "result"}
+    frame per case, with "disagrees" set when the function ran but its output differs from the
+    generated expected_output, then one {"type": "summary"} frame. Local cases that only carry the
+    code's own observed_output have nothing to verify and are just counted. When nothing could be
+    run an {"type": "error"} frame with the HTTP status to answer with comes instead.
+    """
+    started = time.perf_counter()
+    generated = queue.Queue()
+    generation_finished = {}
+
+    def generate():
+        try:
+            for frame in ask_ai_frames(params):
+                generated.put(frame)
+        finally:
+            generation_finished['at'] = time.perf_counter()
+            generated.put(None)
+
+    threading.Thread(target=contextvars.copy_context().run, args=(generate,), name="verify-generate",
+                     daemon=True).start()
+
+    tests_summary = Testing.new_summary()
+    tests_summary['disagreements'] = 0
+    generation = {}
+    stderr_parts, runs = [], []
+    ran, invalid, observed = 0, 0, 0
+    finished = False
+    while not finished:
+        # wait for the next case, then take everything else that arrived in the meantime
+        frames = [generated.get()]
+        while True:
+            try:
+                frames.append(generated.get_nowait())
+            except queue.Empty:
+                break
+
+        cases = []
+        for frame in frames:
+            if frame is None:
+                finished = True
+            elif frame['type'] == "test_case":
+                case = frame['test_case']
+                if isinstance(case, dict) and 'input' in case and 'expected_output' in case:
+                    cases.append(case)
+                elif isinstance(case, dict) and 'observed_output' in case:
+                    observed += 1
+                else:
+                    invalid += 1
+            elif frame['type'] == "error":
+                if not ran and not cases:
+                    yield frame
+                    return
+                generation = {"error": frame['err']}
+            else:
+                generation = {key: value for key, value in frame.items() if key != "type"}
+        if not cases:
+            continue
+
+        run_started = time.perf_counter()
+        try:
+            result_json, stderr_output = get_runner_pool().run_cases(
+                params['code'], params['function_name'], [case['input'] for case in cases],
+                [case['expected_output'] for case in cases])
+        except RunnerPoolError as e:
+            yield {"type": "error", "err": f"Test runner failed: {e}", "status": error_status(e)}
+            return
+        runs.append((run_started, time.perf_counter()))
+        if "err" in result_json:
+            yield {"type": "error", "err": result_json['err'], "status": 400}
+            return
+
+        stderr_parts.append(stderr_output)
+        for result in result_json.get('results') or []:
+            result['test_case'] += ran
+            # a case that ran to completion but failed got a different output than the one generated
+            result['disagrees'] = result['status'] == 'Failed' and result['execution_time'] is not None
+            tests_summary['disagreements'] += result['disagrees']
+            Testing.record_result(tests_summary, result)
+            yield {"type": "result", "result": result}
+        ran += len(cases)
+
+    generation_end = generation_finished.get('at', time.perf_counter())
+    yield {
+        "type": "summary",
+        "tests_summary": tests_summary,
+        "generation": dict(generation, invalid_cases=invalid, observed_cases=observed),
+        "pipeline": {
+            "runs": len(runs),
+            "elapsed_s": round(time.perf_counter() - started, 3),
+            "generation_s": round(generation_end - started, 3),
+            "execution_s": round(sum(end - start for start, end in runs), 3),
+            # runner time spent while the LLM was still writing
+            "overlap_s": round(sum(max(0.0, min(end, generation_end) - start) for start, end in runs), 3)
+        },
+        "err": ''.join(stderr_parts)
+    }
+
+def generate_and_verify_job(params):
+    """Generate and run test cases for a validated /generate_and_verify request"""
+    results = []
+    for frame in generate_and_verify_frames(params):
+        if frame['type'] == "result":
+            results.append(frame['result'])
+        elif frame['type'] == "error":
+            return {"err": frame['err']}, frame['status']
+        else:
+            summary = frame
+    return dict({key: value for key, value in summary.items() if key != "type"}, results=results), 200
+
+def generate_locally(params):
+    """
+    Edge-case test cases from the local generator for an /ask_ai request, run on a pooled runner.
+    Their expected_output comes from the request's reference_code; without one they only carry the
+    code's own observed_output. Raises FunctionNameNotFoundError, LocalGenerationError or RunnerPoolError.
+    """
+    code = params['code']
+    function_name = extract_function_name(code)
+    options = {key: params[key] for key in ("seed", "reference_code", "reference_function") if key in params}
+    result_json, stderr_output = get_runner_pool().execute({
+        "kind": "generate",
+        "code": code,
+        "function_name": function_name,
+        "options": options
+    })
+    if "err" in result_json:
+        raise LocalGenerationError(result_json['err'])
+    return result_json['generated']
+
+def local_summary(local):
+    """What the local generator adds to an /ask_ai answer, including where its cases' outputs come from"""
+    return {
+        "failures": local['failures'],
+        "input_kind": local['input_kind'],
+        "outputs": local['outputs'],
+        "seed": local['seed'],
+        "generator": "local"
+    }
+
+def add_debug_logs_job(params):
+    try:
+        if params.get('mode') == 'ai':
+            # opt-in: the LLM keeps comments and layout, but takes seconds and may change behavior
+            updated_code = add_debug_logs_with_ai(params['code'])
+        else:
+            updated_code = add_debug_logs_locally(params['code'], **params.get('options', {}))
+        response = {"updated_code": updated_code}
+    except AISchedulerError as e:
+        logging.error(f"AI debug logs not added: {e}")
+        response = ai_error_response(e)
+        return {"err": response['err']}, response['status']
     except Exception as e:
-        return {"error": f"Subprocess execution failed: {e}"}, str(e)
+        response = {"err": str(e)}
+
+    return response, 200
+
+
+# job kind -> (request body -> job params) and the handler that runs it, in the lane of its slowest wait
+JOB_PARAMS = {"runtests": runtests_params, "batch": batch_params, "complexity": complexity_params,
+              "ask_ai": ask_ai_params, "generate_and_verify": verify_params, "add_debug_logs": debug_logs_params}
+for kind, handler, lane in (("runtests", runtests_job, "runner"), ("batch", batch_job, "runner"),
+                            ("complexity", complexity_job, "runner"), ("ask_ai", ask_ai_job, "ai"),
+                            ("generate_and_verify", generate_and_verify_job, "ai"),
+                            ("add_debug_logs", add_debug_logs_job, "ai")):
+    get_job_queue().register(kind, handler, lane)
+
+
+def job_time_limit(kind, params):
+    """Seconds a job of this kind can take once started, from the runner and LLM limits it runs under"""
+    runner_limit = RUNNER_JOB_TIMEOUT + RUNNER_KILL_GRACE
+    if kind == "batch":
+        # every runner grades its share of the submissions with the per-job limit for each
+        share = math.ceil(len(params['submissions']) / get_runner_pool().size)
+        return RUNNER_JOB_TIMEOUT * share + RUNNER_KILL_GRACE
+    if kind in ("runtests", "complexity"):
+        return runner_limit
+    if kind == "add_debug_logs":
+        return AI_REQUEST_DEADLINE if params.get('mode') == 'ai' else 0
+    # ask_ai and generate_and_verify: the LLM call plus a runner job for local or verified cases
+    return AI_REQUEST_DEADLINE + runner_limit
+
+def run_as_job(kind, params):
+    """
+    Answer a request synchronously: the job runs on the job queue while this worker waits for it,
+    for at most the job's time limit plus SYNC_WAIT_SLACK. A job still running by then is kept,
+    and the client gets 504 with the id to fetch it from /jobs/<id> later.
+    """
+    wait = job_time_limit(kind, params) + SYNC_WAIT_SLACK
+    job_queue = get_job_queue()
+    try:
+        job = job_queue.submit(kind, params, keep=False)
+    except JobQueueFullError as e:
+        return jsonify({"err": str(e)}), 503
+    if not job.done.wait(wait):
+        job_queue.keep(job)
+        location = url_for('get_job', job_id=job.id)
+        logging.error(f"{kind} job {job.id} still running after {wait:.0f}s, answering 504")
+        return jsonify({"err": f"The {kind} job did not finish within {wait:.0f}s; fetch its result from {location}.",
+                        "id": job.id, "location": location}), 504, {"Location": location}
+    return jsonify(job.result), job.http_status
+
+
+@app.before_request
+def start_timing():
+    g.request_started = time.perf_counter()
+    metrics.start_request_timing()
+
+
+@app.after_request
+def record_request(response):
+    """Count the request, observe its latency and tell the client where the time went"""
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unknown'
+    HTTP_REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    HTTP_LATENCY.observe(elapsed, endpoint=endpoint)
+    response.headers['Server-Timing'] = metrics.server_timing_header(elapsed)
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Brotli or gzip encode sizeable responses for clients that accept it; streams are left alone"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    if brotli is not None and request.accept_encodings.quality('br') > 0:
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings.quality('gzip') > 0:
+        response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
+    return response
 
 
 @app.route('/', methods=['GET'])
@@ -84,81 +880,171 @@ def home():
                     "developer": "Shenile A"}), 200
 
 
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        "result_cache": get_result_cache().stats(),
+        "runner_pool": get_runner_pool().stats(),
+        "code_cache": code_cache_stats(),
+        "ai_generation": generation_stats(),
+        "jobs": get_job_queue().stats()
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of the request, stage, cache, runner pool, AI and job metrics"""
+    collect_cache_metrics()
+    get_runner_pool().collect_metrics()
+    get_ai_scheduler().collect_metrics()
+    get_job_queue().collect_metrics()
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/runtests', methods=['POST'])
 def execute_code():
     data = request.json
-    user_code = data.get('code', '')
-    input_str = data.get('inputString', '')
-    output_str = data.get('outputString', '')
+    # 'ndjson' (or true) / 'sse' streams each result as soon as its test case finishes
+    stream = data.get('stream') or request.args.get('stream')
 
     try:
-        # Validate and process inputs and outputs
-        input_list, output_list = validate_and_process_input_output(input_str, output_str)
+        params = runtests_params(data)
     except ValidationException as e:
         logging.error(f"Validation error: {str(e)}")
         return jsonify({"error": str(e)}), 400
 
-    result_json, stderr_output = handle_test_execution(user_code, input_list, output_list)
+    if stream:
+        return stream_response(stream_test_execution(params['code'], params['inputString'], params['outputString'],
+                                                     params['options']), stream)
 
-    if "err" in result_json:
-         return jsonify(result_json), 400
+    return run_as_job("runtests", params)
 
-    logging.info(f'result_json {result_json}')
-    return jsonify({
-        "results": result_json.get("results", []),
-        "tests_summary": result_json.get("tests_summary", {}),
-        "err": stderr_output
-    }), 200
+
+@app.route('/runtests/batch', methods=['POST'])
+def execute_batch():
+    """
+    Grade many submissions against one test suite: the /runtests body with "submissions" (code
+    strings or {"id", "code"} objects) instead of "code". Results are compact unless format=full.
+    """
+    data = request.json or {}
+    stream = data.get('stream') or request.args.get('stream')
+
+    try:
+        params = batch_params(data)
+    except ValidationException as e:
+        logging.error(f"Validation error: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        return stream_response(batch_test_execution(params['submissions'], params['inputString'],
+                                                    params['outputString'], params['options']), stream)
+
+    return run_as_job("batch", params)
+
+
+@app.route('/complexity', methods=['POST'])
+def estimate_time_complexity():
+    try:
+        params = complexity_params(request.json or {})
+    except (ValidationException, FunctionNameNotFoundError) as e:
+        logging.error(f"Validation error: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+    return run_as_job("complexity", params)
 
 
 @app.route('/ask_ai', methods=['POST'])
 def generate_test_case():
-    data = request.json
-    code = data.get('code', '')
-
-    # Log the received code (log only the first 30 characters of the code to prevent over-exposure of sensitive code)
-    logging.info(f"Received request to generate test cases with code: {code[:30]}...")
+    data = request.json or {}
+    # 'ndjson' (or true) / 'sse' sends each test case as soon as the LLM has written it
+    stream = data.get('stream') or request.args.get('stream')
 
     try:
-        # Log before calling ask_ai to generate test cases
-        logging.info("Calling ask_ai to generate test cases.")
-        test_cases = ask_ai(code)
-        logging.info(
-            f"Generated test cases: {test_cases[:5]}...")  # Log a preview of the first 5 test cases to avoid large logs
+        params = ask_ai_params(data)
+    except ValidationException as e:
+        logging.error(f"Validation error: {str(e)}")
+        return jsonify({"error": str(e)}), 400
 
-    except Exception as e:
-        logging.error(f"Error occurred while generating test cases: {str(e)}")
+    if stream:
+        return stream_response(ask_ai_frames(params), stream)
 
-        # Abstracted error message for the user
-        user_friendly_msg = "An error occurred while generating test cases. Please try again later."
+    return run_as_job("ask_ai", params)
 
-        # If it's a known issue (like bad input format or missing AI response), give a more specific message
-        if isinstance(e, ValueError) or isinstance(e, InvalidCodeError):
-            user_friendly_msg = "The input code seems to be invalid. Please check your code and try again."
-        elif isinstance(e, json.JSONDecodeError):
-            user_friendly_msg = "There was an issue processing the test cases response. Please try again."
+@app.route('/generate_and_verify', methods=['POST'])
+def generate_and_verify():
+    """
+    Generate test cases (same body as /ask_ai) and run them on the code as they arrive, flagging
+    the cases whose output disagrees with the generated expected_output.
+    """
+    data = request.json or {}
+    stream = data.get('stream') or request.args.get('stream')
 
-        # Return the abstracted error message to the user
-        return jsonify({"err": user_friendly_msg}), 500
+    try:
+        params = verify_params(data)
+    except (ValidationException, FunctionNameNotFoundError) as e:
+        logging.error(f"Validation error: {str(e)}")
+        return jsonify({"error": str(e)}), 400
 
-    # Return the response with the generated test cases
-    logging.info("Successfully generated test cases.")
-    return jsonify({
-        "test_cases": test_cases
-    }), 200
+    if stream:
+        return stream_response(generate_and_verify_frames(params), stream)
+
+    return run_as_job("generate_and_verify", params)
 
 @app.route('/add_debug_logs', methods=['POST'])
 def add_debug_logs():
-    data = request.json
-    code = data.get("code")
+    try:
+        params = debug_logs_params(request.json or {})
+    except ValidationException as e:
+        logging.error(f"Validation error: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+    return run_as_job("add_debug_logs", params)
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue a runtests, batch, complexity, ask_ai, generate_and_verify or add_debug_logs request
+    (same body as the endpoint, plus "kind") and answer 202 with its id straight away; fetch the
+    result from /jobs/<id>.
+    """
+    data = request.json or {}
+    kind = data.get('kind') or request.args.get('kind')
+    if kind not in JOB_PARAMS:
+        return jsonify({"error": f"kind should be one of {sorted(JOB_PARAMS)}."}), 400
 
     try:
-        updated_code = add_debug_logs_with_ai(code)
-        response = {"updated_code": updated_code}
-    except Exception as e:
-        response = {"err": str(e)}
+        params = JOB_PARAMS[kind](data)
+    except (ValidationException, FunctionNameNotFoundError) as e:
+        logging.error(f"Validation error: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        job = get_job_queue().submit(kind, params)
+    except JobQueueFullError as e:
+        return jsonify({"err": str(e)}), 503
+
+    location = url_for('get_job', job_id=job.id)
+    return jsonify({"id": job.id, "kind": kind, "status": job.status, "location": location}), 202, \
+        {"Location": location}
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """The job's status, and once finished its response body and HTTP status; ?wait=<seconds> long-polls"""
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        wait = math.nan
+    if not math.isfinite(wait):
+        return jsonify({"error": "wait should be a number of seconds."}), 400
+    wait = min(max(wait, 0), JOB_MAX_WAIT)
+
+    job = get_job_queue().get(job_id, wait)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job id."}), 404
+    return jsonify(job), 200
 
-    return jsonify(response)
 
 if __name__ == '__main__':
     app.run(port=5000)
@@ -0,0 +1,181 @@
+"""
+Local stand-in for the Mistral chat completion API, for load tests and offline benchmarks.
+Point the app at it with MISTRAL_SERVER_URL=http://127.0.0.1:<port> and any API_KEY:
+
+    python benchmarks/fake_llm.py [--port 8765] [--latency-ms 300] [--jitter-ms 100]
+                                  [--error-rate 0.0] [--malformed-rate 0.0] [--truncate-rate 0.0]
+                                  [--seed 0]
+
+Streamed requests ("stream": true) get the reply as server-sent chunks spread over the latency.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+TEST_CASES_REPLY = """Here are the test cases:
+[
+    {"input": [3, 1, 2], "expected_output": [1, 2, 3]},
+    {"input": [], "expected_output": []},
+    {"input": [1], "expected_output": [1]},
+    {"input": [5, 5, 5], "expected_output": [5, 5, 5]},
+    {"input": [-1, 0, -3], "expected_output": [-3, -1, 0]},
+]"""
+
+DEBUG_LOGS_REPLY = """```python
+import logging
+
+def solution(nums):
+    logging.debug(f"solution called with {nums}")
+    result = sorted(nums)
+    logging.debug(f"solution returns {result}")
+    return result
+```"""
+
+MALFORMED_REPLY = "I could not come up with test cases for this function."
+
+STREAM_CHUNK_CHARS = 24  # characters of the reply per streamed chunk
+
+
+class FakeLLMSettings:
+    def __init__(self, latency_ms: float = 300, jitter_ms: float = 100, error_rate: float = 0.0,
+                 malformed_rate: float = 0.0, seed: int = 0, truncate_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.truncate_rate = truncate_rate  # streams that stop halfway through the reply
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def draw(self):
+        """Pick (delay in seconds, outcome) for one request"""
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            roll = self.random.random()
+        if roll < self.error_rate:
+            return delay, "error"
+        if roll < self.error_rate + self.malformed_rate:
+            return delay, "malformed"
+        if roll < self.error_rate + self.malformed_rate + self.truncate_rate:
+            return delay, "truncated"
+        return delay, "ok"
+
+
+def make_handler(settings: FakeLLMSettings):
+    class ChatCompletionHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            delay, outcome = settings.draw()
+            streamed = bool(body.get('stream'))
+            if not streamed:
+                time.sleep(delay)
+
+            if outcome == "error":
+                with settings.lock:
+                    settings.errors += 1
+                self._reply(503, {"message": "fake upstream overloaded"})
+                return
+
+            prompt = body.get('messages', [{}])[0].get('content', '')
+            if outcome == "malformed":
+                content = MALFORMED_REPLY
+            elif 'debug logs' in prompt:
+                content = DEBUG_LOGS_REPLY
+            else:
+                content = TEST_CASES_REPLY
+            if streamed:
+                self._stream(body, content, delay, truncated=outcome == "truncated")
+                return
+            self._reply(200, {
+                "id": "fake-completion",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get('model', 'fake'),
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(prompt) + len(content)) // 4},
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}]
+            })
+
+        def _reply(self, status: int, payload: dict):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, body: dict, content: str, delay: float, truncated: bool):
+            """Send the reply as chat.completion.chunk events, spread evenly over `delay`"""
+            pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+            if truncated:
+                pieces = pieces[:len(pieces) // 2]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            for piece in pieces:
+                time.sleep(delay / max(len(pieces), 1))
+                self._event({"id": "fake-completion", "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": body.get('model', 'fake'),
+                             "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece},
+                                          "finish_reason": None}]})
+            if truncated:
+                return  # the connection drops without a final chunk
+            self._event({"id": "fake-completion", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": body.get('model', 'fake'),
+                         "choices": [{"index": 0, "delta": {"content": ""}, "finish_reason": "stop"}]})
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def _event(self, payload: dict):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+            self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    return ChatCompletionHandler
+
+
+def start(port: int = 8765, settings: FakeLLMSettings = None) -> ThreadingHTTPServer:
+    """Serve the fake API on a background thread and return the server (call .shutdown() to stop)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(settings or FakeLLMSettings()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Mistral chat completion server")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=300, help='mean response delay')
+    parser.add_argument('--jitter-ms', type=float, default=100, help='standard deviation of the delay')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 503')
+    parser.add_argument('--malformed-rate', type=float, default=0.0,
+                        help='fraction of requests answered without a test case list')
+    parser.add_argument('--truncate-rate', type=float, default=0.0,
+                        help='fraction of streamed replies that stop halfway through')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    settings = FakeLLMSettings(args.latency_ms, args.jitter_ms, args.error_rate, args.malformed_rate, args.seed,
+                               args.truncate_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(settings))
+    print(f"Fake LLM listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
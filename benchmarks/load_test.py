@@ -0,0 +1,421 @@
+"""
+Load test the app end to end: start it (Flask dev server or gunicorn) against the fake LLM
+server, drive /runtests, /ask_ai and /add_debug_logs with a mix of submissions at each
+concurrency level, and report req/s, latency percentiles and per-process memory:
+
+    python benchmarks/load_test.py [--server gunicorn] [--concurrency 1,4,16] [--duration 20]
+                                   [--mix runtests=0.8,ask_ai=0.15,add_debug_logs=0.05]
+                                   [--cache-hit-ratio 0.3] [--llm-latency-ms 300] [--llm-error-rate 0]
+                                   [--output results.json] [--save-baseline PATH | --compare PATH]
+
+Numbers depend on the machine, so keep baselines local: save one on the base commit, then
+run --compare with the change applied. The exit status is 1 when a level regressed by more
+than --tolerance, and 2 when the baseline shares no concurrency level with the run.
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import argparse
+import threading
+import subprocess
+from collections import defaultdict
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_llm  # noqa: E402
+
+ENDPOINTS = ('runtests', 'ask_ai', 'add_debug_logs')
+STARTUP_TIMEOUT = 30  # seconds to wait for the app to answer GET /
+REQUEST_TIMEOUT = 120
+
+
+def _sort(case):
+    return sorted(case)
+
+def _total(case):
+    return sum(case)
+
+def _max_subarray(case):
+    best = current = case[0]
+    for value in case[1:]:
+        current = max(value, current + value)
+        best = max(best, current)
+    return best
+
+def _dedupe(case):
+    return list(dict.fromkeys(case))
+
+
+# (name, weight, code, reference used to build the expected outputs, cases, list length)
+SUBMISSIONS = [
+    ("sort", 4, '''def sort_numbers(nums):
+    return sorted(nums)
+''', _sort, 20, 200),
+    ("sum", 3, '''def total(nums):
+    result = 0
+    for num in nums:
+        result += num
+    return result
+''', _total, 50, 100),
+    ("kadane", 2, '''def max_subarray(nums):
+    best = current = nums[0]
+    for num in nums[1:]:
+        current = max(num, current + num)
+        best = max(best, current)
+    return best
+''', _max_subarray, 30, 500),
+    ("dedupe", 2, '''def dedupe(nums):
+    seen = set()
+    out = []
+    for num in nums:
+        if num not in seen:
+            seen.add(num)
+            out.append(num)
+    return out
+''', _dedupe, 30, 300),
+    ("bubble_sort", 1, '''def bubble_sort(nums):
+    nums = list(nums)
+    for i in range(len(nums)):
+        for j in range(len(nums) - i - 1):
+            if nums[j] > nums[j + 1]:
+                nums[j], nums[j + 1] = nums[j + 1], nums[j]
+    return nums
+''', _sort, 10, 400),
+    ("wrong_answer", 1, '''def sort_desc(nums):
+    return sorted(nums, reverse=True)
+''', _sort, 20, 100),
+    ("raises", 1, '''def mean_of_large(nums):
+    large = [num for num in nums if num > 1000]
+    return sum(large) / len(large)
+''', _total, 20, 50),
+]
+
+
+def build_cases(reference, cases: int, size: int, rng: random.Random):
+    inputs = [[rng.randint(-1000, 1000) for _ in range(size)] for _ in range(cases)]
+    return json.dumps(inputs), json.dumps([reference(case) for case in inputs])
+
+
+class Workload:
+    """Picks the next request. A cache miss adds a docstring, which changes both the code hash and the AST"""
+
+    def __init__(self, mix: dict, cache_hit_ratio: float, seed: int):
+        rng = random.Random(seed)
+        self.mix = mix
+        self.cache_hit_ratio = cache_hit_ratio
+        self.submissions = [(name, weight, code, *build_cases(reference, cases, size, rng))
+                            for name, weight, code, reference, cases, size in SUBMISSIONS]
+        self._variant = 0
+        self._lock = threading.Lock()
+
+    def _code(self, code: str, rng: random.Random) -> str:
+        if rng.random() < self.cache_hit_ratio:
+            return code
+        with self._lock:
+            self._variant += 1
+            variant = self._variant
+        header, body = code.split('\n', 1)
+        return f'{header}\n    """variant {variant}"""\n{body}'
+
+    def next_request(self, rng: random.Random):
+        endpoint = rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        name, _, code, input_string, output_string = rng.choices(
+            self.submissions, weights=[submission[1] for submission in self.submissions])[0]
+        body = {"code": self._code(code, rng)}
+        if endpoint == 'runtests':
+            body.update(inputString=input_string, outputString=output_string)
+        return endpoint, name, body
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def _read_status(pid: int) -> dict:
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                key, _, value = line.partition(':')
+                if key in ('PPid', 'VmRSS', 'VmHWM'):
+                    fields[key] = int(value.split()[0])
+        with open(f'/proc/{pid}/cmdline', 'rb') as cmdline:
+            fields['cmdline'] = cmdline.read().replace(b'\0', b' ').decode(errors='replace').strip()
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return {}
+    return fields
+
+
+def process_tree_memory(root_pid: int) -> dict:
+    """RSS and peak RSS in MB for the app process and everything it started, grouped by role"""
+    if not os.path.isdir('/proc'):
+        return {}
+    processes = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            status = _read_status(int(entry))
+            if status:
+                processes[int(entry)] = status
+
+    tree, frontier = set(), [root_pid]
+    while frontier:
+        pid = frontier.pop()
+        if pid in processes and pid not in tree:
+            tree.add(pid)
+            frontier.extend(child for child, status in processes.items() if status.get('PPid') == pid)
+
+    roles = defaultdict(lambda: {"processes": 0, "rss_mb": 0.0, "peak_rss_mb": 0.0, "max_process_peak_mb": 0.0})
+    for pid in tree:
+        status = processes[pid]
+        cmdline = status.get('cmdline', '')
+        if 'run_tests.py' in cmdline:
+            role = 'runner'
+        elif pid == root_pid:
+            role = 'app'
+        else:
+            role = 'app_worker'
+        peak = status.get('VmHWM', 0) / 1024
+        stats = roles[role]
+        stats["processes"] += 1
+        stats["rss_mb"] += status.get('VmRSS', 0) / 1024
+        stats["peak_rss_mb"] += peak
+        stats["max_process_peak_mb"] = max(stats["max_process_peak_mb"], peak)
+    return {role: {key: round(value, 1) for key, value in stats.items()} for role, stats in roles.items()}
+
+
+def start_app(args, llm_url: str) -> subprocess.Popen:
+    env = dict(os.environ, API_KEY="fake-key", MISTRAL_SERVER_URL=llm_url, LOG_LEVEL=args.log_level,
+               PYTHONPATH=ROOT)
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--worker-class', 'gthread',
+                   '--workers', str(args.workers), '--threads', str(args.threads),
+                   '--bind', f'127.0.0.1:{args.port}', '--timeout', str(REQUEST_TIMEOUT), 'app:app']
+    else:
+        command = [sys.executable, '-c',
+                   f'from app import app; app.run(port={args.port}, threaded=True)']
+    process = subprocess.Popen(command, cwd=ROOT, env=env, start_new_session=True,
+                               stdout=subprocess.DEVNULL, stderr=None if args.show_server_log else subprocess.DEVNULL)
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited during startup with status {process.returncode}")
+        try:
+            httpx.get(f'http://127.0.0.1:{args.port}/', timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    stop_app(process)
+    raise RuntimeError(f"App did not answer within {STARTUP_TIMEOUT}s")
+
+
+def stop_app(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def run_level(base_url: str, workload: Workload, concurrency: int, duration: float, warmup: float, seed: int):
+    """Closed-loop load: every client sends its next request as soon as the previous one is answered"""
+    samples = []  # (endpoint, seconds, ok)
+    samples_lock = threading.Lock()
+    start = time.monotonic()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def client_loop(index: int):
+        rng = random.Random(seed * 1000 + index)
+        local = []
+        with httpx.Client(base_url=base_url, timeout=REQUEST_TIMEOUT) as client:
+            while True:
+                sent = time.monotonic()
+                if sent >= stop_at:
+                    break
+                endpoint, _, body = workload.next_request(rng)
+                try:
+                    response = client.post(f'/{endpoint}', json=body)
+                    # /runtests always carries the submission's stderr as "err", the AI endpoints only on failure
+                    ok = response.status_code == 200 and (endpoint == 'runtests' or 'err' not in response.json())
+                except (httpx.HTTPError, ValueError):
+                    ok = False
+                finished = time.monotonic()
+                if sent >= measure_from and finished <= stop_at:
+                    local.append((endpoint, finished - sent, ok))
+        with samples_lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def summarize(samples, duration: float) -> dict:
+    by_endpoint = defaultdict(list)
+    for endpoint, seconds, ok in samples:
+        by_endpoint[endpoint].append((seconds, ok))
+        by_endpoint['all'].append((seconds, ok))
+
+    summary = {}
+    for endpoint, entries in by_endpoint.items():
+        latencies = sorted(seconds * 1000 for seconds, _ in entries)
+        summary[endpoint] = {
+            "requests": len(entries),
+            "errors": sum(1 for _, ok in entries if not ok),
+            "rps": round(len(entries) / duration, 2),
+            "p50_ms": round(percentile(latencies, 0.50), 1),
+            "p95_ms": round(percentile(latencies, 0.95), 1),
+            "p99_ms": round(percentile(latencies, 0.99), 1),
+        }
+    return summary
+
+
+def print_level(concurrency: int, summary: dict, memory: dict):
+    print(f"\nconcurrency {concurrency}")
+    print(f"  {'endpoint':<16} {'requests':>8} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint in (*ENDPOINTS, 'all'):
+        if endpoint in summary:
+            s = summary[endpoint]
+            print(f"  {endpoint:<16} {s['requests']:>8} {s['errors']:>7} {s['rps']:>8.2f} "
+                  f"{s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}")
+    for role, stats in sorted(memory.items()):
+        print(f"  memory {role:<11} {stats['processes']} process(es), rss {stats['rss_mb']:.1f} MB, "
+              f"peak {stats['peak_rss_mb']:.1f} MB (largest {stats['max_process_peak_mb']:.1f} MB)")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> tuple:
+    """
+    Regressions beyond `tolerance` (a fraction) in throughput, p95 latency or peak memory, and
+    the concurrency levels that could be compared at all (the baseline has to include them)
+    """
+    regressions, compared = [], []
+    for level, current in results["levels"].items():
+        before = baseline.get("levels", {}).get(level)
+        if before is None:
+            continue
+        compared.append(level)
+        for endpoint, stats in current["latency"].items():
+            old = before["latency"].get(endpoint)
+            if not old:
+                continue
+            if stats["rps"] < old["rps"] * (1 - tolerance):
+                regressions.append(f"c={level} {endpoint}: {old['rps']} -> {stats['rps']} req/s")
+            if stats["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+                regressions.append(f"c={level} {endpoint}: p95 {old['p95_ms']} -> {stats['p95_ms']} ms")
+        for role, stats in current["memory"].items():
+            old = before["memory"].get(role)
+            if old and stats["max_process_peak_mb"] > old["max_process_peak_mb"] * (1 + tolerance):
+                regressions.append(f"c={level} {role}: peak {old['max_process_peak_mb']} -> "
+                                   f"{stats['max_process_peak_mb']} MB")
+    return regressions, compared
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(','):
+        endpoint, _, weight = part.partition('=')
+        if endpoint not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {endpoint!r}, expected one of {ENDPOINTS}")
+        mix[endpoint] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the app against a fake LLM server")
+    parser.add_argument('--server', choices=('flask', 'gunicorn'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--concurrency', default='1,4,16', help='comma separated client counts, one run each')
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds per concurrency level')
+    parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds before each level')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('runtests=0.8,ask_ai=0.15,add_debug_logs=0.05'))
+    parser.add_argument('--cache-hit-ratio', type=float, default=0.3,
+                        help='fraction of requests that repeat a submission verbatim')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--llm-port', type=int, default=8765)
+    parser.add_argument('--llm-latency-ms', type=float, default=300)
+    parser.add_argument('--llm-jitter-ms', type=float, default=100)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-malformed-rate', type=float, default=0.0)
+    parser.add_argument('--log-level', default='WARNING', help='LOG_LEVEL for the app')
+    parser.add_argument('--show-server-log', action='store_true')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--save-baseline', metavar='PATH', help='store the results as a baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a stored baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative regression')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    settings = fake_llm.FakeLLMSettings(args.llm_latency_ms, args.llm_jitter_ms, args.llm_error_rate,
+                                        args.llm_malformed_rate, args.seed)
+    llm_server = fake_llm.start(args.llm_port, settings)
+    app_process = start_app(args, f'http://127.0.0.1:{args.llm_port}')
+    workload = Workload(args.mix, args.cache_hit_ratio, args.seed)
+    results = {"config": {key: value for key, value in vars(args).items()
+                          if key not in ('output', 'save_baseline', 'compare', 'show_server_log')},
+               "levels": {}}
+
+    try:
+        base_url = f'http://127.0.0.1:{args.port}'
+        print(f"{args.server} app on {base_url}, fake LLM at {args.llm_latency_ms:.0f}±{args.llm_jitter_ms:.0f} ms, "
+              f"mix {args.mix}, cache hit ratio {args.cache_hit_ratio}")
+        for concurrency in levels:
+            samples = run_level(base_url, workload, concurrency, args.duration, args.warmup, args.seed + concurrency)
+            summary = summarize(samples, args.duration)
+            memory = process_tree_memory(app_process.pid)
+            results["levels"][str(concurrency)] = {"latency": summary, "memory": memory}
+            print_level(concurrency, summary, memory)
+        results["llm_requests"] = settings.requests
+    finally:
+        stop_app(app_process)
+        llm_server.shutdown()
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+    if args.save_baseline:
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        changed = [key for key, value in results["config"].items() if baseline.get("config", {}).get(key) != value]
+        if changed:
+            print(f"\nWarning: the baseline was run with different settings ({', '.join(changed)})")
+        regressions, compared = compare(results, baseline, args.tolerance)
+        missing = [level for level in results["levels"] if level not in compared]
+        if not compared:
+            print(f"\nNothing compared: {args.compare} has none of the concurrency levels run "
+                  f"({', '.join(results['levels'])}), it has {', '.join(baseline.get('levels', {})) or 'none'}")
+            sys.exit(2)
+        print(f"\nCompared {len(compared)} of {len(results['levels'])} concurrency level(s) against {args.compare}")
+        if missing:
+            print(f"Warning: not in the baseline, so not compared: concurrency {', '.join(missing)}")
+        if regressions:
+            print(f"\nRegressions beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Compare /runtests response size and latency for the full and compact formats, with and
+without compression. Runs the app in-process against the real runner pool:
+
+    python benchmarks/response_format.py [--cases 200] [--size 2000] [--repeat 5]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# keep the numbers about encoding, not about replaying cached results or logging them
+os.environ.setdefault("RESULT_CACHE_SIZE", "0")
+
+import logging
+logging.disable(logging.INFO)
+
+from app import app, get_runner_pool  # noqa: E402
+
+USER_CODE = '''def sort_numbers(nums):
+    return sorted(nums)
+'''
+
+
+def build_request(cases: int, size: int) -> dict:
+    inputs = [[(i * 7919 + j * 104729) % (size * 10) for j in range(size)] for i in range(cases)]
+    outputs = [sorted(case) for case in inputs]
+    return {"code": USER_CODE, "inputString": json.dumps(inputs), "outputString": json.dumps(outputs),
+            "memory": False}
+
+
+def measure(client, body: dict, response_format: str, encoding: str, repeat: int):
+    headers = {"Accept-Encoding": encoding}
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.post(f'/runtests?format={response_format}', json=body, headers=headers)
+        size = len(response.get_data())
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.get_data()[:200]
+    return size, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--cases', type=int, default=200, help='test cases per request')
+    parser.add_argument('--size', type=int, default=2000, help='list length of every input')
+    parser.add_argument('--repeat', type=int, default=5, help='requests per configuration, the median is shown')
+    args = parser.parse_args()
+
+    body = build_request(args.cases, args.size)
+    client = app.test_client()
+    # warm the runners up before timing anything
+    client.post('/runtests', json=body)
+
+    print(f"{args.cases} cases of {args.size} ints, median of {args.repeat} requests\n")
+    print(f"{'format':<8} {'encoding':<9} {'bytes':>12} {'ms':>9}")
+    baseline = None
+    for response_format in ('full', 'compact'):
+        for encoding in ('identity', 'gzip', 'br'):
+            size, latency = measure(client, body, response_format, encoding, args.repeat)
+            baseline = baseline or (size, latency)
+            print(f"{response_format:<8} {encoding:<9} {size:>12,} {latency:>9.1f}"
+                  f"   ({100 * size / baseline[0]:5.1f}% size, {100 * latency / baseline[1]:5.1f}% time)")
+
+    get_runner_pool().close()
+
+
+if __name__ == '__main__':
+    main()
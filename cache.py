@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from utils import configure_logging
+from metrics import Counter, Gauge
+
+# Set up logging configuration
+configure_logging()
+
+# Result cache settings (overridable through the environment)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 1024))  # max entries kept in memory
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # max serialized bytes in memory
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 3600))  # seconds an entry stays valid
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")  # sqlite file for the on-disk tier, empty to disable
+
+# AI test case cache settings
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", 512))  # max generations kept in memory
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", 24 * 3600))  # seconds before a generation is asked for again
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "")  # sqlite file for the on-disk tier, empty to disable
+
+# Metrics, mirrored from the caches' own counters when scraped
+CACHE_REQUESTS = Counter("ecm_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+CACHE_EVICTIONS = Counter("ecm_cache_evictions_total", "Entries dropped to stay within the cache limits", ("cache",))
+CACHE_ENTRIES = Gauge("ecm_cache_entries", "Entries held in memory", ("cache",))
+CACHE_BYTES = Gauge("ecm_cache_bytes", "Serialized bytes held in memory", ("cache",))
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL, bounded by entry count and serialized size.
+    Values are stored as JSON so callers always get their own copy back. When `disk_path`
+    is set, entries are also written to a SQLite file and survive restarts.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, max_bytes: Optional[int] = None,
+                 disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, serialized)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires_at REAL, value TEXT)")
+            self._db.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                self._remove(key)
+                entry = None
+
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT expires_at, value FROM cache WHERE key = ? AND expires_at >= ?",
+                                       (key, now)).fetchone()
+                if row is not None:
+                    entry = row
+                    self._insert(key, entry)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            serialized = entry[1]
+
+        return json.loads(serialized)
+
+    def set(self, key: str, value: Any):
+        serialized = json.dumps(value, separators=(',', ':'))
+        if self.max_bytes is not None and len(serialized) > self.max_bytes:
+            logging.info(f"Not caching {key[:12]}: {len(serialized)} bytes is over the cache size limit")
+            return
+
+        entry = (time.time() + self.ttl, serialized)
+        with self._lock:
+            self._insert(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO cache (key, expires_at, value) VALUES (?, ?, ?)",
+                                 (key, entry[0], entry[1]))
+                self._db.commit()
+
+    def _insert(self, key: str, entry: tuple):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += len(entry[1])
+
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, serialized = self._entries.pop(key)
+        self._bytes -= len(serialized)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk": self._db is not None
+            }
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one: the first caller runs the function,
+    everyone who arrives while it is in flight waits for and shares its result (or exception).
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls: Dict[str, "SingleFlight._Call"] = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"in_flight": len(self._calls), "shared": self.shared}
+
+
+def normalize_code(user_code: str) -> str:
+    """Drop differences that can't change behaviour: line endings, trailing spaces and blank lines"""
+    lines = user_code.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip('\n')
+
+def result_cache_key(user_code: str, function_name: str, input_data: str, output_data: str,
+                     options: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Content address of a test run: the normalized code, the raw test data strings and the run options.
+    The test data is hashed as received, without being decoded or serialized again.
+    """
+    header = json.dumps([normalize_code(user_code), function_name, options or {}, len(input_data)],
+                        separators=(',', ':'), sort_keys=True)
+    digest = hashlib.sha256(header.encode())
+    digest.update(b'\0')
+    digest.update(input_data.encode())
+    digest.update(b'\0')
+    digest.update(output_data.encode())
+    return digest.hexdigest()
+
+def ai_cache_key(fingerprint: str, model: str) -> str:
+    """Key generations by the code's AST fingerprint, so whitespace and comment edits still hit the cache"""
+    payload = f"{model}\n{fingerprint}"
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+_result_cache: Optional[LRUCache] = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache() -> LRUCache:
+    """Return the process-wide /runtests result cache"""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = LRUCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL, max_bytes=RESULT_CACHE_MAX_BYTES,
+                                     disk_path=RESULT_CACHE_PATH or None)
+        return _result_cache
+
+
+_ai_cache: Optional[LRUCache] = None
+_ai_cache_lock = threading.Lock()
+
+def get_ai_cache() -> LRUCache:
+    """Return the process-wide cache of AI generated test cases"""
+    global _ai_cache
+    with _ai_cache_lock:
+        if _ai_cache is None:
+            _ai_cache = LRUCache(AI_CACHE_SIZE, AI_CACHE_TTL, disk_path=AI_CACHE_PATH or None)
+        return _ai_cache
+
+
+def collect_cache_metrics():
+    """Copy the hit/miss/eviction counts of the caches in use into the metrics registry"""
+    for name, cache in (("result", _result_cache), ("ai", _ai_cache)):
+        if cache is None:
+            continue
+        stats = cache.stats()
+        CACHE_REQUESTS.set_total(stats["hits"], cache=name, result="hit")
+        CACHE_REQUESTS.set_total(stats["misses"], cache=name, result="miss")
+        CACHE_EVICTIONS.set_total(stats["evictions"], cache=name)
+        CACHE_ENTRIES.set(stats["entries"], cache=name)
+        CACHE_BYTES.set(stats["bytes"], cache=name)
@@ -0,0 +1,121 @@
+import os
+import ast
+import marshal
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Code cache settings (overridable through the environment)
+CODE_CACHE_SIZE = int(os.getenv("CODE_CACHE_SIZE", 256))  # compiled submissions kept per process
+
+# filename compiled code reports in tracebacks, linecache and profiles
+USER_CODE_FILENAME = "<user_code>"
+
+
+class CompiledCode:
+    """
+    A submission parsed and compiled once: its marshalled code object (what runners execute),
+    the signatures of its top-level functions and the function tests should call.
+    """
+
+    __slots__ = ("source_hash", "bytecode", "functions", "entry_point", "fingerprint")
+
+    def __init__(self, source_hash: str, bytecode: bytes, functions: List[Dict[str, Any]],
+                 entry_point: Optional[str], fingerprint: str):
+        self.source_hash = source_hash
+        self.bytecode = bytecode
+        self.functions = functions
+        self.entry_point = entry_point
+        self.fingerprint = fingerprint  # hash of the AST, equal for edits that only touch comments or layout
+
+
+def source_hash(source: str) -> str:
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def function_signatures(tree: ast.Module) -> List[Dict[str, Any]]:
+    """Name, parameters and the other top-level functions it refers to, for every top-level function"""
+    top_level = [node for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    names = {node.name for node in top_level}
+    functions = []
+    for node in top_level:
+        args = node.args
+        positional = args.posonlyargs + args.args
+        referenced = {child.id for child in ast.walk(node) if isinstance(child, ast.Name)} & names
+        functions.append({
+            "name": node.name,
+            "params": [arg.arg for arg in positional],
+            "required": len(positional) - len(args.defaults),
+            "varargs": args.vararg is not None,
+            "is_async": isinstance(node, ast.AsyncFunctionDef),
+            "calls": sorted(referenced - {node.name}),
+        })
+    return functions
+
+def entry_point(functions: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    The function the test cases are meant for. Each case is passed as one argument, so prefer a
+    public function that can take exactly one and that no other function calls (helpers are
+    called by it); ties go to the first one in the source.
+    """
+    called = {name for function in functions for name in function["calls"]}
+
+    def rank(function):
+        takes_one = function["required"] <= 1 and (len(function["params"]) >= 1 or function["varargs"])
+        return (function["name"] not in called, takes_one, not function["name"].startswith('_'),
+                not function["is_async"])
+
+    best = None
+    for function in functions:
+        if best is None or rank(function) > rank(best):
+            best = function
+    return best["name"] if best else None
+
+
+_cache: "OrderedDict[str, CompiledCode]" = OrderedDict()
+_cache_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+def compile_user_code(source: str) -> CompiledCode:
+    """
+    Parse and compile a submission, or return it from the cache when the same source was seen
+    before. Raises what compile() raises (SyntaxError, ValueError for null bytes, ...).
+    """
+    global _hits, _misses
+    key = source_hash(source)
+    with _cache_lock:
+        compiled = _cache.get(key)
+        if compiled is not None:
+            _cache.move_to_end(key)
+            _hits += 1
+            return compiled
+        _misses += 1
+
+    tree = ast.parse(source, USER_CODE_FILENAME, 'exec')
+    code = compile(tree, USER_CODE_FILENAME, 'exec')
+    functions = function_signatures(tree)
+    compiled = CompiledCode(key, marshal.dumps(code), functions, entry_point(functions),
+                            hashlib.sha256(ast.dump(tree).encode()).hexdigest())
+
+    with _cache_lock:
+        _cache[key] = compiled
+        while len(_cache) > CODE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
+
+def try_compile_user_code(source: str) -> Optional[CompiledCode]:
+    """compile_user_code, or None when the source doesn't compile (the runner reports the error then)"""
+    try:
+        return compile_user_code(source)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return None
+
+def load_code(bytecode: bytes):
+    """The code object of a CompiledCode's bytecode, in a process running the same Python"""
+    return marshal.loads(bytecode)
+
+def code_cache_stats() -> Dict[str, int]:
+    with _cache_lock:
+        return {"entries": len(_cache), "hits": _hits, "misses": _misses}
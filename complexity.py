@@ -0,0 +1,281 @@
+import gc
+import os
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# a single BLAS thread is plenty for the tiny fits below and keeps the runner's address space small
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+import numpy as np
+
+from testing import deadline, CaseTimeoutError
+from utils import configure_logging
+
+# Set up logging configuration
+configure_logging()
+
+# Sweep settings
+COMPLEXITY_SIZES = [10, 30, 100, 300, 1_000, 3_000, 10_000, 30_000, 100_000, 300_000, 1_000_000]
+COMPLEXITY_DISTRIBUTIONS = ("random", "sorted", "reversed", "duplicates")
+COMPLEXITY_TIME_BUDGET_MS = 1000  # default budget; a distribution stops growing once a call takes longer
+COMPLEXITY_MIN_REPEAT = 2  # calls per point and round, the fastest one is kept
+COMPLEXITY_MAX_REPEAT = 100  # upper bound on calls per point for very fast functions
+COMPLEXITY_MIN_POINT_TIME = 0.01  # seconds of calls per point and round before the fastest one is trusted
+# passes over the measured sizes; each point keeps its fastest round, so a slow spell on a shared
+# machine (a second or two long) has to hit the same point in every round to bend the curve
+COMPLEXITY_ROUNDS = 3
+COMPLEXITY_NOISE_FLOOR = 5  # points within this factor of the fastest one are call overhead, not growth
+COMPLEXITY_TREND_TAU = 0.6  # a curve grows only if its times rise with n this consistently (Kendall's tau)
+COMPLEXITY_MIN_GROWTH = 1.5  # ... and by at least this factor over the measured sizes, otherwise it is O(1)
+# the model is picked from sizes up to here: larger inputs outgrow the CPU caches, so their cost per
+# item rises whatever the algorithm and would pass O(n) off as O(n log n)
+COMPLEXITY_FIT_MAX_SIZE = 100_000
+COMPLEXITY_SLOPE_TIE = 0.75  # share of the way from a simpler model's log-log slope to the next one's a curve must go
+
+# candidate growth models, simplest first
+MODELS = {
+    "O(1)": lambda n: np.zeros_like(n),
+    "O(log n)": lambda n: np.log2(n),
+    "O(n)": lambda n: n,
+    "O(n log n)": lambda n: n * np.log2(n),
+    "O(n^2)": lambda n: n ** 2,
+}
+
+
+def generate_input(distribution: str, n: int, rng: np.random.Generator) -> List[int]:
+    """Build a list of `n` ints with numpy, converting to a Python list in one C-level pass"""
+    if distribution == "random":
+        values = rng.integers(-n, n, size=n)
+    elif distribution == "sorted":
+        values = np.sort(rng.integers(-n, n, size=n))
+    elif distribution == "reversed":
+        values = np.sort(rng.integers(-n, n, size=n))[::-1]
+    elif distribution == "duplicates":
+        values = np.full(n, 7)
+    else:
+        raise ValueError(f"Unknown input distribution: {distribution}")
+    return values.tolist()
+
+def measure_point(function: Callable, distribution: str, n: int, rng: np.random.Generator,
+                  time_limit: float) -> float:
+    """
+    Fastest of several calls on fresh inputs of size n, in milliseconds. Timed with raw
+    perf_counter rather than `timer`, whose rounding would flatten sub-microsecond calls.
+    A function that leaves its input unchanged is called again on the same copy: copying a large
+    input right before every call would evict the caches and make even O(1) calls look slower at
+    large n.
+    """
+    template = generate_input(distribution, n, rng)
+    samples = []
+    spent = 0.0
+    arr, reusable = None, False
+    # like benchmark mode, no collection pass may land inside a timed call and skew its size's time
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while len(samples) < COMPLEXITY_MIN_REPEAT or (spent < COMPLEXITY_MIN_POINT_TIME and
+                                                       len(samples) < COMPLEXITY_MAX_REPEAT):
+            if not reusable:
+                arr = list(template)
+            with deadline(time_limit - spent):
+                start_time = time.perf_counter()
+                function(arr)
+                elapsed = time.perf_counter() - start_time
+            samples.append(elapsed)
+            spent += elapsed
+            if len(samples) == 1:
+                reusable = arr == template
+            # one slow call says enough, don't pay for the repeats
+            if spent >= time_limit / 2:
+                break
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return min(samples) * 1000
+
+def fit_models(sizes: List[int], times_ms: List[float]) -> Dict[str, Dict[str, float]]:
+    """
+    Fit time = a * f(n) + b for every model. The fit is weighted by 1/time so small and large
+    inputs count equally, and `error` is the RMS relative error of the fit.
+    """
+    n = np.asarray(sizes, dtype=float)
+    t = np.asarray(times_ms, dtype=float)
+    t = np.maximum(t, 1e-6)
+
+    fits = {}
+    for name, model in MODELS.items():
+        if name == "O(1)":
+            design = np.column_stack([np.ones_like(n) / t])
+        else:
+            design = np.column_stack([model(n) / t, np.ones_like(n) / t])
+        coefficients, _, _, _ = np.linalg.lstsq(design, np.ones_like(n), rcond=None)
+        if name == "O(1)":
+            scale, constant = 0.0, float(coefficients[0])
+        else:
+            scale, constant = float(coefficients[0]), float(coefficients[1])
+        predicted = scale * model(n) + constant
+        error = float(np.sqrt(np.mean(((predicted - t) / t) ** 2)))
+        # a shrinking cost curve isn't a sensible fit for anything but O(1)
+        if scale < 0:
+            error = float("inf")
+        fits[name] = {"scale": scale, "constant": constant, "error": error}
+    return fits
+
+def loglog_slope(sizes: List[int], times_ms: List[float]) -> float:
+    """
+    Growth exponent of a curve: the median slope between every pair of points on a log-log
+    scale, so a few noisy points (cache effects at the largest sizes) can't swing it
+    """
+    x = np.log(np.asarray(sizes, dtype=float))
+    y = np.log(np.maximum(np.asarray(times_ms, dtype=float), 1e-9))
+    i, j = np.triu_indices(len(x), k=1)
+    return float(np.median((y[j] - y[i]) / (x[j] - x[i])))
+
+def kendall_tau(sizes: List[int], times_ms: List[float]) -> float:
+    """How consistently the times rise with n: 1 if always, around 0 for no trend, -1 if always falling"""
+    x = np.asarray(sizes, dtype=float)
+    y = np.asarray(times_ms, dtype=float)
+    i, j = np.triu_indices(len(x), k=1)
+    return float(np.mean(np.sign((x[j] - x[i]) * (y[j] - y[i]))))
+
+def signal_points(sizes: List[int], times_ms: List[float]) -> Tuple[List[int], List[float]]:
+    """The points clearly above the call-overhead floor, or all of them when fewer than 3 are"""
+    floor = min(times_ms)
+    signal = [(n, t) for n, t in zip(sizes, times_ms) if t >= floor * COMPLEXITY_NOISE_FLOOR]
+    if len(signal) < 3:
+        signal = list(zip(sizes, times_ms))
+    return [n for n, _ in signal], [t for _, t in signal]
+
+def fit_curve(sizes: List[int], times_ms: List[float]):
+    """
+    Pick the growth model for one curve, returning (model name, fits). The curve is O(1) unless
+    its times rise with n both consistently and noticeably; a constant-time call drifts with noise
+    but doesn't climb, while even O(log n) does once the call overhead is paid. A growing curve
+    gets the model whose log-log slope matches its own on the sizes up to COMPLEXITY_FIT_MAX_SIZE
+    that are clearly above the overhead floor. A more complex model only wins once the curve is
+    COMPLEXITY_SLOPE_TIE of the way from the simpler model's slope to its own, so noise doesn't
+    promote a curve. The fits (time = a * f(n) + b) give the scale used to extrapolate.
+    """
+    fits = fit_models(*signal_points(sizes, times_ms))
+    growth = np.exp(loglog_slope(sizes, times_ms) * np.log(sizes[-1] / sizes[0]))
+    if kendall_tau(sizes, times_ms) < COMPLEXITY_TREND_TAU or growth < COMPLEXITY_MIN_GROWTH:
+        return "O(1)", fits
+
+    bounded = [(n, t) for n, t in zip(sizes, times_ms) if n <= COMPLEXITY_FIT_MAX_SIZE]
+    if len(bounded) < 3:
+        bounded = list(zip(sizes, times_ms))
+    fit_sizes, fit_times = signal_points([n for n, _ in bounded], [t for _, t in bounded])
+    slope = loglog_slope(fit_sizes, fit_times)
+
+    n = np.asarray(fit_sizes, dtype=float)
+    growing = [name for name in MODELS if name != "O(1)"]
+    chosen = growing[0]
+    for simpler, more_complex in zip(growing, growing[1:]):
+        low, high = loglog_slope(fit_sizes, MODELS[simpler](n)), loglog_slope(fit_sizes, MODELS[more_complex](n))
+        if slope < low + COMPLEXITY_SLOPE_TIE * (high - low):
+            break
+        chosen = more_complex
+    return chosen, fits
+
+def budget_crossing(fit: Dict[str, float], model_name: str, time_budget_ms: float,
+                    max_n: float = 1e12) -> Optional[int]:
+    """Smallest input size whose predicted time reaches the budget, or None if it never does"""
+    grid = np.unique(np.logspace(0, np.log10(max_n), 2000).astype(np.int64)).astype(float)
+    predicted = fit["scale"] * MODELS[model_name](grid) + fit["constant"]
+    over = np.nonzero(predicted >= time_budget_ms)[0]
+    return int(grid[over[0]]) if over.size else None
+
+def estimate_complexity(function: Callable, time_limit: float, time_budget_ms: float = COMPLEXITY_TIME_BUDGET_MS,
+                        max_size: int = COMPLEXITY_SIZES[-1], distributions: Optional[List[str]] = None,
+                        seed: int = 0) -> Dict[str, Any]:
+    """
+    Time `function` on growing inputs of every distribution, fit the growth models to the
+    worst case at each size and report the best fit, the raw curves and where the budget is crossed.
+    """
+    distributions = list(distributions or COMPLEXITY_DISTRIBUTIONS)
+    for distribution in distributions:
+        if distribution not in COMPLEXITY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown input distribution: {distribution}")
+    sizes = [n for n in COMPLEXITY_SIZES if n <= max_size]
+    if len(sizes) < 3:
+        raise ValueError(f"max_size must be at least {COMPLEXITY_SIZES[2]} to fit a curve")
+
+    rng = np.random.default_rng(seed)
+    sweep_end = time.monotonic() + time_limit
+    curves: Dict[str, List[Dict[str, float]]] = {}
+    errors: Dict[str, str] = {}
+    over_budget: Dict[str, int] = {}
+    timed_out = False
+
+    # sweep sizes in the outer loop so a time-out still leaves comparable curves for all distributions
+    active = list(distributions)
+    for n in sizes:
+        for distribution in list(active):
+            remaining = sweep_end - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            try:
+                time_ms = measure_point(function, distribution, n, rng, remaining)
+            except CaseTimeoutError:
+                timed_out = True
+                break
+            except Exception as e:
+                errors[distribution] = f"n={n}: {type(e).__name__}: {str(e)}"
+                active.remove(distribution)
+                continue
+
+            curves.setdefault(distribution, []).append({"n": n, "time_ms": round(time_ms, 6)})
+            if time_ms >= time_budget_ms:
+                over_budget[distribution] = n
+                active.remove(distribution)
+        if timed_out or not active:
+            break
+
+    # later rounds re-measure the points under the budget, only while the time limit allows
+    remeasure = [(distribution, point) for distribution, points in curves.items()
+                 for point in points if point["time_ms"] < time_budget_ms]
+    for distribution, point in ([] if timed_out else remeasure * (COMPLEXITY_ROUNDS - 1)):
+        remaining = sweep_end - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            time_ms = measure_point(function, distribution, point["n"], rng, remaining)
+        except Exception:
+            break  # the first round already has a time for every point
+        point["time_ms"] = round(min(point["time_ms"], time_ms), 6)
+
+    report = {
+        "best_fit": None,
+        "fits": {},
+        "per_distribution": {},
+        "curves": curves,
+        "time_budget_ms": time_budget_ms,
+        "budget_size": None,
+        "observed_over_budget": over_budget,
+        "timed_out": timed_out,
+        "errors": errors
+    }
+
+    for distribution, points in curves.items():
+        if len(points) >= 3:
+            report["per_distribution"][distribution], _ = fit_curve([p["n"] for p in points],
+                                                                   [p["time_ms"] for p in points])
+
+    # fit the worst case over distributions at each size that was measured
+    worst: Dict[int, float] = {}
+    for points in curves.values():
+        for point in points:
+            worst[point["n"]] = max(worst.get(point["n"], 0.0), point["time_ms"])
+    if len(worst) < 3:
+        logging.info("Complexity sweep produced too few points to fit a curve")
+        return report
+
+    worst_sizes = sorted(worst)
+    report["best_fit"], fits = fit_curve(worst_sizes, [worst[n] for n in worst_sizes])
+    report["fits"] = {name: {key: (round(value, 8) if np.isfinite(value) else None) for key, value in fit.items()}
+                      for name, fit in fits.items()}
+    report["budget_size"] = budget_crossing(fits[report["best_fit"]], report["best_fit"], time_budget_ms)
+    return report
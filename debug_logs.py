@@ -0,0 +1,257 @@
+import ast
+import copy
+import logging
+from typing import Iterator, List, Tuple
+from utils import configure_logging
+
+# Set up logging configuration
+configure_logging()
+
+# Instrumenter settings
+DEBUG_LOG_VERBOSITY = "normal"
+DEBUG_LOG_LOOP_BUDGET = 5  # iterations each loop logs per top-level call
+DEBUG_LOG_MAX_LINES = 200  # lines logged per top-level call, across all functions
+DEBUG_LOG_REPR_ITEMS = 10  # list items / dict entries shown in a logged value
+DEBUG_LOG_REPR_CHARS = 80  # characters shown of a logged string or number
+
+# minimal: calls, arguments, return values and exceptions; normal: plus assignments;
+# verbose: plus the loop variables of every iteration
+VERBOSITY_LEVELS = ("minimal", "normal", "verbose")
+
+# methods called to format logged values; logging them would log from inside every log line
+UNLOGGED_METHODS = {"__repr__", "__str__", "__format__"}
+
+# Helpers added to the top of instrumented code. Budgets restart with every top-level call, so
+# each test case gets its own log lines. Log lines are built by a callable, only while within the
+# budget, and anything a value's repr() calls in turn (instrumented user code included) is not
+# logged: "busy" is set while a line is being built.
+PRELUDE = '''
+import reprlib as _debug_reprlib
+_debug_repr = _debug_reprlib.Repr()
+_debug_repr.maxlevel = 3
+_debug_repr.maxlist = _debug_repr.maxtuple = _debug_repr.maxdict = _debug_repr.maxset = {items}
+_debug_repr.maxstring = _debug_repr.maxother = _debug_repr.maxlong = {chars}
+_debug_state = {{"depth": 0, "lines": 0, "loops": {{}}, "busy": False}}
+
+def _debug(message):
+    if _debug_state["busy"]:
+        return
+    _debug_state["lines"] += 1
+    if _debug_state["lines"] <= {max_lines}:
+        _debug_state["busy"] = True
+        try:
+            line = message()
+        finally:
+            _debug_state["busy"] = False
+        print("DEBUG " + "  " * _debug_state["depth"] + line)
+    elif _debug_state["lines"] == {max_lines} + 1:
+        print("DEBUG ... log limit of {max_lines} lines reached for this call")
+
+def _debug_argument(name, value):
+    # the object a method runs on may be half built (or its repr the method), its type says enough
+    if name == "self":
+        return "<" + type(value).__name__ + ">"
+    return _debug_repr.repr(value)
+
+def _debug_enter(name, args):
+    if _debug_state["busy"]:
+        return
+    if _debug_state["depth"] == 0:
+        _debug_state["lines"] = 0
+        _debug_state["loops"].clear()
+    _debug(lambda: "-> " + name + "(" + ", ".join(k + "=" + _debug_argument(k, v) for k, v in args.items()) + ")")
+    _debug_state["depth"] += 1
+
+def _debug_return(name, value):
+    if not _debug_state["busy"]:
+        _debug_state["depth"] = max(_debug_state["depth"] - 1, 0)
+        _debug(lambda: "<- " + name + " returned " + _debug_repr.repr(value))
+    return value
+
+def _debug_raise(name, error):
+    if not _debug_state["busy"]:
+        _debug_state["depth"] = max(_debug_state["depth"] - 1, 0)
+        _debug(lambda: "<- " + name + " raised " + type(error).__name__ + ": " + _debug_repr.repr(str(error)))
+
+def _debug_assign(name, label, value):
+    _debug(lambda: name + ": " + label + " = " + _debug_repr.repr(value))
+
+def _debug_loop(key):
+    if _debug_state["busy"]:
+        return False
+    count = _debug_state["loops"][key] = _debug_state["loops"].get(key, 0) + 1
+    if count == {loop_budget} + 1:
+        _debug(lambda: key + ": logged {loop_budget} iterations, later ones are not logged")
+    return count <= {loop_budget}
+'''
+
+
+def _call(function: str, *args: ast.expr) -> ast.Call:
+    return ast.Call(func=ast.Name(id=function, ctx=ast.Load()), args=list(args), keywords=[])
+
+def _load(target: ast.expr) -> ast.expr:
+    """A copy of an assignment target that reads the value back"""
+    target = copy.deepcopy(target)
+    for node in ast.walk(target):
+        if hasattr(node, 'ctx'):
+            node.ctx = ast.Load()
+    return target
+
+def _assigned(target: ast.expr) -> Iterator[Tuple[str, ast.expr]]:
+    """(label, expression) for the values an assignment target sets that can be read back safely"""
+    if isinstance(target, ast.Name):
+        yield target.id, _load(target)
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        for element in target.elts:
+            yield from _assigned(element.value if isinstance(element, ast.Starred) else element)
+    elif isinstance(target, (ast.Subscript, ast.Attribute)):
+        # reading arr[i] or self.x again is harmless, anything with a call in it might not be
+        allowed = (ast.Name, ast.Constant, ast.Attribute, ast.Subscript, ast.Slice, ast.expr_context,
+                   ast.UnaryOp, ast.BinOp, ast.operator, ast.unaryop, ast.Tuple)
+        if all(isinstance(node, allowed) for node in ast.walk(target)):
+            yield ast.unparse(target), _load(target)
+
+
+class DebugLogInstrumenter(ast.NodeTransformer):
+    """Adds debug log calls to every function of a module; see add_debug_logs"""
+
+    def __init__(self, verbosity: str = DEBUG_LOG_VERBOSITY):
+        self.verbosity = VERBOSITY_LEVELS.index(verbosity)
+        self._scope: List[str] = []
+        self._function = ""
+        self._loops: List[List] = []  # [key, flag variable, whether anything logs] of the enclosing loops
+        self.functions = 0
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> ast.ClassDef:
+        self._scope.append(node.name)
+        self.generic_visit(node)
+        self._scope.pop()
+        return node
+
+    def visit_FunctionDef(self, node):
+        if node.name.startswith('_debug') or node.name in UNLOGGED_METHODS:
+            return node
+        self.functions += 1
+        name = '.'.join(self._scope + [node.name])
+        outer = (self._function, self._loops)
+        self._function, self._loops = name, []
+        self._scope.append(node.name)
+
+        body = node.body
+        docstring = []
+        if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                and isinstance(body[0].value.value, str):
+            docstring, body = body[:1], body[1:]
+        body = self._block(body)
+        if not body or not isinstance(body[-1], (ast.Return, ast.Raise)):
+            body.append(ast.Expr(_call('_debug_return', ast.Constant(name), ast.Constant(None))))
+
+        args = node.args
+        params = [arg.arg for arg in args.posonlyargs + args.args]
+        params += [args.vararg.arg] if args.vararg else []
+        params += [arg.arg for arg in args.kwonlyargs]
+        params += [args.kwarg.arg] if args.kwarg else []
+        enter = ast.Expr(_call('_debug_enter', ast.Constant(name),
+                               ast.Dict(keys=[ast.Constant(p) for p in params],
+                                        values=[ast.Name(id=p, ctx=ast.Load()) for p in params])))
+        # exceptions are logged on the way out and raised again unchanged
+        handler = ast.ExceptHandler(type=ast.Name(id='BaseException', ctx=ast.Load()), name='_debug_error',
+                                    body=[ast.Expr(_call('_debug_raise', ast.Constant(name),
+                                                         ast.Name(id='_debug_error', ctx=ast.Load()))),
+                                          ast.Raise()])
+        node.body = docstring + [enter, ast.Try(body=body, handlers=[handler], orelse=[], finalbody=[])]
+
+        self._scope.pop()
+        self._function, self._loops = outer
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def _block(self, statements: List[ast.stmt]) -> List[ast.stmt]:
+        block = []
+        for statement in statements:
+            if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                block.append(self.visit(statement))
+            elif isinstance(statement, ast.Return):
+                value = statement.value or ast.Constant(None)
+                statement.value = _call('_debug_return', ast.Constant(self._function), value)
+                block.append(statement)
+            elif isinstance(statement, (ast.Assign, ast.AugAssign, ast.AnnAssign)):
+                block.append(statement)
+                if self.verbosity >= 1 and (not isinstance(statement, ast.AnnAssign) or statement.value):
+                    targets = statement.targets if isinstance(statement, ast.Assign) else [statement.target]
+                    block += self._log_assigned(targets)
+            elif isinstance(statement, (ast.For, ast.AsyncFor, ast.While)):
+                loop = [f"{self._function}:{statement.lineno}", f"_debug_iteration_{statement.lineno}", False]
+                self._loops.append(loop)
+                body = self._block(statement.body)
+                if self.verbosity >= 2 and not isinstance(statement, ast.While):
+                    body = self._log_assigned([statement.target]) + body
+                if loop[2]:
+                    # decided once per iteration, so an iteration is logged completely or not at all
+                    body.insert(0, ast.Assign(targets=[ast.Name(id=loop[1], ctx=ast.Store())],
+                                              value=_call('_debug_loop', ast.Constant(loop[0]))))
+                statement.body = body
+                self._loops.pop()
+                statement.orelse = self._block(statement.orelse)
+                block.append(statement)
+            else:
+                for field in ('body', 'orelse', 'finalbody'):
+                    if isinstance(getattr(statement, field, None), list):
+                        setattr(statement, field, self._block(getattr(statement, field)))
+                for handler in getattr(statement, 'handlers', []):
+                    handler.body = self._block(handler.body)
+                for case in getattr(statement, 'cases', []):
+                    case.body = self._block(case.body)
+                block.append(statement)
+        return block
+
+    def _log_assigned(self, targets: List[ast.expr]) -> List[ast.stmt]:
+        logs = [ast.Expr(_call('_debug_assign', ast.Constant(self._function), ast.Constant(label), value))
+                for target in targets for label, value in _assigned(target)]
+        if not logs or not self._loops:
+            return logs
+        # inside a loop only the iterations within the innermost loop's budget log
+        loop = self._loops[-1]
+        loop[2] = True
+        return [ast.If(test=ast.Name(id=loop[1], ctx=ast.Load()), body=logs, orelse=[])]
+
+
+def add_debug_logs(source: str, verbosity: str = DEBUG_LOG_VERBOSITY, loop_budget: int = DEBUG_LOG_LOOP_BUDGET,
+                   max_lines: int = DEBUG_LOG_MAX_LINES) -> str:
+    """
+    Return the code with debug log lines added to every function: calls with their arguments,
+    return values, exceptions and (depending on verbosity) assignments and loop variables,
+    printed as "DEBUG ..." lines. Loops log their first `loop_budget` iterations and a top-level
+    call at most `max_lines` lines, so large inputs don't flood the output. The code is regenerated from
+    its AST, so comments and formatting are not kept. Raises SyntaxError for code that doesn't
+    parse and ValueError for bad settings or code that already went through here.
+    """
+    if verbosity not in VERBOSITY_LEVELS:
+        raise ValueError(f"verbosity should be one of {list(VERBOSITY_LEVELS)}")
+    if loop_budget < 0 or max_lines < 1:
+        raise ValueError("loop_budget can't be negative and max_lines must be at least 1")
+
+    tree = ast.parse(source)
+    if any(isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == '_debug_state'
+                                                  for t in node.targets) for node in tree.body):
+        raise ValueError("The code already has debug logs added")
+
+    instrumenter = DebugLogInstrumenter(verbosity)
+    tree = instrumenter.visit(tree)
+
+    # the helpers go after the module docstring and __future__ imports, which have to come first
+    position = 0
+    for node in tree.body:
+        is_docstring = position == 0 and isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) \
+            and isinstance(node.value.value, str)
+        if not is_docstring and not (isinstance(node, ast.ImportFrom) and node.module == '__future__'):
+            break
+        position += 1
+    prelude = ast.parse(PRELUDE.format(items=DEBUG_LOG_REPR_ITEMS, chars=DEBUG_LOG_REPR_CHARS,
+                                       max_lines=max_lines, loop_budget=loop_budget)).body
+    tree.body[position:position] = prelude
+
+    ast.fix_missing_locations(tree)
+    logging.info(f"Added debug logs to {instrumenter.functions} functions ({verbosity})")
+    return ast.unparse(tree) + "\n"
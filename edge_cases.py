@@ -0,0 +1,394 @@
+import ast
+import copy
+import json
+import time
+import random
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from testing import Testing, deadline, CaseTimeoutError
+from utils import configure_logging
+
+# Set up logging configuration
+configure_logging()
+
+# Generator settings
+EDGE_CASE_SEED = 0
+EDGE_CASE_MAX_CASES = 40  # passing cases returned, failures are always kept
+EDGE_CASE_TIMEOUT = 0.5  # seconds per call; large inputs that take longer are left out
+EDGE_CASE_LARGE_SIZE = 10_000  # length of the "large" inputs
+EDGE_CASE_RANDOM_CASES = 5  # extra small random inputs on top of the fixed edge cases
+EDGE_CASE_MAX_INPUT_CHARS = 2_000  # passing cases with a bigger JSON input are run but not returned
+SHRINK_MAX_CALLS = 500  # calls spent shrinking one failing input
+
+INT_MAX, INT_MIN = 2 ** 31 - 1, -2 ** 31
+
+# how a parameter gets used, by the attribute called on it
+STR_METHODS = {"lower", "upper", "split", "strip", "lstrip", "rstrip", "isdigit", "isalpha", "isalnum", "isspace",
+               "startswith", "endswith", "replace", "find", "rfind", "casefold", "title", "splitlines", "encode"}
+LIST_METHODS = {"append", "pop", "sort", "extend", "insert", "remove", "reverse", "copy", "clear"}
+DICT_METHODS = {"items", "keys", "values", "get", "setdefault", "update"}
+
+# input kinds, the most specific first: a matrix is also subscripted, a str also iterated
+INPUT_KINDS = ("matrix", "dict", "str", "list", "int")
+
+
+class LocalGenerationError(Exception):
+    """Raised when the local generator couldn't run the submitted function."""
+    pass
+
+
+def infer_input_kind(source: str, function_name: str) -> str:
+    """
+    Guess what the function's argument is from how its first parameter is used: subscripted
+    twice (matrix), string keys or dict methods (dict), string methods (str), list methods,
+    len() or iteration (list), arithmetic, range() or comparisons with numbers (int). A list
+    of ints is assumed when nothing gives it away.
+    """
+    tree = ast.parse(source)
+    function = next((node for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+                     and node.name == function_name), None)
+    if function is None:
+        return "list"
+    params = function.args.posonlyargs + function.args.args
+    if not params:
+        return "list"
+    name = params[0].arg
+
+    def is_param(node):
+        return isinstance(node, ast.Name) and node.id == name
+
+    votes = set()
+    for node in ast.walk(function):
+        if isinstance(node, ast.Subscript):
+            if is_param(node.value):
+                key = node.slice
+                if isinstance(key, ast.Constant) and isinstance(key.value, str):
+                    votes.add("dict")
+                else:
+                    votes.add("list")
+            elif isinstance(node.value, ast.Subscript) and is_param(node.value.value):
+                votes.add("matrix")
+        elif isinstance(node, ast.Attribute) and is_param(node.value):
+            if node.attr in STR_METHODS:
+                votes.add("str")
+            elif node.attr in DICT_METHODS:
+                votes.add("dict")
+            elif node.attr in LIST_METHODS:
+                votes.add("list")
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            if node.func.id == "range" and any(is_param(arg) for arg in node.args):
+                votes.add("int")
+            elif node.func.id in ("len", "sorted", "sum", "set", "list", "enumerate", "reversed") \
+                    and any(is_param(arg) for arg in node.args):
+                votes.add("list")
+            elif node.func.id in ("min", "max") and len(node.args) == 1 and is_param(node.args[0]):
+                votes.add("list")
+        elif isinstance(node, (ast.For, ast.comprehension)) and is_param(node.iter):
+            votes.add("list")
+        elif isinstance(node, ast.BinOp) and (is_param(node.left) or is_param(node.right)):
+            other = node.right if is_param(node.left) else node.left
+            if isinstance(node.op, (ast.Mod, ast.FloorDiv, ast.Sub, ast.Pow, ast.BitAnd, ast.RShift, ast.LShift)) \
+                    or (isinstance(other, ast.Constant) and isinstance(other.value, int)):
+                votes.add("int")
+        elif isinstance(node, ast.Compare) and is_param(node.left) and all(
+                isinstance(c, ast.Constant) and isinstance(c.value, int) and not isinstance(c.value, bool)
+                for c in node.comparators):
+            votes.add("int")
+
+    # "int" only wins when nothing suggests a container
+    for kind in INPUT_KINDS:
+        if kind in votes and (kind != "int" or votes == {"int"}):
+            return kind
+    return "list"
+
+
+def candidate_inputs(kind: str, rng: random.Random) -> List[Tuple[str, Any]]:
+    """(label, input) pairs for a kind: the classic edge cases first, then a few random ones"""
+    if kind == "int":
+        cases = [("zero", 0), ("one", 1), ("negative_one", -1), ("two", 2), ("small_prime", 7),
+                 ("power_of_two", 1024), ("int_max", INT_MAX), ("int_min", INT_MIN), ("large", EDGE_CASE_LARGE_SIZE)]
+        cases += [("random", rng.randint(-100, 100)) for _ in range(EDGE_CASE_RANDOM_CASES)]
+    elif kind == "str":
+        cases = [("empty", ""), ("single", "a"), ("duplicates", "aaaa"), ("palindrome", "racecar"),
+                 ("whitespace", "  "), ("spaces_inside", "hello world"), ("mixed_case", "AbCd"),
+                 ("digits", "12345"), ("punctuation", "a,b.c!"), ("unicode", "héllo wörld"),
+                 ("sorted", "abcdef"), ("reversed", "fedcba"), ("large", "ab" * (EDGE_CASE_LARGE_SIZE // 2))]
+        cases += [("random", "".join(rng.choice("abcxyz ") for _ in range(rng.randint(2, 12))))
+                  for _ in range(EDGE_CASE_RANDOM_CASES)]
+    elif kind == "dict":
+        cases = [("empty", {}), ("single", {"a": 1}), ("two", {"a": 1, "b": 2}), ("duplicate_values", {"a": 1, "b": 1}),
+                 ("negatives", {"a": -1, "b": -5}), ("zero", {"a": 0}), ("extremes", {"a": INT_MAX, "b": INT_MIN}),
+                 ("large", {f"k{i}": i for i in range(EDGE_CASE_LARGE_SIZE)})]
+        cases += [("random", {f"k{i}": rng.randint(-100, 100) for i in range(rng.randint(1, 8))})
+                  for _ in range(EDGE_CASE_RANDOM_CASES)]
+    elif kind == "matrix":
+        side = int(EDGE_CASE_LARGE_SIZE ** 0.5)
+        cases = [("empty", []), ("empty_row", [[]]), ("single", [[1]]), ("square", [[1, 2], [3, 4]]),
+                 ("single_row", [[1, 2, 3, 4, 5]]), ("single_column", [[1], [2], [3]]),
+                 ("negatives", [[-1, -2], [-3, -4]]), ("duplicates", [[5, 5], [5, 5]]),
+                 ("extremes", [[INT_MAX, INT_MIN], [0, -1]]),
+                 ("large", [[rng.randint(-100, 100) for _ in range(side)] for _ in range(side)])]
+        cases += [("random", [[rng.randint(-20, 20) for _ in range(cols)] for _ in range(rows)])
+                  for rows, cols in ((rng.randint(1, 4), rng.randint(1, 4)) for _ in range(EDGE_CASE_RANDOM_CASES))]
+    else:
+        n = EDGE_CASE_LARGE_SIZE
+        cases = [("empty", []), ("single", [1]), ("single_zero", [0]), ("single_negative", [-1]), ("two", [2, 1]),
+                 ("duplicates", [3, 3, 3, 3]), ("negatives", [-5, -1, -3, -2]), ("mixed_signs", [-2, 0, 2, -1, 1]),
+                 ("extremes", [INT_MAX, INT_MIN, 0]), ("sorted", list(range(1, 11))),
+                 ("reversed", list(range(10, 0, -1))), ("alternating", [1, -1] * 5),
+                 ("large_random", [rng.randint(-n, n) for _ in range(n)]), ("large_sorted", list(range(n))),
+                 ("large_reversed", list(range(n, 0, -1))), ("large_duplicates", [7] * n)]
+        cases += [("random", [rng.randint(-20, 20) for _ in range(rng.randint(2, 12))])
+                  for _ in range(EDGE_CASE_RANDOM_CASES)]
+    return cases
+
+
+class _Recorder:
+    """Stands in for the function under test, keeping what each call returned or raised"""
+
+    def __init__(self, function: Callable):
+        self.function = function
+        self.calls: List[Tuple[Any, Optional[BaseException]]] = []
+
+    def __call__(self, value):
+        try:
+            output = self.function(value)
+        except BaseException as e:
+            self.calls.append((None, e))
+            raise
+        self.calls.append((output, None))
+        return output
+
+
+def run_case(function: Callable, value: Any, time_limit: float, expected_output: Any = None,
+             track_memory: bool = False) -> Tuple[Dict[str, Any], Any, Optional[BaseException]]:
+    """
+    Run the function on a copy of `value` as a one-case Testing suite, so it gets the harness's
+    deadline, timing and (with `track_memory`) memory measurement. Returns (result, output, error):
+    the harness's result plus what the timed call returned or raised.
+    """
+    recorder = _Recorder(function)
+    tester = Testing()
+    tester.create_testcase(copy.deepcopy(value), expected_output)
+    result = tester.run_tests(recorder, case_timeout=time_limit, track_memory=track_memory)['results'][0]
+    if result['status'] == 'MemoryExceeded':
+        return result, None, MemoryError(result['error'])
+    if not recorder.calls:
+        return result, None, CaseTimeoutError(result['error'])
+    output, error = recorder.calls[0]
+    return result, output, error
+
+
+def call(function: Callable, value: Any, time_limit: float) -> Tuple[Any, Optional[BaseException]]:
+    """(output, None) or (None, the error) for one call on a copy of `value`"""
+    try:
+        with deadline(time_limit):
+            return function(copy.deepcopy(value)), None
+    except MemoryError:
+        raise
+    except Exception as e:
+        return None, e
+
+
+def shrink_candidates(value: Any):
+    """Simpler versions of a failing input, the biggest reductions first"""
+    if isinstance(value, bool):
+        return
+    if isinstance(value, int):
+        for smaller in (0, 1, -1, value // 2, -value):
+            # closer to zero, or the positive twin of a negative number
+            if abs(smaller) < abs(value) or (smaller == -value and value < 0):
+                yield smaller
+        return
+    if isinstance(value, (str, list)):
+        n = len(value)
+        # drop halves, then quarters, ... then single items
+        size = n // 2
+        while size >= 1:
+            for start in range(0, n, size):
+                yield value[:start] + value[start + size:]
+            size //= 2
+        if isinstance(value, list):
+            for i, item in enumerate(value):
+                for smaller in shrink_candidates(item):
+                    yield value[:i] + [smaller] + value[i + 1:]
+        return
+    if isinstance(value, dict):
+        for key in value:
+            yield {k: v for k, v in value.items() if k != key}
+        for key, item in value.items():
+            for smaller in shrink_candidates(item):
+                yield dict(value, **{key: smaller})
+
+
+def _shrink(value: Any, failure: Any, check: Callable[[Any], Any]) -> Tuple[Any, Any, int]:
+    """Greedily simplify `value` while `check` still finds a failure (anything but None) in the candidate"""
+    calls = 0
+    improved = True
+    while improved and calls < SHRINK_MAX_CALLS:
+        improved = False
+        for candidate in shrink_candidates(value):
+            if calls >= SHRINK_MAX_CALLS:
+                break
+            calls += 1
+            candidate_failure = check(candidate)
+            if candidate_failure is not None:
+                value, failure, improved = candidate, candidate_failure, True
+                break
+    return value, failure, calls
+
+
+def shrink(function: Callable, value: Any, error: BaseException, time_limit: float) -> Tuple[Any, BaseException, int]:
+    """
+    Greedily simplify a failing input while it keeps failing with the same exception type,
+    returning (minimal input, its error, calls made).
+    """
+    def check(candidate):
+        _, _, candidate_error = run_case(function, candidate, time_limit)
+        if type(candidate_error) is type(error) and not isinstance(candidate_error, CaseTimeoutError):
+            return candidate_error
+        return None
+
+    return _shrink(value, error, check)
+
+
+def shrink_wrong_answer(function: Callable, reference: Callable, value: Any, failure: Tuple[Any, Any, str],
+                        time_limit: float) -> Tuple[Any, Tuple[Any, Any, str], int]:
+    """
+    Greedily simplify an input the function answers wrongly while its answer still differs from
+    the reference's. `failure` is (expected output, output, error) for `value`; returns (minimal
+    input, its failure, calls made).
+    Candidates the reference raises on are outside the problem's domain and never kept.
+    """
+    def check(candidate):
+        expected_output, reference_error = call(reference, candidate, time_limit)
+        if reference_error is not None:
+            return None
+        result, output, error = run_case(function, candidate, time_limit, expected_output)
+        if error is None and result['status'] != 'Passed':
+            return expected_output, output, result['error']
+        return None
+
+    return _shrink(value, failure, check)
+
+
+def as_json(value: Any) -> Tuple[Any, bool]:
+    """The value as it will look to the client (tuples become lists), and whether it survives JSON"""
+    try:
+        return json.loads(json.dumps(value)), True
+    except (TypeError, ValueError):
+        return None, False
+
+
+def generate_edge_cases(function: Callable, source: str, function_name: str, time_limit: float,
+                        seed: int = EDGE_CASE_SEED, max_cases: int = EDGE_CASE_MAX_CASES,
+                        kind: Optional[str] = None, reference: Optional[Callable] = None) -> Dict[str, Any]:
+    """
+    Run the function on edge-case inputs derived from its source, each through the Testing
+    harness, and record what it does. With a `reference` implementation its outputs are the
+    expected_output of the test cases and answers that differ are failures. Without one there is
+    nothing to check against: the cases carry the function's own observed_output, which
+    describes its current behaviour and can't catch a wrong answer. Inputs that raise, and with a
+    reference inputs answered wrongly, are shrunk to minimal counterexamples and reported as failures. Deterministic for a given seed.
+    """
+    started = time.monotonic()
+    end = started + time_limit
+    kind = kind or infer_input_kind(source, function_name)
+    if kind not in INPUT_KINDS:
+        raise ValueError(f"Unknown input kind: {kind}")
+
+    test_cases, failures, skipped = [], [], []
+    seen_errors = set()
+    shrink_calls = 0
+    large_timed_out = False
+    candidates = candidate_inputs(kind, random.Random(seed))
+    for label, value in candidates:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            skipped.append({"case": label, "reason": "time limit"})
+            continue
+        is_large = label.startswith("large")
+        if is_large and large_timed_out:
+            # the other large inputs would most likely time out the same way
+            skipped.append({"case": label, "reason": "another large input timed out"})
+            continue
+        case_limit = min(EDGE_CASE_TIMEOUT, remaining)
+
+        expected_output = None
+        if reference is not None:
+            expected_output, reference_error = call(reference, value, case_limit)
+            if reference_error is not None:
+                # an input the reference can't handle is most likely outside the problem's domain
+                skipped.append({"case": label, "reason": f"reference raised {type(reference_error).__name__}: "
+                                                         f"{reference_error}"})
+                continue
+            case_limit = min(case_limit, max(end - time.monotonic(), 0.001))
+
+        result, output, error = run_case(function, value, case_limit, expected_output, track_memory=True)
+
+        if isinstance(error, CaseTimeoutError):
+            large_timed_out = large_timed_out or is_large
+            skipped.append({"case": label, "reason": f"TimedOut: {error}"})
+            continue
+        if isinstance(error, MemoryError):
+            skipped.append({"case": label, "reason": "MemoryExceeded: Memory limit exceeded"})
+            continue
+        if error is not None:
+            # one counterexample per kind of failure is enough
+            signature = (type(error).__name__, is_large)
+            if signature in seen_errors:
+                continue
+            seen_errors.add(signature)
+            minimal, minimal_error, calls = shrink(function, value, error,
+                                                   min(EDGE_CASE_TIMEOUT, max(end - time.monotonic(), 0.001)))
+            shrink_calls += calls
+            if any(failure["input"] == minimal for failure in failures):
+                continue
+            failures.append({"case": label, "input": as_json(minimal)[0],
+                             "error": f"{type(minimal_error).__name__}: {minimal_error}",
+                             "shrunk_from_size": len(value) if hasattr(value, '__len__') else None})
+            continue
+
+        if reference is not None and result['status'] != 'Passed':
+            # still a valid test case, its expected_output is the reference's
+            signature = ("WrongAnswer", is_large)
+            if signature not in seen_errors:
+                seen_errors.add(signature)
+                minimal, minimal_failure, calls = shrink_wrong_answer(
+                    function, reference, value, (expected_output, output, result['error']),
+                    min(EDGE_CASE_TIMEOUT, max(end - time.monotonic(), 0.001)))
+                shrink_calls += calls
+                minimal_expected, minimal_output, minimal_error = minimal_failure
+                if (len(json.dumps(minimal)) <= EDGE_CASE_MAX_INPUT_CHARS
+                        and not any(failure["input"] == minimal for failure in failures)):
+                    failures.append({"case": label, "input": as_json(minimal)[0],
+                                     "error": f"WrongAnswer: {minimal_error}",
+                                     "expected_output": as_json(minimal_expected)[0],
+                                     "output": as_json(minimal_output)[0],
+                                     "shrunk_from_size": len(value) if hasattr(value, '__len__') else None})
+
+        case_output = expected_output if reference is not None else output
+        json_output, serializable = as_json(case_output)
+        if not serializable:
+            skipped.append({"case": label, "reason": f"output of type {type(case_output).__name__} isn't JSON"})
+        elif len(json.dumps(value)) > EDGE_CASE_MAX_INPUT_CHARS:
+            skipped.append({"case": label, "reason": "input too large to return"})
+        elif len(test_cases) < max_cases:
+            output_key = "expected_output" if reference is not None else "observed_output"
+            test_cases.append({"input": value, output_key: json_output, "execution_time": result['execution_time'],
+                               "peak_memory_kb": result['peak_memory_kb']})
+
+    elapsed_ms = (time.monotonic() - started) * 1000
+    logging.info(f"Generated {len(test_cases)} local test cases and {len(failures)} failures "
+                 f"for a {kind} input in {elapsed_ms:.1f}ms")
+    return {
+        "test_cases": test_cases,
+        "failures": failures,
+        "skipped": skipped,
+        "input_kind": kind,
+        # where the cases' outputs come from: "reference" (expected_output) or "observed" (observed_output)
+        "outputs": "reference" if reference is not None else "observed",
+        "seed": seed,
+        "stats": {"candidates": len(candidates), "shrink_calls": shrink_calls, "elapsed_ms": round(elapsed_ms, 3)}
+    }
@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import sqlite3
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from metrics import Counter, Gauge, record_stage
+from utils import configure_logging
+
+# Set up logging configuration
+configure_logging()
+
+# Job queue settings (overridable through the environment)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 16))  # threads running test runner jobs, per process
+JOB_QUEUE_DEPTH = int(os.getenv("JOB_QUEUE_DEPTH", 64))  # runner jobs allowed to wait for a worker
+AI_JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", 8))  # threads running AI jobs, each held while waiting on the LLM
+AI_JOB_QUEUE_DEPTH = int(os.getenv("AI_JOB_QUEUE_DEPTH", 32))  # AI jobs allowed to wait for a worker
+JOB_TTL = float(os.getenv("JOB_TTL", 600))  # seconds a finished job can still be fetched
+JOB_MAX_STORED = int(os.getenv("JOB_MAX_STORED", 1000))  # finished jobs kept in memory, oldest dropped first
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", 30))  # longest long-poll a client may ask for, in seconds
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "")  # sqlite file shared by the app's processes, empty for in-memory only
+
+# lane -> (workers, queue depth); every job kind runs in one lane, so a slow LLM provider can only
+# tie up the AI lane's workers and queue while test runs keep going
+JOB_LANES = {"runner": (JOB_WORKERS, JOB_QUEUE_DEPTH), "ai": (AI_JOB_WORKERS, AI_JOB_QUEUE_DEPTH)}
+
+# Metrics
+JOBS = Counter("ecm_jobs_total", "Jobs by kind and outcome", ("kind", "outcome"))
+JOBS_ACTIVE = Gauge("ecm_jobs", "Jobs waiting for a worker and running, by lane", ("lane", "state"))
+
+# a job handler takes the job's params and returns (response body, HTTP status)
+JobHandler = Callable[[Dict[str, Any]], Tuple[Dict[str, Any], int]]
+
+
+class JobError(Exception):
+    """Base exception for job queue failures."""
+    pass
+
+class JobQueueFullError(JobError):
+    """Raised when every worker is busy and the wait queue is already full."""
+    pass
+
+class UnknownJobKindError(JobError):
+    """Raised when a job is submitted for a kind no handler was registered for."""
+    pass
+
+class UnknownJobLaneError(JobError):
+    """Raised when a handler is registered for a lane the queue doesn't have."""
+    pass
+
+
+class Job:
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+    def __init__(self, kind: str, params: Dict[str, Any], keep: bool = True):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.keep = keep  # stored, so it can be fetched by id
+        self.status = Job.QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.http_status: Optional[int] = None
+        self.done = threading.Event()
+        # the submitter's context, so stages recorded by the job land in its request's Server-Timing
+        self.context = contextvars.copy_context()
+
+    def to_dict(self) -> Dict[str, Any]:
+        job = {"id": self.id, "kind": self.kind, "status": self.status, "created": self.created,
+               "started": self.started, "finished": self.finished}
+        if self.done.is_set():
+            job.update(http_status=self.http_status, result=self.result)
+        return job
+
+
+class JobStore:
+    """
+    Finished and pending job records by id, dropped JOB_TTL seconds after they finish. With
+    `disk_path` the records also go to a SQLite file, so a process other than the one running a
+    job (e.g. another gunicorn worker) can answer for it.
+    """
+
+    def __init__(self, ttl: float, max_finished: int, disk_path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self._jobs: Dict[str, Job] = {}
+        self._finished: "OrderedDict[str, float]" = OrderedDict()  # id -> expires_at, oldest first
+        self._lock = threading.Lock()
+
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False, timeout=5)
+            self._db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, expires_at REAL, job TEXT)")
+            self._db.execute("DELETE FROM jobs WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+    def add(self, job: Job):
+        with self._lock:
+            self._jobs[job.id] = job
+        self._write(job, time.time() + self.ttl)
+
+    def discard(self, job_id: str):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                self._db.commit()
+
+    def update(self, job: Job):
+        """Record a status change; finished jobs start their TTL"""
+        expires_at = time.time() + self.ttl
+        if job.done.is_set():
+            with self._lock:
+                self._finished[job.id] = expires_at
+                self._expire(time.time())
+        self._write(job, expires_at)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._expire(time.time())
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self._db is not None:
+            with self._lock:
+                row = self._db.execute("SELECT job FROM jobs WHERE id = ? AND expires_at >= ?",
+                                       (job_id, time.time())).fetchone()
+            if row is not None:
+                return json.loads(row[0])
+        return None
+
+    def local(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _expire(self, now: float):
+        while self._finished:
+            job_id, expires_at = next(iter(self._finished.items()))
+            if expires_at >= now and len(self._finished) <= self.max_finished:
+                break
+            del self._finished[job_id]
+            self._jobs.pop(job_id, None)
+
+    def _write(self, job: Job, expires_at: float):
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO jobs (id, expires_at, job) VALUES (?, ?, ?)",
+                             (job.id, expires_at, json.dumps(job.to_dict(), separators=(',', ':'))))
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"stored": len(self._jobs), "finished": len(self._finished), "disk": self._db is not None}
+
+
+class JobLane:
+    """Worker threads and the bounded wait queue they work off, shared by the job kinds of one lane"""
+
+    def __init__(self, name: str, workers: int, queue_depth: int):
+        self.name = name
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.queue: "queue.Queue[Optional[Job]]" = queue.Queue(maxsize=queue_depth)
+        self.threads = []
+        self.running = 0
+
+
+class JobQueue:
+    """
+    Bounded queues of test runs and AI generations worked off by fixed sets of threads, so the
+    HTTP workers can hand a request over and return. Handlers are registered per job kind and
+    return (response body, HTTP status), the same thing the synchronous routes send. Each kind
+    runs in a lane with its own workers and queue (see JOB_LANES).
+    """
+
+    def __init__(self, lanes: Optional[Dict[str, Tuple[int, int]]] = None, store: Optional[JobStore] = None):
+        self.lanes = {name: JobLane(name, workers, queue_depth)
+                      for name, (workers, queue_depth) in (lanes or JOB_LANES).items()}
+        self.store = store or JobStore(JOB_TTL, JOB_MAX_STORED, disk_path=JOB_DB_PATH or None)
+        self._handlers: Dict[str, JobHandler] = {}
+        self._kind_lanes: Dict[str, JobLane] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def register(self, kind: str, handler: JobHandler, lane: str = "runner"):
+        if lane not in self.lanes:
+            raise UnknownJobLaneError(f"Unknown job lane {lane!r}, expected one of {sorted(self.lanes)}")
+        self._handlers[kind] = handler
+        self._kind_lanes[kind] = self.lanes[lane]
+
+    @property
+    def kinds(self):
+        return sorted(self._handlers)
+
+    def submit(self, kind: str, params: Dict[str, Any], keep: bool = True) -> Job:
+        """
+        Queue a job and return it straight away. `keep=False` is for callers that wait on
+        `job.done` themselves: the job is not stored, so it can't be fetched by id.
+        """
+        if kind not in self._handlers:
+            raise UnknownJobKindError(f"Unknown job kind {kind!r}, expected one of {self.kinds}")
+        lane = self._kind_lanes[kind]
+        self._start_workers(lane)
+
+        job = Job(kind, params, keep)
+        if keep:
+            self.store.add(job)
+        try:
+            lane.queue.put_nowait(job)
+        except queue.Full:
+            if keep:
+                self.store.discard(job.id)
+            JOBS.inc(kind=kind, outcome="rejected")
+            raise JobQueueFullError(f"Too many {lane.name} jobs waiting ({lane.queue_depth}), try again shortly")
+        return job
+
+    def keep(self, job: Job):
+        """Store a job submitted with keep=False after all, so it can be fetched by id"""
+        job.keep = True
+        self.store.add(job)
+        if job.done.is_set():
+            # it may have finished before it was kept, without the update that starts its TTL
+            self.store.update(job)
+
+    def get(self, job_id: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """The job as a dict, after waiting up to `wait` seconds (capped at JOB_MAX_WAIT) for it to finish"""
+        wait = min(max(wait, 0), JOB_MAX_WAIT)
+        job = self.store.local(job_id)
+        if job is not None:
+            job.done.wait(wait)
+            return job.to_dict()
+
+        # run by another process: poll the shared store
+        deadline = time.monotonic() + wait
+        while True:
+            record = self.store.get(job_id)
+            if record is None or record["status"] in (Job.DONE, Job.FAILED) or time.monotonic() >= deadline:
+                return record
+            time.sleep(min(0.2, max(0.0, deadline - time.monotonic())))
+
+    def _start_workers(self, lane: JobLane):
+        # started on first use rather than at import, so a pre-forking server doesn't fork them away
+        with self._lock:
+            if lane.threads or self._closed:
+                return
+            for i in range(lane.workers):
+                thread = threading.Thread(target=self._work, args=(lane,), name=f"job-{lane.name}-{i}", daemon=True)
+                thread.start()
+                lane.threads.append(thread)
+
+    def _work(self, lane: JobLane):
+        while True:
+            job = lane.queue.get()
+            if job is None:
+                return
+            job.context.run(self._run, job, lane)
+
+    def _run(self, job: Job, lane: JobLane):
+        job.started = time.time()
+        record_stage("job_queue", job.started - job.created)
+        job.status = Job.RUNNING
+        with self._lock:
+            lane.running += 1
+        if job.keep:
+            self.store.update(job)
+
+        try:
+            job.result, job.http_status = self._handlers[job.kind](job.params)
+            job.status = Job.DONE
+        except Exception as e:
+            logging.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            job.result, job.http_status = {"err": "An unexpected error occurred. Please try again later."}, 500
+            job.status = Job.FAILED
+        finally:
+            with self._lock:
+                lane.running -= 1
+            job.finished = time.time()
+            job.params = None  # the code and test data aren't needed any more
+            job.done.set()
+            JOBS.inc(kind=job.kind, outcome=job.status)
+            if job.keep:
+                self.store.update(job)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lanes = {name: {
+                "workers": lane.workers,
+                "running": lane.running,
+                "queued": lane.queue.qsize(),
+                "queue_depth": lane.queue_depth
+            } for name, lane in self.lanes.items()}
+        return dict({"lanes": lanes}, **self.store.stats())
+
+    def collect_metrics(self):
+        """Refresh the job gauges, called when metrics are scraped"""
+        for name, lane in self.stats()["lanes"].items():
+            JOBS_ACTIVE.set(lane["queued"], lane=name, state="queued")
+            JOBS_ACTIVE.set(lane["running"], lane=name, state="running")
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            lanes = [(lane, lane.threads) for lane in self.lanes.values()]
+            for lane in self.lanes.values():
+                lane.threads = []
+        for lane, threads in lanes:
+            for _ in threads:
+                try:
+                    lane.queue.put_nowait(None)
+                except queue.Full:
+                    break
+
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue; its worker threads start with the first job"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+            atexit.register(_job_queue.close)
+        return _job_queue
@@ -1,20 +1,47 @@
+import os
 import sys
 import json
-import importlib.util
+import types
+import importlib
 import traceback
 import logging
-from typing import Callable, List, Dict, Any
-from testing import Testing
+import contextlib
+import io
+import math
+import linecache
+import time
+import signal
+from typing import Callable, List, Dict, Any, Optional, Sequence
+from testing import Testing, CaseTimeoutError, deadline
+from validator import validate_and_process_input_output
+from userInputs_edge_case_handler import handleEdgecases
+from utils import configure_logging, Truncated
+from code_cache import USER_CODE_FILENAME, load_code
+from edge_cases import generate_edge_cases
+
+try:
+    import resource
+except ImportError:  # not available on Windows, limits are skipped there
+    resource = None
 
 # Set up logging configuration
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging()
+
+# filename the reference implementation of a comparison run reports in tracebacks
+REFERENCE_CODE_FILENAME = "<reference_code>"
+
+# Execution limits (overridable through the environment)
+RUNNER_CASE_TIMEOUT = float(os.getenv("RUNNER_CASE_TIMEOUT", 2))  # wall-clock seconds per test case
+RUNNER_JOB_TIMEOUT = float(os.getenv("RUNNER_JOB_TIMEOUT", 10))  # wall-clock seconds for a whole job
+RUNNER_CPU_SECONDS = int(os.getenv("RUNNER_CPU_SECONDS", 10))  # CPU seconds a job may consume
+RUNNER_MEMORY_MB = int(os.getenv("RUNNER_MEMORY_MB", 512))  # address space of a runner process
+RUNNER_OUTPUT_BYTES = int(os.getenv("RUNNER_OUTPUT_BYTES", 64 * 1024))  # printed output / file size kept per job
+RUNNER_SHARD_WORKERS = int(os.getenv("RUNNER_SHARD_WORKERS", min(4, os.cpu_count() or 1)))  # processes per large job
 
 def import_user_code(code_file: str):
     try :
-        spec = importlib.util.spec_from_file_location("user_module", code_file)
-        user_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(user_module)
-        return user_module
+        with open(code_file) as f:
+            return load_user_code(f.read())
     except AttributeError as ae:
         raise ae
     except IndexError as ie:
@@ -28,6 +55,79 @@ def import_user_code(code_file: str):
         logging.error("Internal Server Error while importing user code", exc_info=True)
         raise Exception("Internal Server Error: Could not process the request.") from e
 
+def load_user_code(source: str, bytecode: Optional[bytes] = None, filename: str = USER_CODE_FILENAME):
+    """
+    Build a fresh module from the submission without touching the filesystem. `bytecode` is the
+    code object the app already compiled (see code_cache), so the source is only compiled here
+    when it is missing.
+    """
+    user_module = types.ModuleType("user_module")
+    user_module.__file__ = filename
+    # let tracebacks and the profiler show the submitted source lines
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    code = load_code(bytecode) if bytecode else compile(source, filename, 'exec')
+    exec(code, user_module.__dict__)
+    return user_module
+
+class CappedOutput(io.StringIO):
+    """Captures printed output, dropping anything past `limit` characters."""
+
+    def __init__(self, limit: int = RUNNER_OUTPUT_BYTES):
+        super().__init__()
+        self.limit = limit
+        self.truncated = False
+
+    def write(self, s: str) -> int:
+        room = self.limit - self.tell()
+        if room <= 0:
+            self.truncated = True
+        else:
+            if len(s) > room:
+                self.truncated = True
+            super().write(s[:room])
+        return len(s)
+
+    def getvalue(self) -> str:
+        value = super().getvalue()
+        return value + '\n[output truncated]' if self.truncated else value
+
+def apply_resource_limits():
+    """
+    Cap the address space and the size of files this process can write. Pipes aren't files, so
+    the protocol and the log stream the pool forwards (see RunnerWorker) are unaffected.
+    """
+    if resource is None:
+        return
+    memory_bytes = RUNNER_MEMORY_MB * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (RUNNER_OUTPUT_BYTES, RUNNER_OUTPUT_BYTES))
+    # fail the write with an OSError instead of killing the runner
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+
+@contextlib.contextmanager
+def cpu_limit(seconds: int):
+    """
+    Allow the block `seconds` more CPU seconds than the process has used so far. Only the soft
+    limit is moved (an unprivileged process can't raise its hard limit back), and SIGXCPU is
+    turned into CaseTimeoutError so the case is reported as timed out.
+    """
+    if resource is None or not seconds:
+        yield
+        return
+
+    def _on_xcpu(signum, frame):
+        raise CaseTimeoutError("CPU time limit exceeded")
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    previous_handler = signal.signal(signal.SIGXCPU, _on_xcpu)
+    resource.setrlimit(resource.RLIMIT_CPU, (math.ceil(usage.ru_utime + usage.ru_stime) + seconds, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        signal.signal(signal.SIGXCPU, previous_handler)
+
 # Common error handler
 def handle_error(error: Exception, error_type: str):
     logging.error(f"{error_type}: {str(error)}")
@@ -37,47 +137,337 @@ def read_test_data(data_file: str) -> Dict[str, List[Any]]:
     with open(data_file, 'r') as f:
         return json.load(f)
 
-def main():
-    if len(sys.argv) != 4:
-        logging.error("Usage error: Usage: python run_tests.py <user_code_file> <test_data_file> <function_name>")
-        sys.exit(1)
-
-    code_file = sys.argv[1]
-    data_file = sys.argv[2]
-    function_name = sys.argv[3]
-
+def execute_job(user_code, function_name: str, input_data: List[Any], output_data: List[Any],
+                case_timeout: float = RUNNER_CASE_TIMEOUT, job_timeout: float = RUNNER_JOB_TIMEOUT,
+                on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+                options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Run every test case against the user's function and build the response structure.
+    With `on_result`, each result is handed over as soon as it is ready instead of being
+    collected, and the response only carries the summary. `options` carries the per-request
+    run settings (e.g. {"benchmark": true, "memory": true, "profile": true, "workers": 2}).
+    With {"format": "compact"} results carry previews instead of the full test data, and the
+    summary drops its copy of the inputs and outputs. With "reference_code" (and the detected
+    "reference_function") every case is also timed against that implementation.
+    """
+    options = options or {}
+    reference = None
+    if options.get('reference_code'):
+        started = time.monotonic()
+        reference = load_reference(options['reference_code'], options.get('reference_function') or '', job_timeout)
+        job_timeout -= time.monotonic() - started
+    # "isolated" keeps every case on one process so parallel shards can't skew execution_time
+    workers = 1 if options.get('isolated') else max(1, min(int(options.get('workers', RUNNER_SHARD_WORKERS)),
+                                                           RUNNER_SHARD_WORKERS))
+    profiler = None
+    if options.get('profile'):
+        # only imported when asked for, so unprofiled runs don't pay for it
+        from profiler import SubmissionProfiler
+        profiler = SubmissionProfiler(USER_CODE_FILENAME)
     # response structure
     response = {
         "results" : None,
         "tests_summary" : None
     }
-    try:
-        user_code = import_user_code(code_file)
-        test_data = read_test_data(data_file)
-        tester = Testing()
+    tester = Testing()
+    compact = options.get('format') == 'compact'
 
-        input_data = test_data.get('inputs', [])
-        output_data = test_data.get('outputs', [])
+    if len(input_data) != len(output_data):
+        raise ValueError("Mismatch between input_array and output_array lengths.")
 
-        if len(input_data) != len(output_data):
-            raise ValueError("Mismatch between input_array and output_array lengths.")
+    for i in range(len(input_data)):
+        tester.create_testcase(input_data[i], output_data[i])
 
-        for i in range(len(input_data)):
-            tester.create_testcase(input_data[i], output_data[i])
-
-        if hasattr(user_code, function_name):
-            function = getattr(user_code, function_name)
-            test_results = tester.run_tests(function)
+    if hasattr(user_code, function_name):
+        function = getattr(user_code, function_name)
+        if on_result is None:
+            test_results = tester.run_tests(function, case_timeout=case_timeout, job_timeout=job_timeout,
+                                            benchmark=bool(options.get('benchmark')),
+                                            track_memory=bool(options.get('memory')), profiler=profiler,
+                                            workers=workers, reference=reference)
             response['results'] = test_results['results']
+            if compact:
+                response['results'] = [Testing.compact_result(result) for result in response['results']]
             response['tests_summary'] = test_results['tests_summary']
+        else:
+            tests_summary = tester.new_summary()
+            for result in tester.iter_tests(function, tests_summary, case_timeout, job_timeout,
+                                            benchmark=bool(options.get('benchmark')),
+                                            track_memory=bool(options.get('memory')), profiler=profiler,
+                                            workers=workers, reference=reference):
+                on_result(Testing.compact_result(result) if compact else result)
+            response['tests_summary'] = tests_summary
+
+        if compact:
+            del response['tests_summary']['test_inputs'], response['tests_summary']['test_outputs']
+        if profiler is not None:
+            response['profile'] = profiler.report()
+
+    logging.info("Test results: %s", Truncated(response['results']))
+    return response
+
+def load_reference(source: str, function_name: str, time_limit: float):
+    """The reference implementation's function; its top-level code counts against the job budget"""
+    try:
+        with deadline(time_limit):
+            reference_module = load_user_code(source, filename=REFERENCE_CODE_FILENAME)
+    except (CaseTimeoutError, MemoryError):
+        raise
+    except Exception as e:
+        raise RuntimeError(f"reference_code failed to load: {type(e).__name__}: {e}") from e
+
+    if not hasattr(reference_module, function_name):
+        raise AttributeError(f"Function '{function_name}' not found in the reference code.")
+    return getattr(reference_module, function_name)
+
+def execute_complexity_job(user_code, function_name: str, options: Dict[str, Any], time_limit: float) -> Dict[str, Any]:
+    """Sweep the user's function over growing inputs and report its empirical time complexity"""
+    # numpy is only needed here, keep it out of every runner's start-up
+    from complexity import estimate_complexity
+
+    if not hasattr(user_code, function_name):
+        raise AttributeError(f"Function '{function_name}' not found in the submitted code.")
+
+    report = estimate_complexity(getattr(user_code, function_name), time_limit, **options)
+    logging.info(f"Complexity estimate: {report['best_fit']}")
+    return {"complexity": report}
 
+def execute_generate_job(user_code, source: str, function_name: str, options: Dict[str, Any],
+                         time_limit: float) -> Dict[str, Any]:
+    """
+    Generate edge-case test cases by running the user's function on inputs derived from its source.
+    With "reference_code" (and the detected "reference_function") in `options` the expected outputs
+    come from that implementation.
+    """
+    if not hasattr(user_code, function_name):
+        raise AttributeError(f"Function '{function_name}' not found in the submitted code.")
 
-        logging.info(f"Test results: {response['results']}")
+    options = dict(options)
+    reference = None
+    if options.get('reference_code'):
+        started = time.monotonic()
+        reference = load_reference(options.pop('reference_code'), options.pop('reference_function', None) or '',
+                                   time_limit)
+        time_limit -= time.monotonic() - started
+    return {"generated": generate_edge_cases(getattr(user_code, function_name), source, function_name,
+                                             time_limit, reference=reference, **options)}
+
+def run_job(job: Dict[str, Any], emit: Optional[Callable[[Dict[str, Any]], None]] = None,
+            payloads: Sequence[bytes] = ()) -> Dict[str, Any]:
+    """
+    Handle one job received by a pooled worker, capturing anything the user code prints.
+    Jobs run the test cases unless their `kind` is "complexity" or "generate" (batches are split
+    up by serve). For streaming jobs every result is passed to `emit` as a {"frame": "result"}
+    record first. When the job comes with `payloads`, they are the raw JSON input and output
+    strings of the request, parsed here once, followed by the submission's marshalled code object
+    when the job has "bytecode" set.
+    """
+    on_result = None
+    if job.get('stream') and emit is not None:
+        on_result = lambda result: emit({"frame": "result", "result": result})
+
+    bytecode = None
+    if job.pop('bytecode', False) and payloads:
+        bytecode, payloads = payloads[-1], payloads[:-1]
+
+    captured = CappedOutput()
+    started = time.monotonic()
+    timings = {}
+    try:
+        with contextlib.redirect_stdout(captured), contextlib.redirect_stderr(captured), cpu_limit(RUNNER_CPU_SECONDS):
+            if payloads:
+                job['inputs'], job['outputs'] = handleEdgecases(*validate_and_process_input_output(*payloads))
+                timings['parse'] = time.monotonic() - started
+            # top-level code in the submission counts against the job budget as well
+            stage_started = time.monotonic()
+            with deadline(max(RUNNER_JOB_TIMEOUT - (stage_started - started), 0.001)):
+                user_code = load_user_code(job['code'], bytecode)
+            timings['module_load'] = time.monotonic() - stage_started
+            stage_started = time.monotonic()
+            remaining = RUNNER_JOB_TIMEOUT - (stage_started - started)
+            if job.get('kind') == 'complexity':
+                response = execute_complexity_job(user_code, job.get('function_name') or '',
+                                                  job.get('options') or {}, remaining)
+            elif job.get('kind') == 'generate':
+                response = execute_generate_job(user_code, job['code'], job.get('function_name') or '',
+                                                job.get('options') or {}, remaining)
+            else:
+                response = execute_job(user_code, job.get('function_name') or '',
+                                       job.get('inputs', []), job.get('outputs', []),
+                                       job_timeout=remaining, on_result=on_result, options=job.get('options'))
+            timings['execute'] = time.monotonic() - stage_started
+    except MemoryError:
+        logging.error("MemoryExceeded: memory limit exceeded while running the job")
+        response = {"err": "MemoryExceeded: Memory limit exceeded"}
+    except CaseTimeoutError as e:
+        logging.error("TimedOut: %s", e)
+        response = {"err": f"TimedOut: {str(e)}"}
+    except Exception as e:
+        error_type = type(e).__name__
+        logging.error("%s: %s", error_type, Truncated(str(e)))
+        response = {"err": f"{error_type}: {str(e)}"}
+
+    response['stderr'] = captured.getvalue()
+    # seconds per stage, turned into metrics by the runner pool
+    response['timings'] = timings
+    return response
+
+def run_in_fork(work: Callable[[Callable[[Dict[str, Any]], None]], Dict[str, Any]],
+                forward: Optional[Callable[[bytes], None]] = None) -> bytes:
+    """
+    Run `work(emit)` in a forked child and return its response as a JSON line. The worker itself
+    never runs user code, so whatever a submission changes (builtins, sys.modules, threads it
+    started) ends with the child and the next job starts from a clean copy. Frames the child
+    emits are handed to `forward` as raw JSON lines while it runs.
+    """
+    if not hasattr(os, 'fork'):
+        # no fork on Windows: run in place, the pool retires the runner after every job there
+        def emit_in_place(frame: Dict[str, Any]):
+            if forward is not None:
+                forward(json.dumps(frame).encode() + b'\n')
+        return json.dumps(work(emit_in_place)).encode() + b'\n'
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        # user code reading stdin would otherwise eat the next job
+        os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+        status = 1
+        try:
+            with os.fdopen(write_fd, 'w') as out:
+                def emit(frame: Dict[str, Any]):
+                    out.write(json.dumps(frame) + '\n')
+                    out.flush()
+                out.write(json.dumps(work(emit)) + '\n')
+            status = 0
+        except BaseException:
+            logging.error("Job process failed", exc_info=True)
+        finally:
+            # skip atexit handlers and whatever threads the submission left running
+            os._exit(status)
+
+    os.close(write_fd)
+    response = None
+    with os.fdopen(read_fd, 'rb') as pipe:
+        for line in pipe:
+            # frames are built with "frame" as their first key
+            if line.startswith(b'{"frame"'):
+                if forward is not None:
+                    forward(line)
+            else:
+                response = line
+    _, status = os.waitpid(pid, 0)
+    if response is None:
+        error = f"RuntimeError: The test process exited with code {os.waitstatus_to_exitcode(status)} before finishing"
+        logging.error(error)
+        response = json.dumps({"err": error, "stderr": ""}).encode() + b'\n'
+    return response
+
+def run_batch_job(job: Dict[str, Any], emit: Callable[[Dict[str, Any]], None],
+                  payloads: Sequence[bytes]) -> Dict[str, Any]:
+    """
+    Grade several submissions against one test suite. The suite (the first two payloads) is
+    parsed and checked once; each entry of job["submissions"] then runs as its own job in its own
+    fork, with its own limits and captured output and an untouched copy of the suite, and is
+    reported as a {"frame": "submission"} record. The marshalled code objects of the submissions
+    that have "bytecode" set follow the suite, in order.
+    """
+    if not hasattr(os, 'fork'):
+        return {"err": "NotSupported: Batch grading needs os.fork to isolate submissions", "stderr": ""}
+
+    started = time.monotonic()
+    try:
+        inputs, outputs = handleEdgecases(*validate_and_process_input_output(*payloads[:2]))
+    except MemoryError:
+        logging.error("MemoryExceeded: memory limit exceeded while parsing the test suite")
+        return {"err": "MemoryExceeded: Memory limit exceeded", "stderr": ""}
+    except Exception as e:
+        logging.error("%s: %s", type(e).__name__, Truncated(str(e)))
+        return {"err": f"{type(e).__name__}: {str(e)}", "stderr": ""}
+    timings = {"parse": time.monotonic() - started}
+
+    bytecodes = iter(payloads[2:])
+    submissions = job.get('submissions') or []
+    for submission in submissions:
+        submission_job = {"code": submission['code'], "function_name": submission.get('function_name'),
+                          "options": job.get('options'), "inputs": inputs, "outputs": outputs}
+        submission_payloads = ()
+        if submission.get('bytecode'):
+            submission_job['bytecode'] = True
+            submission_payloads = (next(bytecodes),)
+        response = run_in_fork(lambda _: run_job(submission_job, payloads=submission_payloads))
+        emit({"frame": "submission", "index": submission['index'], "response": json.loads(response)})
+
+    return {"submissions": len(submissions), "stderr": "", "timings": timings}
+
+def preload_for(job: Dict[str, Any]):
+    """Import what a job kind needs in the worker itself, so every later fork starts with it loaded"""
+    if job.get('kind') == 'complexity':
+        importlib.import_module('complexity')
+    if (job.get('options') or {}).get('profile'):
+        importlib.import_module('profiler')
+
+def serve():
+    """
+    Worker loop used by the runner pool: read one JSON job header per line from stdin, plus the
+    raw payloads it announces, and write the response back on the original stdout as JSON lines.
+    Streaming jobs write one {"frame": "result"} line per test case before the final response
+    line. Every job runs in a fresh fork of this process (see run_in_fork).
+    """
+    # Keep the real stdout for the protocol and point fd 1 at stderr, so stray output
+    # from user code (even outside the per-job capture) can't corrupt the pipe
+    protocol_out = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    apply_resource_limits()
+
+    def write(line: bytes):
+        protocol_out.write(line)
+        protocol_out.flush()
+
+    def emit(frame: Dict[str, Any]):
+        write(json.dumps(frame).encode() + b'\n')
+
+    stdin = sys.stdin.buffer
+    while True:
+        line = stdin.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError as e:
+            emit({"err": f"JSONDecodeError: {str(e)}", "stderr": ""})
+            continue
+        # length-prefixed raw payloads follow the header line
+        payloads = [stdin.read(size) for size in job.pop('payloads', None) or []]
+        if job.get('kind') == 'batch':
+            emit(run_batch_job(job, emit, payloads))
+        else:
+            preload_for(job)
+            write(run_in_fork(lambda child_emit: run_job(job, child_emit, payloads), write))
+
+def main():
+    if len(sys.argv) == 2 and sys.argv[1] == '--worker':
+        serve()
+        return
+
+    if len(sys.argv) != 4:
+        logging.error("Usage error: Usage: python run_tests.py <user_code_file> <test_data_file> <function_name>")
+        sys.exit(1)
+
+    code_file = sys.argv[1]
+    data_file = sys.argv[2]
+    function_name = sys.argv[3]
+
+    try:
+        apply_resource_limits()
+        user_code = import_user_code(code_file)
+        test_data = read_test_data(data_file)
+        response = execute_job(user_code, function_name,
+                               test_data.get('inputs', []), test_data.get('outputs', []))
         print(json.dumps(response))
-    # except Exception as e:
-    #     error_message = f"Error: {str(e)}"
-    #     logging.error(f"Test execution failed: {str(e)}")
-    #     print(json.dumps({"err": error_message}))
     except Exception as e:
         # Catch all exceptions, and handle accordingly
         error_type = type(e).__name__
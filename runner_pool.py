@@ -0,0 +1,382 @@
+import os
+import sys
+import json
+import time
+import queue
+import select
+import signal
+import contextlib
+import atexit
+import logging
+import threading
+import subprocess
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from run_tests import RUNNER_JOB_TIMEOUT
+from metrics import Counter, Gauge, record_stage, stage
+from code_cache import try_compile_user_code
+from utils import configure_logging
+
+# Set up logging configuration
+configure_logging()
+
+# Pool settings (overridable through the environment)
+RUNNER_POOL_SIZE = int(os.getenv("RUNNER_POOL_SIZE", 2))  # number of warm runner processes
+RUNNER_MAX_JOBS = int(os.getenv("RUNNER_MAX_JOBS", 100))  # jobs a runner forks before it is recycled
+RUNNER_QUEUE_DEPTH = int(os.getenv("RUNNER_QUEUE_DEPTH", 16))  # requests allowed to wait for a free runner
+RUNNER_KILL_GRACE = float(os.getenv("RUNNER_KILL_GRACE", 2))  # seconds past the job limit before a runner is killed
+
+RUN_TESTS_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run_tests.py')
+
+# Metrics
+RUNNER_JOBS = Counter("ecm_runner_jobs_total", "Jobs handed to the runner pool by outcome", ("outcome",))
+RUNNER_RECYCLED = Counter("ecm_runner_recycled_total", "Runner processes replaced after max jobs or a crash")
+POOL_RUNNERS = Gauge("ecm_runner_pool_runners", "Runner processes by state, and requests waiting for one",
+                     ("state",))
+
+
+class RunnerPoolError(Exception):
+    """Base exception for runner pool failures."""
+    pass
+
+class RunnerPoolFullError(RunnerPoolError):
+    """Raised when every runner is busy and the wait queue is already full."""
+    pass
+
+class RunnerCrashedError(RunnerPoolError):
+    """Raised when a runner process dies while handling a job."""
+    pass
+
+class RunnerTimeoutError(RunnerPoolError):
+    """Raised when a runner blows through the job deadline and has to be killed."""
+    pass
+
+
+class RunnerWorker:
+    """A single pre-started `run_tests.py --worker` process talking JSON lines over its pipes."""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, RUN_TESTS_SCRIPT, '--worker'],
+            # stderr is a pipe rather than the server's own stream: runners can't write files past
+            # RLIMIT_FSIZE, which would silence their logs once a redirected server log grows past it
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0,
+            cwd=os.path.dirname(RUN_TESTS_SCRIPT),
+            # own process group, so a kill also reaches the shard processes a job forks
+            start_new_session=hasattr(os, 'killpg')
+        )
+        self.jobs_done = 0
+        self._buffer = bytearray()
+        threading.Thread(target=self._forward_stderr, name=f"runner-stderr-{self.process.pid}",
+                         daemon=True).start()
+
+    def _forward_stderr(self):
+        """Copy the runner's log lines to the server's stderr until the runner exits"""
+        for line in self.process.stderr:
+            sys.stderr.write(line.decode(errors='replace'))
+            sys.stderr.flush()
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def run(self, job: Dict[str, Any], timeout: float = RUNNER_JOB_TIMEOUT + RUNNER_KILL_GRACE,
+            payloads: Sequence[bytes] = ()) -> Dict[str, Any]:
+        """Run a job and return its final response"""
+        for frame in self.stream(job, timeout, payloads):
+            pass
+        return frame
+
+    def stream(self, job: Dict[str, Any], timeout: float = RUNNER_JOB_TIMEOUT + RUNNER_KILL_GRACE,
+               payloads: Sequence[bytes] = ()) -> Iterator[Dict[str, Any]]:
+        """
+        Run a job, yielding every {"frame": ...} record ("result" per test case, "submission" per
+        graded submission of a batch) as it arrives and the final response last.
+        The job goes out as one JSON header line listing the sizes of its `payloads`, followed by the
+        raw payload bytes, so large test data is passed through without being serialized again.
+        """
+        finished = False
+        self.jobs_done += 1
+        try:
+            try:
+                self._write_all(json.dumps(dict(job, payloads=[len(payload) for payload in payloads])).encode() + b'\n')
+                for payload in payloads:
+                    self._write_all(payload)
+            except (BrokenPipeError, OSError) as e:
+                raise RunnerCrashedError(f"Runner process is not reachable: {e}")
+
+            job_deadline = time.monotonic() + timeout
+            decode_seconds = 0.0
+            while True:
+                line = self._read_line(job_deadline)
+                if line is None:
+                    # the runner ignored its own limits, so it can't be trusted with another job
+                    raise RunnerTimeoutError(f"Test run exceeded the {timeout:.0f}s time limit")
+                if not line:
+                    finished = True
+                    raise RunnerCrashedError(f"Runner process exited with code {self.process.wait()}")
+
+                decode_started = time.perf_counter()
+                frame = json.loads(line)
+                decode_seconds += time.perf_counter() - decode_started
+                if 'frame' in frame:
+                    yield frame
+                else:
+                    finished = True
+                    record_stage("decode", decode_seconds)
+                    yield frame
+                    return
+        finally:
+            if not finished:
+                # timed out, or the consumer went away mid-job: the rest of the output is unwanted
+                self.kill()
+
+    def kill(self):
+        if self.is_alive():
+            if hasattr(os, 'killpg'):
+                try:
+                    os.killpg(self.process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            else:
+                self.process.kill()
+        self.process.wait()
+
+    def _write_all(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            written = self.process.stdin.write(view)
+            view = view[written:]
+
+    def _read_line(self, deadline: float) -> Optional[bytes]:
+        """Read one response line, returning None at the deadline and b'' if the runner exits"""
+        fd = self.process.stdout.fileno()
+        newline = self._buffer.find(b'\n')
+        while newline < 0:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                return None
+            chunk = os.read(fd, 1 << 20)
+            if not chunk:
+                return b''
+            scanned = len(self._buffer)
+            self._buffer += chunk
+            newline = self._buffer.find(b'\n', scanned)
+        line = bytes(self._buffer[:newline])
+        del self._buffer[:newline + 1]
+        return line
+
+    def stop(self):
+        if self.is_alive():
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except Exception:
+                self.process.kill()
+                self.process.wait()
+
+
+class RunnerPool:
+    """
+    Keeps a fixed number of warm runner processes and hands them out one job at a time.
+    Each job runs in a fresh fork of its runner, which never runs user code itself. Runners are
+    replaced after `max_jobs` jobs (after every job where fork is unavailable) or as soon as one
+    crashes.
+    """
+
+    def __init__(self, size: int = RUNNER_POOL_SIZE, max_jobs: int = RUNNER_MAX_JOBS,
+                 queue_depth: int = RUNNER_QUEUE_DEPTH):
+        self.size = size
+        # without fork, jobs run inside the runner and it can't be trusted with another one
+        self.max_jobs = max_jobs if hasattr(os, 'fork') else 1
+        self.queue_depth = queue_depth
+        self._idle: "queue.Queue[RunnerWorker]" = queue.Queue()
+        self._slots = threading.BoundedSemaphore(size + queue_depth)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._closed = False
+
+        for _ in range(size):
+            self._idle.put(RunnerWorker())
+        logging.info(f"Started runner pool with {size} workers (max_jobs={max_jobs}, queue_depth={queue_depth})")
+
+    @contextlib.contextmanager
+    def _checkout(self) -> Iterator[RunnerWorker]:
+        if not self._slots.acquire(blocking=False):
+            RUNNER_JOBS.inc(outcome="rejected")
+            raise RunnerPoolFullError("All test runners are busy. Please try again shortly.")
+
+        try:
+            with self._lock:
+                self._in_flight += 1
+            with stage("runner_wait"):
+                worker = self._idle.get()
+            try:
+                yield worker
+                RUNNER_JOBS.inc(outcome="ok")
+            except RunnerTimeoutError:
+                RUNNER_JOBS.inc(outcome="timeout")
+                raise
+            except RunnerCrashedError:
+                RUNNER_JOBS.inc(outcome="crashed")
+                raise
+            finally:
+                self._release(worker)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def run(self, user_code: str, function_name: str, input_data: str, output_data: str,
+            options: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], str]:
+        """
+        Run a job on the next free runner and return (result_json, stderr_output). `input_data` and
+        `output_data` are the request's JSON test data strings, parsed by the runner itself.
+        """
+        return self.execute(self._job(user_code, function_name, options), self._payloads(input_data, output_data))
+
+    def run_cases(self, user_code: str, function_name: str, inputs: List[Any], outputs: List[Any],
+                  options: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], str]:
+        """
+        run() for test cases the app already holds decoded (e.g. generated ones): one case per
+        entry, sent in the job itself, so the runner skips parsing and edge case handling.
+        """
+        return self.execute(dict(self._job(user_code, function_name, options), inputs=inputs, outputs=outputs))
+
+    def execute(self, job: Dict[str, Any], payloads: Sequence[bytes] = ()) -> Tuple[Dict[str, Any], str]:
+        """Send an already built job (e.g. {"kind": "complexity", ...}) and return (result_json, stderr_output)"""
+        job, payloads = self._with_bytecode(job, payloads)
+        with self._checkout() as worker, stage("runner"):
+            result_json = worker.run(job, payloads=payloads)
+
+        self.record_timings(result_json)
+        stderr_output = result_json.pop('stderr', '')
+        return result_json, stderr_output
+
+    def stream(self, user_code: str, function_name: str, input_data: str, output_data: str,
+               options: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Run a job on the next free runner, yielding {"frame": "result", "result": {...}} as each
+        test case finishes and then the final response (tests_summary, or err, plus stderr).
+        """
+        job, payloads = self._with_bytecode(self._job(user_code, function_name, options, stream=True),
+                                            self._payloads(input_data, output_data))
+        with self._checkout() as worker:
+            for frame in worker.stream(job, payloads=payloads):
+                if frame.get('frame') != 'result':
+                    self.record_timings(frame)
+                yield frame
+
+    def batch(self, submissions: List[Dict[str, Any]], input_data: str, output_data: str,
+              options: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[int, Dict[str, Any], str]]:
+        """
+        Grade submissions ({"index", "code", "function_name"}) against one test suite on the next
+        free runner, which parses the suite once for all of them and grades each one in its own
+        fork. Yields (index, result_json, stderr_output) as each submission finishes; each gets the
+        usual per-job time limit.
+        """
+        job = {"kind": "batch", "options": options or {}, "submissions": []}
+        payloads = list(self._payloads(input_data, output_data))
+        for submission in submissions:
+            entry = {key: submission[key] for key in ("index", "code", "function_name")}
+            compiled = try_compile_user_code(submission['code'])
+            if compiled is not None:
+                entry['bytecode'] = True
+                payloads.append(compiled.bytecode)
+            job['submissions'].append(entry)
+
+        reported = set()
+        with self._checkout() as worker:
+            for frame in worker.stream(job, RUNNER_JOB_TIMEOUT * len(submissions) + RUNNER_KILL_GRACE, payloads):
+                if frame.get('frame') == 'submission':
+                    response = frame['response']
+                    self.record_timings(response)
+                    reported.add(frame['index'])
+                    yield frame['index'], response, response.pop('stderr', '')
+                elif 'err' in frame:
+                    # the suite itself was rejected: the same error stands for every submission
+                    for submission in submissions:
+                        if submission['index'] not in reported:
+                            yield submission['index'], {"err": frame['err']}, ''
+                else:
+                    self.record_timings(frame)
+
+    @staticmethod
+    def record_timings(response: Dict[str, Any]):
+        """Turn the stage timings a runner reports (module load, test execution) into metrics"""
+        for stage_name, seconds in (response.pop('timings', None) or {}).items():
+            record_stage(stage_name, seconds)
+
+    @staticmethod
+    def _job(user_code, function_name, options=None, stream=False) -> Dict[str, Any]:
+        return {
+            "code": user_code,
+            "function_name": function_name,
+            "options": options or {},
+            "stream": stream
+        }
+
+    @staticmethod
+    def _payloads(input_data: str, output_data: str) -> Tuple[bytes, bytes]:
+        # the runner reads these as the job's "inputs" and "outputs"
+        return input_data.encode(), output_data.encode()
+
+    @staticmethod
+    def _with_bytecode(job: Dict[str, Any], payloads: Sequence[bytes]) -> Tuple[Dict[str, Any], Sequence[bytes]]:
+        """Send the submission's cached code object along, so the runner doesn't compile it again"""
+        compiled = try_compile_user_code(job.get('code', ''))
+        if compiled is None:
+            return job, payloads
+        return dict(job, bytecode=True), (*payloads, compiled.bytecode)
+
+    def _release(self, worker: RunnerWorker):
+        if self._closed:
+            worker.stop()
+            return
+
+        if not worker.is_alive() or worker.jobs_done >= self.max_jobs:
+            logging.info(f"Recycling runner pid={worker.process.pid} after {worker.jobs_done} jobs")
+            RUNNER_RECYCLED.inc()
+            worker.stop()
+            worker = RunnerWorker()
+        self._idle.put(worker)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            in_flight = self._in_flight
+        idle = self._idle.qsize()
+        return {
+            "size": self.size,
+            "idle": idle,
+            "busy": self.size - idle,
+            "queued": max(0, in_flight - self.size),
+            "queue_depth": self.queue_depth
+        }
+
+    def collect_metrics(self):
+        """Refresh the pool saturation gauges, called when metrics are scraped"""
+        stats = self.stats()
+        for state in ("idle", "busy", "queued"):
+            POOL_RUNNERS.set(stats[state], state=state)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+_pool: Optional[RunnerPool] = None
+_pool_lock = threading.Lock()
+
+def get_runner_pool() -> RunnerPool:
+    """Return the process-wide runner pool, starting it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RunnerPool()
+            atexit.register(_pool.close)
+        return _pool
@@ -1,11 +1,54 @@
-import logging, time
-from typing import Callable, List, Dict, Any
+import logging, time, signal, threading, contextlib, copy, gc, statistics, tracemalloc, io, sys, math, multiprocessing, reprlib
+from typing import Callable, List, Dict, Any, Optional, Iterator
+from utils import configure_logging
 
 # Set up logging configuration
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging()
+
+# Benchmark mode settings
+BENCHMARK_WARMUP = 2  # untimed calls before measuring
+BENCHMARK_REPEAT = 7  # timed samples per test case
+BENCHMARK_MIN_SAMPLE_TIME = 0.01  # seconds a sample should take; fast functions get more loops per sample
+BENCHMARK_MAX_LOOPS = 1000  # cap on loops per sample (each loop needs its own copy of the input)
+BENCHMARK_MAX_COPY_TIME = 0.05  # seconds of input copying per sample, caps the loops (and copies held) for large inputs
+BENCHMARK_MAX_TIME = 0.5  # seconds of repeated calls and copies per test case, fewer samples are taken past this
+BENCHMARK_DEADLINE_MARGIN = 0.1  # seconds of the case's time limit that repeated calls leave untouched
+
+# Reference comparison settings (timing reuses BENCHMARK_WARMUP and BENCHMARK_MIN_SAMPLE_TIME)
+COMPARE_REPEAT = 9  # paired samples (user, reference) per test case
+COMPARE_MAX_TIME = 1.0  # seconds of repeated calls and copies per test case (calibration included), fewer pairs past this
+LARGE_INPUT_QUANTILE = 0.75  # cases at or above this quantile of input size count as "large inputs"
+COMPARE_MIN_CASES = 5  # large inputs get their own ratio and verdict only with at least this many cases
+
+# two-sided 95% Student's t critical values by degrees of freedom; past the table the normal 1.96 is used
+_T95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+        10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042}
+
+# Sharded execution settings
+SHARD_MIN_CASES = 64  # smaller suites run serially, forking workers would cost more than it saves
+SHARDS_PER_WORKER = 4  # shards handed to each worker, so uneven cases still balance out
+SHARD_GRACE = 1  # seconds past the job deadline to wait for a shard that is finishing its last case
+
+# Compact result settings
+PREVIEW_ITEMS = 10  # list items / dict entries shown in a value preview
+PREVIEW_CHARS = 80  # characters shown of a string inside a preview
+ERROR_PREVIEW_CHARS = 500  # characters of an error message kept in compact results
+
+_preview_repr = reprlib.Repr()
+_preview_repr.maxlevel = 3
+_preview_repr.maxlist = _preview_repr.maxtuple = _preview_repr.maxdict = _preview_repr.maxset = PREVIEW_ITEMS
+_preview_repr.maxstring = _preview_repr.maxother = _preview_repr.maxlong = PREVIEW_CHARS
 
 # timer decorator to measure execution time .,
-def timer(func):
+def timer(func, benchmark: bool = False):
+    """
+    Wrap `func` so it returns (result, execution_time_ms).
+    With `benchmark=True` it returns (result, execution_time_ms, timing) instead: the call is
+    warmed up and repeated timeit-style on fresh copies of the arguments with GC disabled,
+    execution_time_ms is the median per-call time and `timing` holds min/median/p95/stddev.
+    Only the first call counts towards the case's time limit: the repeats (copies included) stop
+    early rather than run into it, and on their own budget of BENCHMARK_MAX_TIME.
+    """
     def wrapper(*args, **kwargs):
         start_time = time.perf_counter()
         result = func(*args, **kwargs)
@@ -14,8 +57,310 @@ def timer(func):
         execution_time_ms = round(execution_time_ms, 4)
         return result, execution_time_ms
 
+    def benchmark_wrapper(*args, **kwargs):
+        # the first call on pristine arguments is the one whose result gets checked
+        call_args, call_kwargs, copy_time = _timed_copy(args, kwargs)
+        start_time = time.perf_counter()
+        result = func(*call_args, **call_kwargs)
+        first_call = time.perf_counter() - start_time
+
+        # the repeated calls are the harness's own work, so they stop before they could time the case out
+        budget_end = _repeat_budget_end(BENCHMARK_MAX_TIME)
+        for _ in range(BENCHMARK_WARMUP):
+            if time.perf_counter() + first_call + copy_time > budget_end:
+                break
+            func(*copy.deepcopy(args), **copy.deepcopy(kwargs))
+
+        samples, loops = [first_call], 1
+        if time.perf_counter() + first_call + copy_time <= budget_end:
+            loops, sample = _calibrate(func, args, kwargs, copy_time, budget_end)
+            samples = [sample]
+            while (len(samples) < BENCHMARK_REPEAT
+                   and time.perf_counter() + (sample + copy_time) * loops < budget_end):
+                samples.append(_time_calls(func, args, kwargs, loops))
+
+        samples_ms = sorted(s * 1000 for s in samples)
+        timing = {
+            "min": round(samples_ms[0], 4),
+            "median": round(statistics.median(samples_ms), 4),
+            "p95": round(samples_ms[min(len(samples_ms) - 1, int(0.95 * len(samples_ms)))], 4),
+            "stddev": round(statistics.stdev(samples_ms), 4) if len(samples_ms) > 1 else 0.0,
+            "samples": len(samples_ms),
+            "loops": loops
+        }
+        return result, timing['median'], timing
+
+    return benchmark_wrapper if benchmark else wrapper
+
+def compare_timer(func, reference):
+    """
+    Wrap `func` so it returns (result, execution_time_ms, comparison), timing it against
+    `reference` on the same arguments. Both are warmed up and calibrated like benchmark mode,
+    then sampled in alternating pairs so drift hits both alike. `comparison` holds the reference's
+    result and median time, the speed ratio (func time / reference time, above 1 is slower) with
+    its 95% confidence interval (None with a single pair), and min/median/p95/stddev of func's own
+    samples as `timing`. As in benchmark mode, the repeats (copies included) stop early rather than
+    run into the case's time limit, and on their own budget of COMPARE_MAX_TIME.
+    """
+    def wrapper(*args):
+        call_args, _, copy_time = _timed_copy(args, {})
+        start_time = time.perf_counter()
+        result = func(*call_args)
+        first_call = time.perf_counter() - start_time
+        first_call_ms = round(first_call * 1000, 4)
+        try:
+            start_time = time.perf_counter()
+            reference_result = reference(*copy.deepcopy(args))
+            reference_first_call = time.perf_counter() - start_time
+        except (CaseTimeoutError, MemoryError):
+            raise
+        except Exception as e:
+            # the submission did its part, only the comparison is lost
+            return result, first_call_ms, {"error": f"Reference failed with error: {str(e)}"}
+
+        budget_end = _repeat_budget_end(COMPARE_MAX_TIME)
+        pair_time = first_call + reference_first_call + 2 * copy_time
+        for _ in range(BENCHMARK_WARMUP):
+            if time.perf_counter() + pair_time > budget_end:
+                break
+            func(*copy.deepcopy(args))
+            reference(*copy.deepcopy(args))
+
+        # with no room left for timed pairs the first calls are the only sample
+        loops = reference_loops = 1
+        samples, reference_samples = [first_call], [reference_first_call]
+        if time.perf_counter() + pair_time <= budget_end:
+            loops, sample = _calibrate(func, args, {}, copy_time, budget_end)
+            reference_loops, reference_sample = _calibrate(reference, args, {}, copy_time, budget_end)
+            samples, reference_samples = [sample], [reference_sample]
+            pair_time = (sample + copy_time) * loops + (reference_sample + copy_time) * reference_loops
+        while len(samples) < COMPARE_REPEAT and time.perf_counter() + pair_time < budget_end:
+            if len(samples) % 2:
+                reference_samples.append(_time_calls(reference, args, {}, reference_loops))
+                samples.append(_time_calls(func, args, {}, loops))
+            else:
+                samples.append(_time_calls(func, args, {}, loops))
+                reference_samples.append(_time_calls(reference, args, {}, reference_loops))
+
+        samples_ms = sorted(s * 1000 for s in samples)
+        ratio, low, high = ratio_interval([math.log(max(s, 1e-12) / max(r, 1e-12))
+                                           for s, r in zip(samples, reference_samples)])
+        comparison = {
+            "reference_result": reference_result,
+            "reference_time": round(statistics.median(reference_samples) * 1000, 4),
+            "ratio": round(ratio, 3),
+            "ci": [round(low, 3), round(high, 3)] if low is not None else None,
+            "samples": len(samples),
+            "timing": {
+                "min": round(samples_ms[0], 4),
+                "median": round(statistics.median(samples_ms), 4),
+                "p95": round(samples_ms[min(len(samples_ms) - 1, int(0.95 * len(samples_ms)))], 4),
+                "stddev": round(statistics.stdev(samples_ms), 4) if len(samples_ms) > 1 else 0.0,
+                "samples": len(samples_ms),
+                "loops": loops
+            }
+        }
+        return result, comparison['timing']['median'], comparison
+
     return wrapper
 
+def ratio_interval(log_ratios: List[float]) -> tuple:
+    """
+    Geometric mean ratio and its 95% confidence interval from log ratios (t interval on the logs).
+    A single ratio has no spread to go by, so its interval bounds are None.
+    """
+    mean = statistics.fmean(log_ratios)
+    if len(log_ratios) < 2:
+        return math.exp(mean), None, None
+    df = len(log_ratios) - 1
+    t = _T95[max(key for key in _T95 if key <= df)] if df <= max(_T95) else 1.96
+    half_width = t * statistics.stdev(log_ratios) / math.sqrt(len(log_ratios))
+    return math.exp(mean), math.exp(mean - half_width), math.exp(mean + half_width)
+
+def summarize_comparison(cases: List[tuple], disagreements: int) -> Dict[str, Any]:
+    """
+    Aggregate speed ratio over the compared cases, given as (ratio, input size or None), plus the
+    same for the largest inputs when there are at least COMPARE_MIN_CASES of them, and a one line
+    verdict from the large inputs if they have their own ratio, all cases otherwise
+    """
+    summary = {"compared": len(cases), "disagreements": disagreements}
+    if not cases:
+        summary["verdict"] = "No test case could be timed against the reference."
+        return summary
+
+    ratio, low, high = ratio_interval([math.log(max(ratio, 1e-12)) for ratio, _ in cases])
+    summary.update(ratio=round(ratio, 3), ci=[round(low, 3), round(high, 3)] if low is not None else None)
+
+    sizes = sorted(size for _, size in cases if size is not None)
+    scope = "across all test cases"
+    if sizes and sizes[0] != sizes[-1]:
+        threshold = sizes[min(len(sizes) - 1, int(LARGE_INPUT_QUANTILE * len(sizes)))]
+        large = [case_ratio for case_ratio, size in cases if size is not None and size >= threshold]
+        # a handful of large cases says more about noise than about scaling
+        if len(large) >= COMPARE_MIN_CASES:
+            ratio, low, high = ratio_interval([math.log(max(r, 1e-12)) for r in large])
+            summary["large_inputs"] = {"min_size": threshold, "cases": len(large), "ratio": round(ratio, 3),
+                                       "ci": [round(low, 3), round(high, 3)]}
+            scope = f"on large inputs (size >= {threshold})"
+
+    if low is None:
+        verdict = f"No significant difference from the reference: one timed case is too few to tell ({ratio:.2f}x)."
+    elif low <= 1 <= high:
+        verdict = (f"No significant difference from the reference {scope} "
+                   f"({ratio:.2f}x, the 95% interval {low:.2f}-{high:.2f}x includes 1).")
+    elif ratio > 1:
+        verdict = f"Your solution is {ratio:.1f}x slower than the reference {scope}."
+    else:
+        verdict = f"Your solution is {1 / ratio:.1f}x faster than the reference {scope}."
+    if disagreements:
+        verdict += f" Its output differs from the reference's on {disagreements} test case(s)."
+    summary["verdict"] = verdict
+    return summary
+
+def input_size(value: Any) -> Optional[int]:
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+def _timed_copy(args, kwargs) -> tuple:
+    """Deep copies of the arguments and the seconds copying them took"""
+    start_time = time.perf_counter()
+    call_args, call_kwargs = copy.deepcopy(args), copy.deepcopy(kwargs)
+    return call_args, call_kwargs, time.perf_counter() - start_time
+
+def _repeat_budget_end(max_time: float) -> float:
+    """perf_counter() time repeated timing calls must finish by: `max_time` from now, and never
+    closer than BENCHMARK_DEADLINE_MARGIN to the running deadline()"""
+    budget = max_time
+    left = time_left()
+    if left is not None:
+        budget = min(budget, left - BENCHMARK_DEADLINE_MARGIN)
+    return time.perf_counter() + budget
+
+def _calibrate(func, args, kwargs, copy_time: float, budget_end: float) -> tuple:
+    """
+    (loops, seconds per call) like timeit's autorange: double the loops until one sample takes
+    BENCHMARK_MIN_SAMPLE_TIME. Every loop needs its own copy of the arguments, made up front, so
+    `copy_time` caps the loops at BENCHMARK_MAX_COPY_TIME worth of copies, and a sample is only
+    taken while it fits before `budget_end`.
+    """
+    max_loops = max(1, min(BENCHMARK_MAX_LOOPS, int(BENCHMARK_MAX_COPY_TIME / max(copy_time, 1e-9))))
+    loops = 1
+    while True:
+        sample = _time_calls(func, args, kwargs, loops)
+        next_loops = min(loops * 2, max_loops)
+        if (sample * loops >= BENCHMARK_MIN_SAMPLE_TIME or next_loops == loops
+                or time.perf_counter() + (sample + copy_time) * next_loops > budget_end):
+            return loops, sample
+        loops = next_loops
+
+def _time_calls(func, args, kwargs, loops: int) -> float:
+    """Average seconds per call over `loops` calls, each on its own copy of the arguments"""
+    copies = [(copy.deepcopy(args), copy.deepcopy(kwargs)) for _ in range(loops)]
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start_time = time.perf_counter()
+        for call_args, call_kwargs in copies:
+            func(*call_args, **call_kwargs)
+        end_time = time.perf_counter()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return (end_time - start_time) / loops
+
+def measure_memory(func, *args) -> Dict[str, Any]:
+    """
+    Call `func` once more on fresh copies of `args` under tracemalloc and report its peak traced
+    memory and the number of blocks it allocated that are still alive when it returns (the
+    return value included). Kept apart from the timed call so tracing doesn't skew execution_time;
+    anything the call prints is dropped so output isn't duplicated.
+    """
+    call_args = copy.deepcopy(args)
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            result = func(*call_args)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+        del result
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    return {"peak_memory_kb": round(max(peak - baseline, 0) / 1024, 2), "allocated_blocks": allocated_blocks}
+
+def preview(value: Any) -> str:
+    """Short repr of a test value; only the shown items are visited, so huge inputs stay cheap"""
+    return _preview_repr.repr(value)
+
+class CaseTimeoutError(Exception):
+    """Raised inside a running test case once its time limit is hit."""
+    pass
+
+# monotonic time the innermost active deadline() fires at
+_deadline_at: Optional[float] = None
+
+def time_left() -> Optional[float]:
+    """Seconds until the innermost active deadline() fires, None when the block isn't limited"""
+    return None if _deadline_at is None else _deadline_at - time.monotonic()
+
+@contextlib.contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    Raise CaseTimeoutError in the running code after `seconds` of wall-clock time.
+    The alarm keeps re-firing until the block exits, so a bare `except` in user code can't swallow it.
+    Nested blocks can only shorten the outer deadline, whose timer and handler are back when they exit.
+    Only available on the main thread of a process with SIGALRM; otherwise the block runs unbounded.
+    """
+    if not seconds or not hasattr(signal, 'setitimer') or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    outer_remaining, outer_interval = signal.getitimer(signal.ITIMER_REAL)
+    outer_first = 0 < outer_remaining < seconds
+    exiting = False
+
+    def _on_alarm(signum, frame):
+        if exiting:
+            return
+        if outer_first and callable(previous_handler):
+            # the enclosing deadline is the one that ran out
+            previous_handler(signum, frame)
+        raise CaseTimeoutError(f"Timed out after {round(seconds, 3)}s")
+
+    global _deadline_at
+    previous_deadline = _deadline_at
+    limit = outer_remaining if outer_first else seconds
+    armed_at = time.monotonic()
+    _deadline_at = armed_at + limit
+    previous_handler = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, limit, 0.05)
+    try:
+        yield
+    finally:
+        # no alarm may raise out of the cleanup: block it, drop one already pending, and let
+        # signal.signal() run any handler call Python still owes while ours is a no-op
+        exiting = True
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+        try:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.sigtimedwait({signal.SIGALRM}, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+            _deadline_at = previous_deadline
+            if outer_remaining > 0:
+                # the outer timer goes on with the time it had left, at once if that has run out
+                left = outer_remaining - (time.monotonic() - armed_at)
+                signal.setitimer(signal.ITIMER_REAL, max(left, 1e-6), outer_interval)
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGALRM})
+
 class Testing:
     def __init__(self):
         self.tests: List[Dict[str, Any]] = []
@@ -24,56 +369,251 @@ class Testing:
         test = {'input': {'nums': input}, 'output': output}
         self.tests.append(test)
 
-    def run_tests(self, function: Callable[[List[Any]], Any]) -> List[Dict[str, Any]]:
-        results = {"results": [], "tests_summary": {}}
-
+    @staticmethod
+    def new_summary() -> Dict[str, Any]:
         # Don't delete the test inputs and test outputs they're for Quick test Feature
-        tests_summary = {"passed": 0,
-                        "failed": 0,
-                        "test_inputs": [],
-                        "test_outputs": []
-                       }
-
-        decorated_function = timer(function)
-        for i, test in enumerate(self.tests):
-            arr = test['input']['nums']
-            expected_output = test['output']
-
-            result = {'test_case': i + 1,
-                      'status': '',
-                      'error': '',
-                      'execution_time' : None,
-                      'test_input' : '',
-                      'test_output' : ''}
-
-            # storing the input , output test_cases ..,
-            result['test_input'] = arr
-            result['test_output']= expected_output
+        return {"passed": 0,
+                "failed": 0,
+                "timed_out": 0,
+                "memory_exceeded": 0,
+                "worst_time": None,
+                "worst_memory": None,
+                "test_inputs": [],
+                "test_outputs": []
+               }
+
+    @staticmethod
+    def update_worst(tests_summary: Dict[str, Any], result: Dict[str, Any]):
+        """Track the slowest and the most memory hungry case in the summary"""
+        worst_time = tests_summary['worst_time']
+        if result['execution_time'] is not None and (worst_time is None or
+                                                      result['execution_time'] > worst_time['execution_time']):
+            tests_summary['worst_time'] = {"test_case": result['test_case'], "execution_time": result['execution_time']}
+
+        worst_memory = tests_summary['worst_memory']
+        if result.get('peak_memory_kb') is not None and (worst_memory is None or
+                                                         result['peak_memory_kb'] > worst_memory['peak_memory_kb']):
+            tests_summary['worst_memory'] = {"test_case": result['test_case'], "peak_memory_kb": result['peak_memory_kb'],
+                                             "allocated_blocks": result['allocated_blocks']}
+
+    @staticmethod
+    def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Drop the full input and expected output from a result. `test_case` N refers to entry N-1
+        of the request's inputString/outputString, short previews stand in for the values.
+        """
+        compact = {key: value for key, value in result.items() if key not in ('test_input', 'test_output')}
+        compact['input_preview'] = preview(result['test_input'])
+        compact['output_preview'] = preview(result['test_output'])
+        if len(result['error']) > ERROR_PREVIEW_CHARS:
+            compact['error'] = result['error'][:ERROR_PREVIEW_CHARS] + f"... [{len(result['error'])} chars]"
+        return compact
+
+    @classmethod
+    def record_result(cls, tests_summary: Dict[str, Any], result: Dict[str, Any]):
+        """Count a finished case in the summary"""
+        if result['status'] == 'Passed':
+            tests_summary['passed'] += 1
+        else:
+            tests_summary['failed'] += 1
+        if result['status'] == 'TimedOut':
+            tests_summary['timed_out'] += 1
+        elif result['status'] == 'MemoryExceeded':
+            tests_summary['memory_exceeded'] += 1
+
+        cls.update_worst(tests_summary, result)
+        tests_summary['test_inputs'].append(result['test_input'])
+        tests_summary['test_outputs'].append(result['test_output'])
+
+    def run_tests(self, function: Callable[[List[Any]], Any], case_timeout: Optional[float] = None,
+                  job_timeout: Optional[float] = None, benchmark: bool = False,
+                  track_memory: bool = False, profiler=None, workers: int = 1,
+                  reference: Optional[Callable[[List[Any]], Any]] = None) -> List[Dict[str, Any]]:
+        results = {"results": [], "tests_summary": self.new_summary()}
+
+        for result in self.iter_tests(function, results['tests_summary'], case_timeout, job_timeout, benchmark,
+                                      track_memory, profiler, workers, reference):
+            results['results'].append(result)
+
+        return results
+
+    def iter_tests(self, function: Callable[[List[Any]], Any], tests_summary: Dict[str, Any],
+                   case_timeout: Optional[float] = None, job_timeout: Optional[float] = None,
+                   benchmark: bool = False, track_memory: bool = False, profiler=None,
+                   workers: int = 1, reference: Optional[Callable[[List[Any]], Any]] = None
+                   ) -> Iterator[Dict[str, Any]]:
+        """
+        Run the tests, yielding each result in test case order and updating `tests_summary` in place.
+        In benchmark mode every result also gets a `timing` dict and `execution_time` is the median.
+        With `track_memory` each case that completes is run once more under tracemalloc to record its
+        peak memory. That pass at least doubles the case's wall time, counts against its deadline and
+        repeats any side effects of the function, so it is off unless asked for.
+        A `profiler` (see profiler.SubmissionProfiler) is switched on around the user's function only.
+        With `workers` > 1 a large suite is split into shards run by that many forked processes;
+        benchmark and profiled runs always stay serial so their timings aren't shared with other cases.
+        With a `reference` function every case is also timed against it (see compare_timer), results
+        get a `comparison` dict and the summary an aggregate one; these runs stay serial too.
+        """
+        job_deadline = time.monotonic() + job_timeout if job_timeout else None
+
+        if (workers > 1 and len(self.tests) >= SHARD_MIN_CASES and not benchmark and profiler is None
+                and reference is None):
+            results = self._iter_sharded(function, job_deadline, case_timeout, track_memory, workers)
+        else:
+            results = self._iter_cases(function, 0, len(self.tests), job_deadline, case_timeout, benchmark,
+                                       track_memory, profiler, reference)
+
+        compared, disagreements = [], 0
+        for result in results:
+            self.record_result(tests_summary, result)
+            comparison = result.get('comparison')
+            if comparison and 'ratio' in comparison:
+                compared.append((comparison['ratio'], input_size(result['test_input'])))
+                disagreements += not comparison['outputs_agree']
+            yield result
+
+        if reference is not None:
+            tests_summary['comparison'] = summarize_comparison(compared, disagreements)
+
+    def _iter_sharded(self, function: Callable[[List[Any]], Any], job_deadline: Optional[float],
+                      case_timeout: Optional[float], track_memory: bool, workers: int) -> Iterator[Dict[str, Any]]:
+        """
+        Fan the cases out over a pool of forked workers. The children inherit the already loaded
+        function, so nothing is pickled or imported again; shards come back in order, which keeps
+        the numbering and lets streaming hand out results as each shard finishes.
+        """
+        global _shard_state
+        shard_size = math.ceil(len(self.tests) / (workers * SHARDS_PER_WORKER))
+        shards = [(start, min(start + shard_size, len(self.tests)), job_deadline, case_timeout, track_memory)
+                  for start in range(0, len(self.tests), shard_size)]
+
+        _shard_state = (self, function)
+        next_case = 0
+        try:
+            with multiprocessing.get_context('fork').Pool(min(workers, len(shards))) as pool:
+                pending = pool.imap(_run_shard, shards)
+                for _, stop, *_ in shards:
+                    wait = max(job_deadline - time.monotonic(), 0) + SHARD_GRACE if job_deadline else None
+                    try:
+                        results, output = pending.next(wait)
+                    except multiprocessing.TimeoutError:
+                        logging.error(f"Shard starting at test case {next_case + 1} missed the job deadline")
+                        break
+                    # the children's prints end up in this job's captured output
+                    sys.stdout.write(output)
+                    yield from results
+                    next_case = stop
+        finally:
+            _shard_state = None
+
+        for i in range(next_case, len(self.tests)):
+            result = self.new_result(i)
+            result['status'] = 'TimedOut'
+            result['error'] = "Skipped: job time limit exceeded"
+            yield result
+
+    def new_result(self, i: int) -> Dict[str, Any]:
+        test = self.tests[i]
+        # storing the input , output test_cases ..,
+        return {'test_case': i + 1,
+                'status': '',
+                'error': '',
+                'execution_time' : None,
+                'peak_memory_kb' : None,
+                'allocated_blocks' : None,
+                'test_input' : test['input']['nums'],
+                'test_output' : test['output']}
+
+    def _iter_cases(self, function: Callable[[List[Any]], Any], start: int, stop: int,
+                    job_deadline: Optional[float], case_timeout: Optional[float], benchmark: bool = False,
+                    track_memory: bool = False, profiler=None,
+                    reference: Optional[Callable[[List[Any]], Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Run tests [start, stop) one by one in this process, yielding each result as soon as it is known"""
+        # the memory pass below calls the plain function, only the timed calls are profiled
+        timed_function = profiler.wrap(function) if profiler is not None else function
+        if reference is not None:
+            decorated_function = compare_timer(timed_function, reference)
+        else:
+            decorated_function = timer(timed_function, benchmark=benchmark)
+        for i in range(start, stop):
+            result = self.new_result(i)
+            arr = result['test_input']
+            expected_output = result['test_output']
+
+            # the case gets whatever is left of the job budget if that is shorter than its own limit
+            time_limit = case_timeout
+            if job_deadline is not None:
+                remaining = job_deadline - time.monotonic()
+                time_limit = min(time_limit, remaining) if time_limit else remaining
 
             try:
-                received_output, execution_time = decorated_function(arr)
+                if time_limit is not None and time_limit <= 0:
+                    raise CaseTimeoutError("Skipped: job time limit exceeded")
+
+                case_started = time.monotonic()
+                # the timed call may mutate its input, the memory pass needs the original
+                pristine_arr = copy.deepcopy(arr) if track_memory else None
+
+                with deadline(time_limit):
+                    if reference is not None:
+                        received_output, execution_time, comparison = decorated_function(arr)
+                    elif benchmark:
+                        received_output, execution_time, result['timing'] = decorated_function(arr)
+                    else:
+                        received_output, execution_time = decorated_function(arr)
 
                 # saving execution time
                 result['execution_time'] = execution_time
 
+                if reference is not None:
+                    if 'timing' in comparison:
+                        result['timing'] = comparison.pop('timing')
+                        comparison['outputs_agree'] = comparison.pop('reference_result') == received_output
+                    result['comparison'] = comparison
+
                 if expected_output == received_output:
                     result['status'] = 'Passed'
-                    tests_summary['passed'] += 1
                 else:
                     result['status'] = 'Failed'
-                    tests_summary['failed'] += 1
                     result['error'] = f"Expected {expected_output}, but got {received_output}"
 
+                if track_memory:
+                    memory_limit = time_limit - (time.monotonic() - case_started) if time_limit else None
+                    try:
+                        if memory_limit is not None and memory_limit <= 0:
+                            raise CaseTimeoutError("no time left to measure memory")
+                        with deadline(memory_limit):
+                            result.update(measure_memory(function, pristine_arr))
+                    except Exception as e:
+                        # the case itself already finished, only its memory figures are missing
+                        logging.info(f"Memory measurement skipped for test case {i + 1}: {str(e)}")
+
+            except CaseTimeoutError as e:
+                result['status'] = 'TimedOut'
+                result['error'] = str(e)
+
+            except MemoryError:
+                result['status'] = 'MemoryExceeded'
+                result['error'] = "Memory limit exceeded"
+
             except Exception as e:
 
                 # Specific error for the failing test case
                 result['status'] = 'Failed'
-                tests_summary['failed'] += 1
                 result['error'] = f"failed with error: {str(e)}"
 
-            results['results'].append(result)
-            tests_summary['test_inputs'].append(arr)
-            tests_summary['test_outputs'].append(expected_output)
+            yield result
 
-        results['tests_summary'] = tests_summary
-        return results
+
+# set in the parent right before the shard pool forks, so the children inherit the loaded function
+_shard_state = None
+
+def _run_shard(shard) -> tuple:
+    """Pool task: run one shard of cases in a forked child, returning its results and printed output"""
+    start, stop, job_deadline, case_timeout, track_memory = shard
+    tester, function = _shard_state
+    captured = io.StringIO()
+    with contextlib.redirect_stdout(captured), contextlib.redirect_stderr(captured):
+        results = list(tester._iter_cases(function, start, stop, job_deadline, case_timeout,
+                                          track_memory=track_memory))
+    return results, captured.getvalue()
@@ -0,0 +1,161 @@
+"""
+The AI scheduler against a stub provider: bounded retries with capped jittered backoff, refusal
+once the wait queue is full, and a circuit breaker that opens, half-opens and closes again.
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_scheduler
+from ai_scheduler import (AIScheduler, AIDeadlineExceededError, AIProviderError, AIQueueFullError,
+                          CircuitBreaker, CircuitOpenError, backoff_delay)
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class StubClient:
+    """Fails with the given HTTP statuses in turn, then answers "ok" (after `release`, if given)"""
+
+    def __init__(self, failures=(), release=None):
+        self.failures = list(failures)
+        self.release = release
+        self.calls = 0
+
+    async def complete(self):
+        self.calls += 1
+        if self.failures:
+            raise ProviderError(self.failures.pop(0))
+        if self.release is not None:
+            await self.release.wait()
+        return "ok"
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Attempts the scheduler backed off after, with the backoff itself skipped"""
+    attempts = []
+
+    def no_delay(attempt):
+        attempts.append(attempt)
+        return 0
+
+    monkeypatch.setattr(ai_scheduler, "backoff_delay", no_delay)
+    return attempts
+
+
+def test_provider_errors_are_retried_until_one_succeeds(delays):
+    client = StubClient(failures=[503, 429])
+    scheduler = AIScheduler(max_attempts=3)
+    assert asyncio.run(scheduler.call(client.complete)) == "ok"
+    assert client.calls == 3
+    assert delays == [1, 2]
+    assert scheduler.stats()["retries"] == 2
+
+
+def test_retries_stop_after_max_attempts(delays):
+    client = StubClient(failures=[500] * 10)
+    scheduler = AIScheduler(max_attempts=3)
+    with pytest.raises(AIProviderError, match="after 3 attempts"):
+        asyncio.run(scheduler.call(client.complete))
+    assert client.calls == 3
+    assert delays == [1, 2]
+
+
+def test_client_errors_are_not_retried(delays):
+    client = StubClient(failures=[400])
+    with pytest.raises(ProviderError):
+        asyncio.run(AIScheduler(max_attempts=3).call(client.complete))
+    assert client.calls == 1
+    assert delays == []
+
+
+def test_backoff_that_would_pass_the_deadline_is_not_waited_out(monkeypatch):
+    monkeypatch.setattr(ai_scheduler, "backoff_delay", lambda attempt: 10)
+    client = StubClient(failures=[503])
+    started = time.monotonic()
+    with pytest.raises(AIDeadlineExceededError):
+        asyncio.run(AIScheduler(max_attempts=3).call(client.complete, time.monotonic() + 1))
+    assert client.calls == 1
+    assert time.monotonic() - started < 1
+
+
+def test_backoff_is_jittered_below_the_doubling_cap():
+    for attempt in range(1, 8):
+        bound = min(8, 0.5 * 2 ** (attempt - 1))
+        samples = [backoff_delay(attempt, base=0.5, cap=8) for _ in range(200)]
+        assert all(0 <= delay <= bound for delay in samples)
+        assert max(samples) > bound / 2
+        assert len(set(samples)) > 1
+
+
+def test_queue_full_is_refused_without_calling_the_provider():
+    async def scenario():
+        release = asyncio.Event()
+        client = StubClient(release=release)
+        scheduler = AIScheduler(max_in_flight=1, queue_depth=1)
+        running = [asyncio.create_task(scheduler.call(client.complete)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        assert scheduler.stats()["in_flight"] == 1 and scheduler.stats()["queued"] == 1
+        with pytest.raises(AIQueueFullError):
+            await scheduler.call(client.complete)
+        release.set()
+        assert await asyncio.gather(*running) == ["ok", "ok"]
+        return client.calls, scheduler.stats()["rejected"]
+
+    assert asyncio.run(scenario()) == (2, 1)
+
+
+def test_breaker_opens_half_opens_and_closes(delays):
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.1)
+    scheduler = AIScheduler(max_attempts=1, breaker=breaker)
+    client = StubClient(failures=[503, 503])
+    for _ in range(2):
+        with pytest.raises(AIProviderError):
+            asyncio.run(scheduler.call(client.complete))
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # open: calls fail fast without reaching the provider
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(scheduler.call(client.complete))
+    assert client.calls == 2
+
+    # after the cooldown a single probe goes through while other calls are still refused
+    time.sleep(0.15)
+
+    async def probe_and_other():
+        release = asyncio.Event()
+        slow = StubClient(release=release)
+        probe = asyncio.create_task(scheduler.call(slow.complete))
+        await asyncio.sleep(0.01)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            await scheduler.call(client.complete)
+        release.set()
+        return await probe
+
+    assert asyncio.run(probe_and_other()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.times_opened == 1
+
+
+def test_failed_probe_opens_the_breaker_again(delays):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.1)
+    scheduler = AIScheduler(max_attempts=1, breaker=breaker)
+    with pytest.raises(AIProviderError):
+        asyncio.run(scheduler.call(StubClient(failures=[503]).complete))
+    time.sleep(0.15)
+    with pytest.raises(AIProviderError):
+        asyncio.run(scheduler.call(StubClient(failures=[503]).complete))
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(scheduler.call(StubClient().complete))
@@ -0,0 +1,106 @@
+"""
+The complexity sweep has to name the right class for functions whose complexity is known, on
+real timings and on synthetic curves with the noise and cache effects real timings have.
+"""
+import bisect
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from complexity import COMPLEXITY_SIZES, estimate_complexity, fit_curve
+
+
+def first(nums):
+    return nums[0] if nums else None
+
+
+def search(nums):
+    return bisect.bisect_left(nums, 0)
+
+
+def halve(nums):
+    n, steps = len(nums), 0
+    while n > 1:
+        n //= 2
+        steps += 1
+    return steps
+
+
+def loop_sum(nums):
+    total = 0
+    for x in nums:
+        total += x
+    return total
+
+
+def merge_sort(nums):
+    if len(nums) <= 1:
+        return nums
+    middle = len(nums) // 2
+    left, right = merge_sort(nums[:middle]), merge_sort(nums[middle:])
+    merged, i, j = [], 0, 0
+    while i < len(left) and j < len(right):
+        if left[i] <= right[j]:
+            merged.append(left[i])
+            i += 1
+        else:
+            merged.append(right[j])
+            j += 1
+    return merged + left[i:] + right[j:]
+
+
+def pairs(nums):
+    count = 0
+    for i in range(len(nums)):
+        for j in range(i):
+            count += 1
+    return count
+
+
+@pytest.mark.parametrize("function, expected", [(first, "O(1)"), (len, "O(1)"), (search, "O(log n)"),
+                                                (halve, "O(log n)"), (loop_sum, "O(n)"),
+                                                (merge_sort, "O(n log n)"), (sorted, "O(n log n)"),
+                                                (pairs, "O(n^2)")])
+def test_known_complexities(function, expected):
+    # bisect needs sorted input; the others are timed on the worst of random and sorted
+    distributions = ["sorted"] if function is search else ["random", "sorted"]
+    report = estimate_complexity(function, 20, time_budget_ms=200, distributions=distributions)
+    assert report["best_fit"] == expected, report["curves"]
+
+
+SIZES = np.array(COMPLEXITY_SIZES, dtype=float)
+
+
+def test_cache_effects_at_large_sizes_dont_make_linear_look_n_log_n():
+    # the cost per item doubles once the input outgrows the caches
+    per_item = np.where(SIZES >= 300_000, 2e-5, 1e-5)
+    times = 2e-4 + per_item * SIZES
+    assert fit_curve(COMPLEXITY_SIZES, list(times))[0] == "O(n)"
+
+
+def test_noisy_constant_time_stays_o1():
+    rng = np.random.default_rng(1)
+    times = 2e-4 * rng.uniform(0.7, 1.3, len(SIZES))
+    assert fit_curve(COMPLEXITY_SIZES, list(times))[0] == "O(1)"
+
+
+def test_log_growth_under_call_overhead_is_not_o1():
+    # a binary search: the overhead is as large as all of the log n work at a million items
+    times = 2e-4 + 1.5e-5 * np.log2(SIZES)
+    assert fit_curve(COMPLEXITY_SIZES, list(times))[0] == "O(log n)"
+
+
+def test_noise_doesnt_promote_linear_to_n_log_n():
+    rng = np.random.default_rng(2)
+    for _ in range(20):
+        times = 1e-5 * SIZES * rng.uniform(0.85, 1.15, len(SIZES))
+        assert fit_curve(COMPLEXITY_SIZES, list(times))[0] == "O(n)"
+
+
+def test_n_log_n_is_kept():
+    times = 1e-5 * SIZES * np.log2(SIZES)
+    assert fit_curve(COMPLEXITY_SIZES, list(times))[0] == "O(n log n)"
@@ -0,0 +1,122 @@
+"""
+Instrumented code has to run as before while logging its calls, assignments and loops within
+budget, and user classes whose repr is itself code must not log from inside log lines.
+"""
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["RUNNER_POOL_SIZE"] = "1"
+
+from debug_logs import add_debug_logs
+
+
+def run(source, call, **settings):
+    """(return value, DEBUG lines) of `call` evaluated in the instrumented source"""
+    namespace = {}
+    exec(compile(add_debug_logs(source, **settings), "<instrumented>", "exec"), namespace)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = eval(call, namespace)
+    return result, [line for line in output.getvalue().splitlines() if line.startswith("DEBUG")]
+
+
+def test_loops_log_their_first_iterations_only():
+    source = (
+        "def total(nums):\n"
+        "    s = 0\n"
+        "    for x in nums:\n"
+        "        s += x\n"
+        "    return s\n"
+    )
+    result, lines = run(source, "total(list(range(10)))", loop_budget=3)
+    assert result == 45
+    assert [line for line in lines if "total: s = " in line] == [
+        "DEBUG   total: s = 0", "DEBUG   total: s = 0", "DEBUG   total: s = 1", "DEBUG   total: s = 3"]
+    assert any("logged 3 iterations, later ones are not logged" in line for line in lines)
+    assert lines[-1] == "DEBUG <- total returned 45"
+
+
+def test_recursion_is_indented_by_depth():
+    source = (
+        "def fact(n):\n"
+        "    if n <= 1:\n"
+        "        return 1\n"
+        "    return n * fact(n - 1)\n"
+    )
+    result, lines = run(source, "fact(3)", verbosity="minimal")
+    assert result == 6
+    assert lines == [
+        "DEBUG -> fact(n=3)",
+        "DEBUG   -> fact(n=2)",
+        "DEBUG     -> fact(n=1)",
+        "DEBUG     <- fact returned 1",
+        "DEBUG   <- fact returned 2",
+        "DEBUG <- fact returned 6",
+    ]
+
+
+def test_line_budget_caps_each_top_level_call():
+    source = (
+        "def count(n):\n"
+        "    if n == 0:\n"
+        "        return 0\n"
+        "    return 1 + count(n - 1)\n"
+    )
+    result, lines = run(source, "count(50)", max_lines=10)
+    assert result == 50
+    assert len(lines) == 11
+    assert lines[-1] == "DEBUG ... log limit of 10 lines reached for this call"
+
+    # the next top-level call starts with a fresh budget
+    _, lines = run(source, "[count(1), count(1)]", max_lines=10)
+    assert lines.count("DEBUG -> count(n=1)") == 2
+
+
+def test_class_with_custom_repr_logs_no_repr_calls():
+    source = (
+        "class Node:\n"
+        "    def __init__(self, val, next=None):\n"
+        "        self.val = val\n"
+        "        self.next = next\n"
+        "    def values(self):\n"
+        "        return [self.val] + (self.next.values() if self.next else [])\n"
+        "    def __repr__(self):\n"
+        "        return 'Node' + repr(self.values())\n"
+        "\n"
+        "def build(nums):\n"
+        "    head = None\n"
+        "    for x in reversed(nums):\n"
+        "        head = Node(x, head)\n"
+        "    return head\n"
+    )
+    result, lines = run(source, "build([1, 2, 3])")
+    assert repr(result) == "Node[1, 2, 3]"
+    assert not any("__repr__" in line or "raised" in line for line in lines)
+    # a method's own object is shown by type, other values through their repr
+    assert "DEBUG   -> Node.__init__(self=<Node>, val=3, next=None)" in lines
+    assert "DEBUG <- build returned Node[1, 2, 3]" in lines
+    # values() is only logged where the code calls it, not from inside repr()
+    assert not any("Node.values" in line for line in lines)
+
+
+def test_code_that_already_has_debug_logs_is_rejected():
+    with pytest.raises(ValueError):
+        add_debug_logs(add_debug_logs("def f(x):\n    return x\n"))
+
+
+def test_ai_mode_answers_503_when_the_provider_gives_nothing(monkeypatch):
+    import ai_test_case_generator
+    from app import app
+
+    async def no_response(prompt, deadline=None):
+        return None
+
+    monkeypatch.setattr(ai_test_case_generator, "query_ai_async", no_response)
+    response = app.test_client().post('/add_debug_logs', json={"code": "def f(x):\n    return x\n", "mode": "ai"})
+    assert response.status_code == 503
+    assert "unavailable" in response.json['err']
@@ -0,0 +1,39 @@
+"""
+Counterexamples come back minimal: inputs that raise and, with a reference, wrong answers are shrunk.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from edge_cases import generate_edge_cases, shrink_wrong_answer
+
+SOURCE = '''def largest(nums):
+    return max(nums[:-1]) if len(nums) > 1 else nums[0]
+'''
+
+
+def largest(nums):
+    return max(nums[:-1]) if len(nums) > 1 else nums[0]
+
+
+def reference(nums):
+    return max(nums)
+
+
+def test_wrong_answer_input_gets_smaller():
+    value = [5, 3, 8, 1, 9, 2, 7, 4, 12]
+    minimal, (expected, output, error), calls = shrink_wrong_answer(largest, reference, value, (12, 9, "wrong"), 0.5)
+    assert len(minimal) == 2
+    assert minimal[1] > minimal[0]
+    assert (expected, output) == (reference(minimal), largest(minimal))
+    assert calls > 0
+
+
+def test_reported_wrong_answers_are_shrunk():
+    report = generate_edge_cases(largest, SOURCE, "largest", 5, reference=reference)
+    wrong_answers = [failure for failure in report["failures"] if failure["error"].startswith("WrongAnswer")]
+    assert wrong_answers
+    for failure in wrong_answers:
+        assert len(failure["input"]) == 2
+        assert failure["expected_output"] == max(failure["input"]) != failure["output"]
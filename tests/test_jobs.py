@@ -0,0 +1,51 @@
+"""
+Job lanes keep slow AI jobs from starving test runs, and a long-poll only waits a finite, capped time.
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["RUNNER_POOL_SIZE"] = "1"
+
+import app as app_module
+from jobs import JobQueue, JobQueueFullError, JobStore
+
+
+@pytest.fixture
+def job_queue():
+    job_queue = JobQueue(lanes={"runner": (1, 1), "ai": (1, 1)}, store=JobStore(60, 100))
+    started, release = threading.Event(), threading.Event()
+
+    def slow_ai_job(params):
+        started.set()
+        release.wait(5)
+        return {"ok": True}, 200
+
+    job_queue.register("ai", slow_ai_job, "ai")
+    job_queue.register("runner", lambda params: ({"ok": True}, 200), "runner")
+    yield job_queue, started
+    release.set()
+    job_queue.close()
+
+
+def test_full_ai_lane_doesnt_block_runner_jobs(job_queue):
+    job_queue, started = job_queue
+    job_queue.submit("ai", {})
+    assert started.wait(5)
+    job_queue.submit("ai", {})
+    with pytest.raises(JobQueueFullError):
+        job_queue.submit("ai", {})
+
+    job = job_queue.submit("runner", {})
+    assert job.done.wait(5)
+    assert job.result == {"ok": True}
+    assert job_queue.stats()["lanes"]["ai"]["queued"] == 1
+
+
+@pytest.mark.parametrize("wait", ["nan", "inf", "-inf", "soon"])
+def test_wait_must_be_a_finite_number(wait):
+    response = app_module.app.test_client().get(f"/jobs/unknown?wait={wait}")
+    assert response.status_code == 400
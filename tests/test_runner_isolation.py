@@ -0,0 +1,52 @@
+"""
+Submissions share runner processes, so nothing one of them changes may be visible to the next:
+a submission that patches builtins must not change another user's grade.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# a single runner, so both submissions are guaranteed to land on the same one
+os.environ["RUNNER_POOL_SIZE"] = "1"
+
+PATCHING_CODE = (
+    "import builtins\n"
+    "builtins.sorted = lambda x: [42]\n"
+    "def solve(nums):\n"
+    "    return nums\n"
+)
+CLEAN_CODE = (
+    "def solve(nums):\n"
+    "    return sorted(nums)\n"
+)
+
+
+@pytest.fixture(scope="module")
+def client():
+    from app import app
+    from runner_pool import get_runner_pool
+    yield app.test_client()
+    get_runner_pool().close()
+
+
+def test_builtins_patch_does_not_leak_into_the_next_job(client):
+    response = client.post('/runtests', json={"code": PATCHING_CODE, "inputString": "[[1]]",
+                                              "outputString": "[[1]]"})
+    assert response.status_code == 200
+
+    response = client.post('/runtests', json={"code": CLEAN_CODE, "inputString": "[[3, 2, 1]]",
+                                              "outputString": "[[1, 2, 3]]"})
+    assert response.status_code == 200
+    assert response.json['tests_summary']['passed'] == 1, response.json['results']
+
+
+def test_builtins_patch_does_not_leak_into_batch_peers(client):
+    submissions = [{"code": CLEAN_CODE}, {"code": PATCHING_CODE}, {"code": CLEAN_CODE}, {"code": CLEAN_CODE}]
+    response = client.post('/runtests/batch', json={"submissions": submissions, "inputString": "[[3, 2, 1]]",
+                                                    "outputString": "[[1, 2, 3]]"})
+    assert response.status_code == 200
+    results = response.json['results']
+    for index in (0, 2, 3):
+        assert results[index]['tests_summary']['passed'] == 1, results[index]
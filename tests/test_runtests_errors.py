@@ -0,0 +1,45 @@
+"""
+Runs that fail before the runner answers must not come back as an empty 200: a full pool is 503,
+a runner past its deadline 504 and code without a function 400.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["RUNNER_POOL_SIZE"] = "1"
+
+import app as app_module
+from runner_pool import RunnerPoolFullError, RunnerTimeoutError
+
+
+class FailingPool:
+    size = 1
+
+    def __init__(self, error):
+        self.error = error
+
+    def run(self, *args, **kwargs):
+        raise self.error
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize("error, status", [(RunnerPoolFullError("every runner is busy"), 503),
+                                           (RunnerTimeoutError("job deadline exceeded"), 504)])
+def test_runner_errors_get_their_status(client, monkeypatch, error, status):
+    monkeypatch.setattr(app_module, "get_runner_pool", lambda: FailingPool(error))
+    response = client.post('/runtests', json={"code": f"def solve(nums):\n    return {status}\n",
+                                              "inputString": "[[1]]", "outputString": "[1]"})
+    assert response.status_code == status
+    assert "Test runner failed" in response.json['error']
+
+
+def test_code_without_a_function_is_a_bad_request(client):
+    response = client.post('/runtests', json={"code": "x = 1\n", "inputString": "[[1]]", "outputString": "[1]"})
+    assert response.status_code == 400
+    assert 'results' not in response.json
@@ -0,0 +1,100 @@
+"""
+The streamed test case parser has to give the same cases however the reply is chunked, skip
+prose, code fences and objects that don't parse, and keep what arrived from a reply cut short.
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_test_case_generator
+from ai_test_case_generator import stream_test_cases_async
+
+REPLY = (
+    'Here are [12] cases for your function:\n'
+    '```json\n'
+    '[\n'
+    '    {"input": [1, 2, 3], "expected_output": 6},\n'
+    '    {"input": "a}\\"[b{", "expected_output": "]"},\n'
+    '    {"input": {"k": [[], {}]}, "expected_output": null},\n'
+    '    {"input": [4, 5,], "expected_output": ValueError},\n'
+    ']\n'
+    '```\n'
+    'And another list you should ignore: [{"input": 0, "expected_output": 0}]'
+)
+CASES = [
+    {"input": [1, 2, 3], "expected_output": 6},
+    {"input": 'a}"[b{', "expected_output": "]"},
+    {"input": {"k": [[], {}]}, "expected_output": None},
+    {"input": [4, 5], "expected_output": "ValueError"},
+]
+
+
+def parse(chunks):
+    parser = ai_test_case_generator.TestCaseStreamParser()
+    cases = [case for chunk in chunks for case in parser.feed(chunk)]
+    return cases, parser
+
+
+def test_whole_reply():
+    cases, parser = parse([REPLY])
+    assert cases == CASES
+    assert parser.done and parser.invalid == 0
+
+
+def test_every_split_point_gives_the_same_cases():
+    # two chunks split anywhere, including inside strings, escapes and nested brackets
+    for split in range(len(REPLY) + 1):
+        assert parse([REPLY[:split], REPLY[split:]])[0] == CASES, split
+    assert parse(list(REPLY))[0] == CASES
+
+
+def test_malformed_object_is_skipped_and_counted():
+    reply = '[{"input": [1], "expected_output": 1}, {"input": oops, "expected_output": 2}, {"input": [3], "expected_output": 3}]'
+    cases, parser = parse([reply[:40], reply[40:70], reply[70:]])
+    assert cases == [{"input": [1], "expected_output": 1}, {"input": [3], "expected_output": 3}]
+    assert parser.invalid == 1 and parser.done
+
+
+def test_partial_trailing_object_is_held_back():
+    cases, parser = parse(['```json\n[{"input": [1], "expected_output": 1}, {"input": [2, ', '3], "expected_'])
+    assert cases == [{"input": [1], "expected_output": 1}]
+    assert not parser.done and parser.invalid == 0
+
+
+def test_reply_without_a_list_gives_nothing():
+    cases, parser = parse(["I can't generate cases for this [function].", " Sorry!"])
+    assert cases == [] and not parser.done
+
+
+def stream_reply(monkeypatch, chunks, error=None):
+    """stream_test_cases_async on a provider that sends `chunks`, then raises `error` if given"""
+    async def fake_stream(client, model, prompt, on_text):
+        for chunk in chunks:
+            on_text(chunk)
+        if error is not None:
+            raise error
+
+    monkeypatch.setattr(ai_test_case_generator, "_stream", fake_stream)
+    received = []
+    cases, problem = asyncio.run(stream_test_cases_async("def f(x):\n    return x\n", None, "model", received.append))
+    assert received == cases
+    return cases, problem
+
+
+def test_stream_passes_cases_on_as_they_complete(monkeypatch):
+    cases, problem = stream_reply(monkeypatch, [REPLY[:60], REPLY[60:150], REPLY[150:]])
+    assert cases == CASES and problem is None
+
+
+def test_stream_cut_off_mid_object_keeps_the_complete_cases(monkeypatch):
+    cases, problem = stream_reply(monkeypatch, [REPLY[:120]], ConnectionError("connection reset"))
+    assert cases == CASES[:1]
+    assert problem == "connection reset"
+
+
+def test_stream_ending_before_the_list_closes_says_so(monkeypatch):
+    cases, problem = stream_reply(monkeypatch, [REPLY[:120]])
+    assert cases == CASES[:1]
+    assert "before the test case list was closed" in problem
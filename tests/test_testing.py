@@ -0,0 +1,87 @@
+"""
+The case harness: the memory pass only runs when asked for, since it calls the function again,
+and deadlines nest and clean up without an alarm escaping.
+"""
+import os
+import signal
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import testing
+
+
+def counting(calls):
+    def solve(nums):
+        calls.append(list(nums))
+        return sorted(nums)
+    return solve
+
+
+def test_memory_pass_is_off_by_default():
+    calls = []
+    tester = testing.Testing()
+    tester.create_testcase([3, 1, 2], [1, 2, 3])
+    result = tester.run_tests(counting(calls))['results'][0]
+    assert result['status'] == 'Passed'
+    assert result['peak_memory_kb'] is None
+    assert len(calls) == 1
+
+
+def test_memory_pass_calls_the_function_again():
+    calls = []
+    tester = testing.Testing()
+    tester.create_testcase([3, 1, 2], [1, 2, 3])
+    result = tester.run_tests(counting(calls), track_memory=True)['results'][0]
+    assert result['peak_memory_kb'] is not None
+    assert calls == [[3, 1, 2], [3, 1, 2]]
+
+
+def spin(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def test_nested_deadline_leaves_the_outer_one_running():
+    started = time.monotonic()
+    with pytest.raises(testing.CaseTimeoutError, match="0.2s"):
+        with testing.deadline(0.2):
+            with testing.deadline(5):
+                pass
+            spin(2)
+    assert time.monotonic() - started < 1
+    assert signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)
+    assert signal.getsignal(signal.SIGALRM) is signal.SIG_DFL
+
+
+def test_outer_deadline_fires_inside_a_longer_inner_one():
+    with pytest.raises(testing.CaseTimeoutError, match="0.1s"):
+        with testing.deadline(0.1):
+            with testing.deadline(5):
+                spin(2)
+
+
+def test_inner_deadline_fires_first_and_the_outer_one_keeps_its_time():
+    with testing.deadline(5):
+        with pytest.raises(testing.CaseTimeoutError, match="0.05s"):
+            with testing.deadline(0.05):
+                spin(2)
+        assert 4 < testing.time_left() <= 5
+        assert 4 < signal.getitimer(signal.ITIMER_REAL)[0] <= 5
+    assert signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)
+
+
+def test_alarms_at_exit_never_raise_out_of_the_cleanup():
+    # every block ends right around its deadline, so some alarms land while it is being torn down
+    for _ in range(200):
+        try:
+            with testing.deadline(0.001):
+                spin(0.001)
+        except testing.CaseTimeoutError:
+            pass
+        assert signal.getsignal(signal.SIGALRM) is signal.SIG_DFL
+    spin(0.1)
@@ -1,4 +1,7 @@
 import re
+import logging
+from utils import Truncated
+from code_cache import try_compile_user_code
 
 class FunctionNameNotFoundError(Exception):
     pass
@@ -29,12 +32,12 @@ def handleEdgecases(input_list, output_list):
             if (isNestedArray(output_list)):
                 for item in output_list:
                     output_arr.append(item)
-                print(f'the input arr: {input_arr}\noutput_arr : {output_arr}')
+                logging.debug('the input arr: %s\noutput_arr : %s', Truncated(input_arr), Truncated(output_arr))
 
             # for single array outputs
             else:
                 output_arr.extend(output_list)
-                print(f'the input arr: {input_arr}\noutput_arr : {output_arr}')
+                logging.debug('the input arr: %s\noutput_arr : %s', Truncated(input_arr), Truncated(output_arr))
 
 
 
@@ -47,20 +50,30 @@ def handleEdgecases(input_list, output_list):
             if (len(output_list) == 1):
 
                 output_arr.append(output_list[0])
-                print(f'the input arr: {input_arr}\noutput_arr : {output_arr}')
+                logging.debug('the input arr: %s\noutput_arr : %s', Truncated(input_arr), Truncated(output_arr))
 
             # for array outputs -> [1,2,3]
             else:
 
                 output_arr.append(output_list)
-                print(f'the input arr: {input_arr}\noutput_arr : {output_arr}')
+                logging.debug('the input arr: %s\noutput_arr : %s', Truncated(input_arr), Truncated(output_arr))
 
-    print(f'is equal : {len(input_arr) == len(output_arr)}')
+    logging.debug('is equal : %s', len(input_arr) == len(output_arr))
 
     return input_arr, output_arr
 
 
 def extract_function_name(user_code):
+    """
+    Name of the function to test, taken from the compiled submission's AST (cached by source).
+    Code that doesn't compile falls back to the first `def`, so the runner can report the error.
+    """
+    compiled = try_compile_user_code(user_code)
+    if compiled is not None:
+        if compiled.entry_point is None:
+            raise FunctionNameNotFoundError("Function name not found in the provided code.")
+        return compiled.entry_point
+
     try:
         match = re.search(r'def\s+(\w+)\s*\(', user_code)
         if match:
@@ -68,10 +81,10 @@ def extract_function_name(user_code):
         else:
             raise FunctionNameNotFoundError("Function name not found in the provided code.")
     except re.error as e:
-        print(f"Regex error: {e}")
+        logging.error(f"Regex error: {e}")
         raise
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        logging.error(f"Unexpected error: {e}")
         raise
 
-    return function_name
\ No newline at end of file
+    return function_name
@@ -1,5 +1,27 @@
+import os
+import sys
+import queue
+import atexit
 import logging
+import logging.handlers
+import reprlib
+import threading
 import importlib
+from typing import Any, Optional
+
+# Logging settings (overridable through the environment)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", 500))  # longest payload rendered into a log line
+
+_log_repr = reprlib.Repr()
+_log_repr.maxlevel = 3
+_log_repr.maxlist = _log_repr.maxtuple = _log_repr.maxdict = _log_repr.maxset = 20
+_log_repr.maxstring = _log_repr.maxother = _log_repr.maxlong = LOG_MAX_CHARS
+
+_log_configured = False
+_log_listener: Optional[logging.handlers.QueueListener] = None
+_log_lock = threading.Lock()
 
 def validate_user_code(code_file: str):
     try:
@@ -19,4 +41,69 @@ def validate_user_code(code_file: str):
         logging.error("Internal Server Error while importing user code", exc_info=True)
         raise Exception("Internal Server Error: Could not process the request.") from e
 
-    return False  # Return False if an exception was caught
\ No newline at end of file
+    return False  # Return False if an exception was caught
+
+
+class Truncated:
+    """
+    Log argument for payloads of any size: pass it as a %-style argument and it is only
+    rendered when the record is actually emitted, as a repr capped at `limit` characters.
+    Only the items that end up in the line are visited, so huge inputs cost next to nothing.
+    """
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value: Any, limit: int = LOG_MAX_CHARS):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else _log_repr.repr(self.value)
+        if len(text) > self.limit:
+            return f"{text[:self.limit]}... [{len(text)} chars]"
+        return text
+
+    __repr__ = __str__
+
+
+def _stream_handler() -> logging.Handler:
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+def configure_logging():
+    """
+    Set up the root logger once per process. Records are put on a queue by the logging thread
+    and written to stderr by a background listener, so request threads never wait on the stream.
+    """
+    global _log_configured, _log_listener
+    with _log_lock:
+        if _log_configured:
+            return
+        _log_configured = True
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        log_queue = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        _log_listener = logging.handlers.QueueListener(log_queue, _stream_handler(), respect_handler_level=True)
+        _log_listener.start()
+        # flush whatever is still queued on a normal exit
+        atexit.register(_stop_log_listener)
+
+def _stop_log_listener():
+    if _log_listener is not None:
+        _log_listener.stop()
+
+def _log_directly_after_fork():
+    # the listener thread doesn't exist in a forked child (e.g. test shards), so write straight to stderr there
+    global _log_listener
+    if _log_listener is None:
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(_stream_handler())
+    _log_listener = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_log_directly_after_fork)
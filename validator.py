@@ -1,5 +1,6 @@
 import json
 import logging
+from utils import Truncated
 
 class ValidationException(Exception):
     pass
@@ -12,12 +13,33 @@ def validate_and_process_input_output(input_str, output_str):
         if not isinstance(input_list, list) or not isinstance(output_list, list):
             raise ValidationException("Both input and output should be lists of cases.")
 
-        logging.info(f"Validation successful: input_list={input_list}, output_list={output_list}")
+        logging.info("Validation successful: input_list=%s, output_list=%s", Truncated(input_list),
+                     Truncated(output_list))
         return input_list, output_list
 
     except json.JSONDecodeError as e:
         logging.error(f"Error in JSON parsing: {str(e)}")
         raise ValidationException("Error in parsing JSON input or output strings.")
+    except (MemoryError, ValidationException):
+        raise
     except Exception as e:
         logging.error(f"Unexpected error: {str(e)}")
         raise ValidationException(str(e))
+
+def check_input_output(input_str, output_str):
+    """
+    Cheap check for the web process: both values must be strings holding a JSON list. Only the
+    ends are looked at, the runner does the full parse with validate_and_process_input_output,
+    so large test data is never decoded (or copied) in the app.
+    """
+    for value in (input_str, output_str):
+        if not isinstance(value, str) or not _looks_like_json_list(value):
+            raise ValidationException("Both input and output should be lists of cases.")
+
+def _looks_like_json_list(text):
+    start, end = 0, len(text) - 1
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end].isspace():
+        end -= 1
+    return start < end and text[start] == '[' and text[end] == ']'